@@ -0,0 +1,378 @@
+"""
+Badge progress, computed in bulk and kept up to date as users act.
+
+Each badge requirement type reads one per-user metric (publications
+written, likes and favorites they received, replies, followers, forums
+posted in, profile fields filled). collect_metrics() computes the metrics
+for all users, or a given set of them, with one GROUP BY query per metric
+instead of counting per user and badge. recompute_badges() turns the
+metrics into progress and diffs it against the stored UserBadge rows,
+writing only what changed with bulk_create() and bulk_update().
+
+Between recomputes the metrics are kept in UserMetrics, one row per user.
+The receivers in accounts.models adjust a counter when the event it counts
+happens (bump_metric(), set_metric()) and re-check only the badges reading
+that metric (evaluate_badges()), notifying users of the badges they earn.
+Rows are never created from receivers, which also run while a user is
+being deleted; user_metrics() counts a missing row from scratch and
+rebuild_user_metrics() (update_badges) repairs them all.
+"""
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+# Metric read by each Badge.requirement_type
+REQUIREMENT_METRICS = {
+    'publications_count': 'publications',
+    'publication_likes': 'publication_likes',
+    'publication_favorites': 'publication_favorites',
+    'forum_replies': 'replies',
+    'followers_count': 'followers',
+    'profile_completion': 'profile_fields',
+    'forums_diversity': 'forums',
+}
+
+# Profile fields counted by profile_completion, whatever the badge's requirement_count
+PROFILE_FIELDS = ('institution', 'field_of_study', 'bio', 'website')
+
+
+def _grouped(queryset, key, value):
+    """{key: value} of a values(key).annotate(value=...) queryset."""
+    return dict(queryset.values_list(key, value))
+
+
+def _filter_users(queryset, field, user_ids):
+    return queryset if user_ids is None else queryset.filter(**{f'{field}__in': user_ids})
+
+
+def _publications(user_ids, apps):
+    Publication = apps.get_model('publications', 'Publication')
+    queryset = _filter_users(Publication.objects.order_by(), 'author', user_ids)
+    return _grouped(queryset.values('author').annotate(total=Count('pk')), 'author', 'total')
+
+
+def _publication_likes(user_ids, apps):
+    Publication = apps.get_model('publications', 'Publication')
+    # The denormalized like_count, see config.reactions
+    queryset = _filter_users(Publication.objects.order_by(), 'author', user_ids)
+    return _grouped(queryset.values('author').annotate(total=Sum('like_count')), 'author', 'total')
+
+
+def _publication_favorites(user_ids, apps):
+    Favorite = apps.get_model('publications', 'Favorite')
+    queryset = _filter_users(Favorite.objects.order_by(), 'publication__author', user_ids)
+    return _grouped(
+        queryset.values('publication__author').annotate(total=Count('pk')), 'publication__author', 'total'
+    )
+
+
+def _replies(user_ids, apps):
+    Reply = apps.get_model('discussions', 'Reply')
+    queryset = _filter_users(Reply.objects.order_by(), 'author', user_ids)
+    return _grouped(queryset.values('author').annotate(total=Count('pk')), 'author', 'total')
+
+
+def _followers(user_ids, apps):
+    Follow = apps.get_model('accounts', 'Follow')
+    queryset = _filter_users(Follow.objects.order_by(), 'following__user', user_ids)
+    return _grouped(queryset.values('following__user').annotate(total=Count('pk')), 'following__user', 'total')
+
+
+def _profile_fields(user_ids, apps):
+    Profile = apps.get_model('accounts', 'Profile')
+    filled = sum(
+        (Case(When(~Q(**{field: ''}), then=Value(1)), default=Value(0), output_field=IntegerField())
+         for field in PROFILE_FIELDS),
+        Value(0),
+    )
+    queryset = _filter_users(Profile.objects.order_by(), 'user', user_ids)
+    return dict(queryset.annotate(filled=filled).values_list('user_id', 'filled'))
+
+
+def _forums(user_ids, apps):
+    Topic = apps.get_model('discussions', 'Topic')
+    Reply = apps.get_model('discussions', 'Reply')
+    # Distinct (author, forum) pairs of topics and of replies, at most users x forums rows
+    pairs = set(
+        _filter_users(Topic.objects.order_by(), 'author', user_ids).values_list('author', 'forum').distinct()
+    )
+    pairs.update(
+        _filter_users(Reply.objects.order_by(), 'author', user_ids).values_list('author', 'topic__forum').distinct()
+    )
+    forums = {}
+    for user_id, _ in pairs:
+        forums[user_id] = forums.get(user_id, 0) + 1
+    return forums
+
+
+METRIC_QUERIES = {
+    'publications': _publications,
+    'publication_likes': _publication_likes,
+    'publication_favorites': _publication_favorites,
+    'replies': _replies,
+    'followers': _followers,
+    'profile_fields': _profile_fields,
+    'forums': _forums,
+}
+
+
+def collect_metrics(metrics=None, user_ids=None, apps=global_apps):
+    """
+    Return {metric: {user_id: value}} for the given metric names (all by
+    default) and users (all by default). Users missing from a metric have 0.
+
+    apps is the registry the models are taken from, a migration's for backfills.
+    """
+    metrics = METRIC_QUERIES if metrics is None else metrics
+    return {metric: METRIC_QUERIES[metric](user_ids, apps) for metric in metrics}
+
+
+def badge_target(badge, forum_count):
+    """The metric value at which a badge is earned."""
+    if badge.requirement_type == 'profile_completion':
+        return len(PROFILE_FIELDS)
+    if badge.requirement_type == 'forums_diversity':
+        return forum_count
+    return badge.requirement_count
+
+
+def badge_progress(badge, value, forum_count):
+    """Progress (0-100) toward a badge of a user whose metric is value."""
+    target = badge_target(badge, forum_count)
+    if target <= 0:
+        return 0
+    return min(100, int((value or 0) / target * 100))
+
+
+# "Need N more ..." of each requirement type, for badges not earned yet
+REMAINING_TEXT = {
+    'publications_count': 'Need {} more publications',
+    'publication_likes': 'Need {} more likes',
+    'publication_favorites': 'Need {} more favorites',
+    'forum_replies': 'Need {} more replies',
+    'followers_count': 'Need {} more followers',
+    'profile_completion': 'Complete your profile',
+    'forums_diversity': 'Participate in {} more forums',
+}
+
+
+def badge_remaining(badge, value, forum_count):
+    """What a user whose metric is value still has to do to earn a badge."""
+    if badge_progress(badge, value, forum_count) >= 100:
+        return 'Badge earned!'
+    text = REMAINING_TEXT.get(badge.requirement_type, 'Keep going!')
+    return text.format(max(badge_target(badge, forum_count) - (value or 0), 0))
+
+
+def recompute_badges(user_ids=None, badges=None, batch_size=1000, create=True):
+    """
+    Recompute the progress of users (all by default) toward badges (all by
+    default) and store what changed.
+
+    Rows are only created once a user has some progress, and only if create
+    is set (see evaluate_badges()); a badge reaching 100 gets its
+    earned_date set and its user notified, and stays earned if the metric
+    drops afterwards. Returns (created, updated, earned) counts.
+    """
+    from discussions.models import Forum
+    from .models import Badge, UserBadge
+
+    badges = list(Badge.objects.all() if badges is None else badges)
+    metrics = collect_metrics(
+        {REQUIREMENT_METRICS[badge.requirement_type] for badge in badges
+         if badge.requirement_type in REQUIREMENT_METRICS},
+        user_ids,
+    )
+    forum_count = Forum.objects.count() if any(b.requirement_type == 'forums_diversity' for b in badges) else 0
+
+    existing = UserBadge.objects.filter(badge__in=badges)
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    stored = {}
+    for row in existing.only('pk', 'user_id', 'badge_id', 'progress', 'earned_date'):
+        stored.setdefault(row.badge_id, {})[row.user_id] = row
+
+    now = timezone.now()
+    to_create, to_update, earned = [], [], []
+    for badge in badges:
+        values = metrics.get(REQUIREMENT_METRICS.get(badge.requirement_type), {})
+        rows = stored.get(badge.pk, {})
+        # Users with a stored row may have dropped to 0, the others only matter if they progressed
+        for user_id in set(values) | set(rows):
+            progress = badge_progress(badge, values.get(user_id, 0), forum_count)
+            row = rows.get(user_id)
+            if row is None:
+                if progress and create:
+                    to_create.append(UserBadge(user_id=user_id, badge=badge, progress=progress, earned_date=now))
+                    if progress == 100:
+                        earned.append((user_id, badge))
+            elif row.progress != progress and row.progress < 100:
+                if progress == 100:
+                    row.earned_date = now
+                    earned.append((user_id, badge))
+                row.progress = progress
+                to_update.append(row)
+
+    UserBadge.objects.bulk_create(to_create, batch_size=batch_size)
+    UserBadge.objects.bulk_update(to_update, ['progress', 'earned_date'], batch_size=batch_size)
+    _notify_earned(earned)
+    return len(to_create), len(to_update), len(earned)
+
+
+def _notify_earned(pairs):
+    """Notify users of the badges they earned, pairs being (user_id, badge)."""
+    from django.contrib.contenttypes.models import ContentType
+    from notifications.models import Notification
+    from .models import Badge
+
+    if not pairs:
+        return
+    content_type = ContentType.objects.get_for_model(Badge)
+    Notification.objects.bulk_create([
+        Notification(
+            recipient_id=user_id, sender_id=user_id, notification_type=Notification.BADGE,
+            content_type=content_type, object_id=badge.pk,
+        )
+        for user_id, badge in pairs
+    ])
+
+
+def rebuild_user_metrics(batch_size=1000, apps=global_apps):
+    """Recount the UserMetrics row of every user; returns the number of rows written."""
+    User = apps.get_model('auth', 'User')
+    UserMetrics = apps.get_model('accounts', 'UserMetrics')
+
+    metrics = collect_metrics(apps=apps)
+    written = 0
+    with transaction.atomic():
+        UserMetrics.objects.all().delete()
+        rows = []
+        for user_id in User.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size):
+            rows.append(UserMetrics(user_id=user_id, **{metric: values.get(user_id, 0) for metric, values in metrics.items()}))
+            if len(rows) >= batch_size:
+                written += len(UserMetrics.objects.bulk_create(rows))
+                rows = []
+        written += len(UserMetrics.objects.bulk_create(rows))
+    return written
+
+
+def recount_metrics(user_ids, metrics=None, create=True):
+    """
+    Recount metrics (all by default) of some users from scratch, for writes
+    that send no signal or too many (bulk imports, cascades), and re-check
+    the badges reading them. Only existing UserMetrics rows are updated.
+    """
+    from .models import Badge, UserMetrics
+
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    counts = collect_metrics(metrics, user_ids)
+    rows = list(UserMetrics.objects.filter(user_id__in=user_ids))
+    for row in rows:
+        for metric, values in counts.items():
+            setattr(row, metric, values.get(row.user_id, 0))
+    UserMetrics.objects.bulk_update(rows, list(counts))
+
+    types = [requirement_type for requirement_type, metric in REQUIREMENT_METRICS.items() if metric in counts]
+    recompute_badges(user_ids, Badge.objects.filter(requirement_type__in=types), create=create)
+
+
+def user_metrics(user_id):
+    """The UserMetrics row of a user, counted from scratch if it is missing (e.g. bulk-created users)."""
+    from .models import UserMetrics
+
+    row = UserMetrics.objects.filter(user_id=user_id).first()
+    if row is not None:
+        return row
+    values = {metric: counts.get(user_id, 0) for metric, counts in collect_metrics(user_ids=[user_id]).items()}
+    try:
+        with transaction.atomic():
+            return UserMetrics.objects.create(user_id=user_id, **values)
+    except IntegrityError:
+        # Created concurrently
+        return UserMetrics.objects.get(user_id=user_id)
+
+
+def evaluate_badges(user_id, metrics, create=True):
+    """
+    Re-check a user's progress toward the badges reading the given metrics,
+    from their UserMetrics row. Returns the badges earned.
+
+    Earned badges (progress 100) are never lowered, so a metric going down
+    and up again doesn't earn and notify them twice.
+
+    New UserBadge rows are only created if create is set; receivers of
+    deletions leave it unset, the user may be being deleted.
+    """
+    from discussions.models import Forum
+    from .models import Badge, UserBadge, UserMetrics
+
+    types = [requirement_type for requirement_type, metric in REQUIREMENT_METRICS.items() if metric in metrics]
+    badges = list(Badge.objects.filter(requirement_type__in=types))
+    if not badges:
+        return []
+    values = UserMetrics.objects.filter(user_id=user_id).values(*metrics).first()
+    if values is None:
+        return []
+    forum_count = Forum.objects.count() if 'forums' in metrics else 0
+    stored = {row.badge_id: row for row in UserBadge.objects.filter(user_id=user_id, badge__in=badges)}
+
+    now = timezone.now()
+    earned = []
+    for badge in badges:
+        progress = badge_progress(badge, values[REQUIREMENT_METRICS[badge.requirement_type]], forum_count)
+        row = stored.get(badge.pk)
+        if row is None:
+            if not (create and progress):
+                continue
+            try:
+                with transaction.atomic():
+                    UserBadge.objects.create(user_id=user_id, badge=badge, progress=progress)
+            except IntegrityError:
+                # Created concurrently by another event, as recent as this one
+                continue
+            if progress == 100:
+                earned.append(badge)
+        elif progress == 100:
+            # Conditional, so concurrent events earn (and notify) a badge once
+            if UserBadge.objects.filter(pk=row.pk, progress__lt=100).update(progress=100, earned_date=now):
+                earned.append(badge)
+        elif row.progress != progress:
+            UserBadge.objects.filter(pk=row.pk, progress__lt=100).update(progress=progress)
+
+    _notify_earned([(user_id, badge) for badge in earned])
+    return earned
+
+
+def bump_metric(user_id, metric, delta=1):
+    """Add delta to a user's metric and re-check the badges reading it."""
+    from .models import UserMetrics
+
+    if user_id is None:
+        return
+    with transaction.atomic():
+        if UserMetrics.objects.filter(user_id=user_id).update(**{metric: Greatest(F(metric) + delta, Value(0))}):
+            evaluate_badges(user_id, [metric], create=delta > 0)
+
+
+def set_metric(user_id, metric, value, create=True):
+    """Set a user's metric and re-check the badges reading it, if it changed."""
+    from .models import UserMetrics
+
+    with transaction.atomic():
+        if UserMetrics.objects.filter(user_id=user_id).exclude(**{metric: value}).update(**{metric: value}):
+            evaluate_badges(user_id, [metric], create=create)
+
+
+def refresh_metric(user_id, metric, create=True):
+    """Recount a metric that can't be maintained by increments (forums) for one user."""
+    value = collect_metrics([metric], [user_id])[metric].get(user_id, 0)
+    set_metric(user_id, metric, value, create=create)
+
+
+def profile_fields(profile):
+    """The number of PROFILE_FIELDS filled in a profile."""
+    return sum(1 for field in PROFILE_FIELDS if getattr(profile, field))
@@ -0,0 +1,372 @@
+import hashlib
+import multiprocessing
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import F
+
+from accounts.badges import rebuild_user_metrics, recompute_badges
+from accounts.models import Profile, Follow
+from discussions.models import Forum, Topic, Reply, MAX_REPLY_DEPTH, path_segment
+from discussions.shortcodes import render_post
+from discussions.stats import recompute_stats
+from notifications.models import Notification
+from publications.models import Keyword, Publication, Favorite, StoredFile
+
+# Stages in dependency order; each one is generated in chunks of --batch-size rows
+STAGES = ('users', 'follows', 'publications', 'topics', 'replies')
+
+WORDS = (
+    'energy quantum photon electron neutron proton plasma fusion fission reactor turbine solar wind '
+    'battery lithium hydrogen catalyst enzyme protein genome molecule polymer crystal lattice laser '
+    'spectrum thermal kinetic potential entropy voltage current magnetic field wave particle detector '
+    'sensor model simulation experiment analysis measurement efficiency storage grid carbon emission '
+    'climate ocean atmosphere geothermal biofuel combustion membrane semiconductor superconductor '
+    'isotope radiation decay cell culture sequence network algorithm dataset calibration precision'
+).split()
+
+# The document of every generated publication: a blank one-page PDF
+PLACEHOLDER_PDF = (
+    b'%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n2 0 obj\n<< /Type /Pages /Kids [3 0 R] /Count 1 >>\n'
+    b'endobj\n3 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>\nendobj\nxref\n0 4\n'
+    b'0000000000 65535 f \n0000000009 00000 n \n0000000058 00000 n \n0000000115 00000 n \n'
+    b'trailer\n<< /Size 4 /Root 1 0 R >>\nstartxref\n186\n%%EOF\n'
+)
+
+INDEXING_COMMANDS = (
+    ('rebuild_search_index',),
+    ('rebuild_related_publications',),
+    ('rebuild_discussion_index',),
+    ('rebuild_similarity_index',),
+    ('decay_trending_scores', '--rebuild'),
+)
+
+def pick(seed, kind, index, count):
+    """Deterministic choice in range(count) for the index-th object of a kind, the same in every process."""
+    digest = hashlib.blake2b(f'{seed}:{kind}:{index}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+def words(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+def paragraphs(rng, count):
+    return '\n\n'.join(words(rng, 15, 60).capitalize() + '.' for _ in range(count))
+
+def sample_users(rng, plan, mean, exclude=None):
+    """Distinct user ids, on average mean of them."""
+    count = min(int(rng.expovariate(1 / mean)) if mean else 0, 50, plan['users'] - 1)
+    indexes = rng.sample(range(plan['users']), count + 1)
+    return [plan['user_base'] + i for i in indexes if plan['user_base'] + i != exclude][:count]
+
+def timestamp(plan, kind, index):
+    """Creation time of the index-th object of a kind: spread over --days, growing with the id."""
+    fraction = index / max(plan[kind], 1)
+    return plan['start'] + timedelta(seconds=plan['span'] * fraction)
+
+@contextmanager
+def explicit_timestamps():
+    """Let bulk_create() store the generated created_at/updated_at values."""
+    fields = [
+        field
+        for model in (Profile, Follow, Publication, Favorite, Topic, Reply, Notification)
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+def generate_users(plan, rng, start, stop):
+    users, profiles = [], []
+    for i in range(start, stop):
+        joined = timestamp(plan, 'users', i)
+        users.append(User(
+            pk=plan['user_base'] + i, username=f"{plan['prefix']}{i}", email=f"{plan['prefix']}{i}@example.com",
+            first_name=rng.choice(WORDS).capitalize(), last_name=rng.choice(WORDS).capitalize(),
+            password=plan['password'], date_joined=joined,
+        ))
+        profiles.append(Profile(
+            pk=plan['profile_base'] + i, user_id=plan['user_base'] + i, bio=words(rng, 5, 30),
+            institution=f'{rng.choice(WORDS).capitalize()} Institute', field_of_study=rng.choice(WORDS),
+            created_at=joined, updated_at=joined,
+        ))
+    User.objects.bulk_create(users)
+    Profile.objects.bulk_create(profiles)
+    return len(users)
+
+def generate_follows(plan, rng, start, stop):
+    follows = []
+    for i in range(start, stop):
+        followed = sample_users(rng, plan, plan['follows_per_user'], exclude=plan['user_base'] + i)
+        created_at = timestamp(plan, 'users', i)
+        follows.extend(
+            Follow(
+                follower_id=plan['profile_base'] + i,
+                following_id=plan['profile_base'] + (user_id - plan['user_base']),
+                created_at=created_at,
+            )
+            for user_id in followed
+        )
+    Follow.objects.bulk_create(follows, batch_size=plan['batch_size'])
+    return len(follows)
+
+def generate_publications(plan, rng, start, stop):
+    publications, tags, likes, dislikes, favorites = [], [], [], [], []
+    Tags, Likes, Dislikes = Publication.tags.through, Publication.likes.through, Publication.dislikes.through
+    for i in range(start, stop):
+        pk = plan['publication_base'] + i
+        author_id = plan['user_base'] + pick(plan['seed'], 'publication-author', i, plan['users'])
+        created_at = timestamp(plan, 'publications', i)
+        keyword_ids = rng.sample(plan['keyword_ids'], min(3, len(plan['keyword_ids'])))
+        liked = sample_users(rng, plan, plan['likes_per_post'], exclude=author_id)
+        disliked = [user_id for user_id in sample_users(rng, plan, plan['likes_per_post'] / 4) if user_id not in liked]
+        favorited = sample_users(rng, plan, plan['favorites_per_publication'], exclude=author_id)
+        publications.append(Publication(
+            pk=pk, title=words(rng, 4, 12).capitalize(), author_id=author_id, abstract=paragraphs(rng, 2),
+            document=plan['document'], publication_date=created_at.date(),
+            keywords=', '.join(plan['keyword_names'][keyword_id] for keyword_id in keyword_ids),
+            like_count=len(liked), dislike_count=len(disliked), created_at=created_at, updated_at=created_at,
+        ))
+        tags.extend(Tags(publication_id=pk, keyword_id=keyword_id) for keyword_id in keyword_ids)
+        likes.extend(Likes(publication_id=pk, user_id=user_id) for user_id in liked)
+        dislikes.extend(Dislikes(publication_id=pk, user_id=user_id) for user_id in disliked)
+        favorites.extend(Favorite(publication_id=pk, user_id=user_id, created_at=created_at) for user_id in favorited)
+    Publication.objects.bulk_create(publications)
+    for model, rows in ((Tags, tags), (Likes, likes), (Dislikes, dislikes), (Favorite, favorites)):
+        model.objects.bulk_create(rows, batch_size=plan['batch_size'])
+    return len(publications)
+
+def topic_author(plan, index):
+    return plan['user_base'] + pick(plan['seed'], 'topic-author', index, plan['users'])
+
+def generate_topics(plan, rng, start, stop):
+    topics, likes, dislikes = [], [], []
+    Likes, Dislikes = Topic.likes.through, Topic.dislikes.through
+    for i in range(start, stop):
+        pk = plan['topic_base'] + i
+        author_id = topic_author(plan, i)
+        created_at = timestamp(plan, 'topics', i)
+        content = paragraphs(rng, rng.randint(1, 4))
+        liked = sample_users(rng, plan, plan['likes_per_post'], exclude=author_id)
+        disliked = [user_id for user_id in sample_users(rng, plan, plan['likes_per_post'] / 4) if user_id not in liked]
+        topic = Topic(
+            pk=pk, title=words(rng, 4, 10).capitalize() + '?', content=content,
+            forum_id=plan['forum_ids'][pick(plan['seed'], 'topic-forum', i, len(plan['forum_ids']))],
+            author_id=author_id, like_count=len(liked), dislike_count=len(disliked),
+            created_at=created_at, updated_at=created_at, last_activity_at=created_at,
+        )
+        render_post(topic)
+        topics.append(topic)
+        likes.extend(Likes(topic_id=pk, user_id=user_id) for user_id in liked)
+        dislikes.extend(Dislikes(topic_id=pk, user_id=user_id) for user_id in disliked)
+    Topic.objects.bulk_create(topics)
+    Likes.objects.bulk_create(likes, batch_size=plan['batch_size'])
+    Dislikes.objects.bulk_create(dislikes, batch_size=plan['batch_size'])
+    return len(topics)
+
+def generate_replies(plan, rng, start, stop):
+    replies, likes, notifications = [], [], []
+    Likes = Reply.likes.through
+    threads = {}  # topic index -> [(reply pk, path, depth)] generated in this chunk
+    for i in range(start, stop):
+        pk = plan['reply_base'] + i
+        created_at = timestamp(plan, 'replies', i)
+        # A topic created before the reply, recent topics getting more replies
+        opened = max(1, min(plan['topics'], int(plan['topics'] * i / max(plan['replies'], 1)) + 1))
+        topic_index = int(opened * (1 - rng.random() ** 2)) % opened
+        topic_id = plan['topic_base'] + topic_index
+        author_id = plan['user_base'] + rng.randrange(plan['users'])
+
+        parent_id, path, depth = None, path_segment(pk), 0
+        thread = threads.setdefault(topic_index, [])
+        if thread and rng.random() < plan['nested_ratio']:
+            parent_id, parent_path, parent_depth = rng.choice(thread)
+            if parent_depth < MAX_REPLY_DEPTH:
+                path, depth = parent_path + path_segment(pk), parent_depth + 1
+            else:
+                parent_id = None
+        thread.append((pk, path, depth))
+
+        content = paragraphs(rng, rng.randint(1, 2))
+        liked = sample_users(rng, plan, plan['likes_per_post'], exclude=author_id)
+        reply = Reply(
+            pk=pk, content=content, topic_id=topic_id, author_id=author_id, parent_id=parent_id, path=path,
+            depth=depth, like_count=len(liked), created_at=created_at, updated_at=created_at,
+        )
+        render_post(reply)
+        replies.append(reply)
+        likes.extend(Likes(reply_id=pk, user_id=user_id) for user_id in liked)
+        # The topic author hears about each reply, as create_notification() does
+        recipient_id = topic_author(plan, topic_index)
+        if recipient_id != author_id:
+            notifications.append(Notification(
+                recipient_id=recipient_id, sender_id=author_id, notification_type=Notification.REPLY,
+                content_type_id=plan['topic_content_type'], object_id=topic_id,
+                read=rng.random() < 0.7, created_at=created_at,
+            ))
+    Reply.objects.bulk_create(replies)
+    Likes.objects.bulk_create(likes, batch_size=plan['batch_size'])
+    Notification.objects.bulk_create(notifications, batch_size=plan['batch_size'])
+    return len(replies)
+
+GENERATORS = {
+    'users': (generate_users, 'users'),
+    'follows': (generate_follows, 'users'),
+    'publications': (generate_publications, 'publications'),
+    'topics': (generate_topics, 'topics'),
+    'replies': (generate_replies, 'replies'),
+}
+
+def run_chunk(task):
+    """Generate rows [start, stop) of a stage; the same rows whichever process runs it."""
+    plan, stage, start, stop = task
+    generate, _ = GENERATORS[stage]
+    rng = random.Random(f"{plan['seed']}:{stage}:{start}")
+    with explicit_timestamps(), transaction.atomic():
+        return generate(plan, rng, start, stop)
+
+def close_connections():
+    # Forked workers must open their own database connections
+    connections.close_all()
+
+class Command(BaseCommand):
+    help = 'Generates a deterministic synthetic dataset (users, publications, topics, replies, reactions...) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users (with profiles)')
+        parser.add_argument('--publications', type=int, default=None, help='Number of publications (default: users)')
+        parser.add_argument('--topics', type=int, default=None, help='Number of topics (default: users)')
+        parser.add_argument('--replies', type=int, default=None, help='Number of replies (default: 10 per topic)')
+        parser.add_argument('--follows-per-user', type=float, default=10, help='Average number of users each user follows')
+        parser.add_argument('--likes-per-post', type=float, default=3, help='Average likes of each publication, topic and reply')
+        parser.add_argument('--favorites-per-publication', type=float, default=1, help='Average favorites of each publication')
+        parser.add_argument('--nested-ratio', type=float, default=0.3, help='Share of replies answering another reply')
+        parser.add_argument('--start-date', type=date.fromisoformat, default=date(2024, 1, 1), help='First day of the history, YYYY-MM-DD (UTC)')
+        parser.add_argument('--days', type=int, default=365, help='Days of history the data is spread over, from --start-date')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed generates the same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows generated and inserted per chunk')
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating chunks in parallel (POSIX only)')
+        parser.add_argument('--password', default='loadtest', help='Password of the generated users')
+        parser.add_argument('--build-indexes', action='store_true', help='Rebuild the search, similarity and trending indexes afterwards')
+
+    def handle(self, *args, **options):
+        plan = self._plan(options)
+        workers = options['workers']
+        if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            self.stdout.write(self.style.WARNING('Parallel workers need fork(), generating in this process'))
+            workers = 1
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite allows a single writer, generating in this process'))
+            workers = 1
+
+        for stage in STAGES:
+            _, count_key = GENERATORS[stage]
+            tasks = [
+                (plan, stage, start, min(start + plan['batch_size'], plan[count_key]))
+                for start in range(0, plan[count_key], plan['batch_size'])
+            ]
+            if workers > 1:
+                close_connections()
+                with multiprocessing.get_context('fork').Pool(workers, initializer=close_connections) as pool:
+                    created = sum(pool.imap_unordered(run_chunk, tasks))
+            else:
+                created = sum(map(run_chunk, tasks))
+            self.stdout.write(f'{stage}: {created} rows')
+
+        # Saving the placeholder took one reference to it, each generated publication holds one
+        storage = Publication._meta.get_field('document').storage
+        if plan['publications']:
+            StoredFile.objects.filter(pk=storage.content_hash(plan['document'])).update(
+                ref_count=F('ref_count') + plan['publications'] - 1
+            )
+        else:
+            storage.delete(plan['document'])
+
+        # Explicit ids leave PostgreSQL sequences behind (no-op on MySQL and SQLite)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Profile, Publication, Topic, Reply]):
+                cursor.execute(sql)
+
+        self.stdout.write('Recomputing forum and topic statistics...')
+        recompute_stats(Forum, Topic, Reply, batch_size=plan['batch_size'])
+        # bulk_create() skipped the receivers maintaining the badge metrics, and the badges they earn
+        self.stdout.write('Recounting user metrics and badges...')
+        rebuild_user_metrics(batch_size=plan['batch_size'])
+        recompute_badges(batch_size=plan['batch_size'])
+        if options['build_indexes']:
+            for command in INDEXING_COMMANDS:
+                self.stdout.write(f"Running {' '.join(command)}...")
+                call_command(*command, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Load data generated with seed {plan['seed']}: users are {plan['prefix']}0 to "
+            f"{plan['prefix']}{plan['users'] - 1}, password {options['password']!r}"
+        ))
+
+    def _plan(self, options):
+        """Everything the chunks need: volumes, first ids, and the existing rows they refer to."""
+        users = options['users']
+        if users < 2:
+            raise CommandError('At least 2 users are needed.')
+        prefix = f"load{options['seed']}_"
+        if User.objects.filter(username=f'{prefix}0').exists():
+            raise CommandError(f"Data for seed {options['seed']} already exists, use another --seed.")
+
+        document = Publication._meta.get_field('document').storage.save(
+            'publications/load-test.pdf', ContentFile(PLACEHOLDER_PDF)
+        )
+        if not Forum.objects.exists():
+            call_command('create_initial_forums', stdout=self.stdout)
+
+        # A shared vocabulary of keywords, as publications reuse them
+        Keyword.objects.bulk_create(
+            [Keyword(name=word, slug=word) for word in WORDS], ignore_conflicts=True
+        )
+        keyword_names = dict(Keyword.objects.filter(slug__in=WORDS).values_list('pk', 'name'))
+
+        def base(model):
+            last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+            return (last or 0) + 1
+
+        topics = options['topics'] if options['topics'] is not None else users
+        return {
+            'seed': options['seed'],
+            'prefix': prefix,
+            'users': users,
+            'publications': options['publications'] if options['publications'] is not None else users,
+            'topics': topics,
+            'replies': options['replies'] if options['replies'] is not None else topics * 10,
+            'follows_per_user': options['follows_per_user'],
+            'likes_per_post': options['likes_per_post'],
+            'favorites_per_publication': options['favorites_per_publication'],
+            'nested_ratio': options['nested_ratio'],
+            'batch_size': options['batch_size'],
+            'password': make_password(options['password']),
+            # A fixed epoch, so that timestamps too only depend on the options
+            'start': datetime.combine(options['start_date'], time(), tzinfo=timezone.utc),
+            'span': options['days'] * 86400,
+            'user_base': base(User),
+            'profile_base': base(Profile),
+            'publication_base': base(Publication),
+            'topic_base': base(Topic),
+            'reply_base': base(Reply),
+            'forum_ids': list(Forum.objects.order_by('pk').values_list('pk', flat=True)),
+            'keyword_ids': sorted(keyword_names),
+            'keyword_names': keyword_names,
+            'document': document,
+            'topic_content_type': ContentType.objects.get_for_model(Topic).pk,
+        }
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_metrics(apps, schema_editor):
+    from accounts.badges import rebuild_user_metrics
+
+    rebuild_user_metrics(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_badge_profile_equipped_badge_userbadge'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('discussions', '0013_similarity_index'),
+        ('publications', '0011_publication_trend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMetrics',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metrics', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('publications', models.PositiveIntegerField(default=0)),
+                ('publication_likes', models.PositiveIntegerField(default=0)),
+                ('publication_favorites', models.PositiveIntegerField(default=0)),
+                ('replies', models.PositiveIntegerField(default=0)),
+                ('followers', models.PositiveIntegerField(default=0)),
+                ('forums', models.PositiveIntegerField(default=0)),
+                ('profile_fields', models.PositiveSmallIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_metrics, migrations.RunPython.noop),
+    ]
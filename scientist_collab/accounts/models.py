@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
+from django.urls import reverse
+from publications.models import Publication, Favorite
+from discussions.models import Topic, Reply
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -61,6 +64,9 @@ class Badge(models.Model):
     def __str__(self):
         return self.name
 
+    def get_absolute_url(self):
+        return reverse('accounts:user_badges')
+
 class UserBadge(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='badges')
     badge = models.ForeignKey(Badge, on_delete=models.CASCADE)
@@ -74,6 +80,20 @@ class UserBadge(models.Model):
     class Meta:
         unique_together = ('user', 'badge')
 
+class UserMetrics(models.Model):
+    """Per-user counters read by badge requirements, kept up to date by the receivers below (see accounts.badges)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='metrics')
+    publications = models.PositiveIntegerField(default=0)
+    publication_likes = models.PositiveIntegerField(default=0)  # Likes received on their publications
+    publication_favorites = models.PositiveIntegerField(default=0)  # Favorites received on their publications
+    replies = models.PositiveIntegerField(default=0)
+    followers = models.PositiveIntegerField(default=0)
+    forums = models.PositiveIntegerField(default=0)  # Distinct forums posted in
+    profile_fields = models.PositiveSmallIntegerField(default=0)  # Filled fields of badges.PROFILE_FIELDS
+
+    def __str__(self):
+        return f"{self.user_id} metrics"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -82,3 +102,138 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+@receiver(post_save, sender=User)
+def create_user_metrics(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    UserMetrics.objects.get_or_create(user_id=instance.pk)
+
+@receiver(post_save, sender=Profile)
+def count_profile_fields(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .badges import profile_fields, set_metric
+    set_metric(instance.user_id, 'profile_fields', profile_fields(instance))
+
+@receiver(post_save, sender=Badge)
+def award_badge(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # New or changed requirements: the progress of every user toward this badge, in bulk
+    from .badges import recompute_badges
+    recompute_badges(badges=[instance])
+
+# Badge metrics, see accounts.badges. Deletions may be part of deleting the
+# user, so they only ever update existing rows.
+
+def _publication_author(publication_id):
+    return Publication.objects.filter(pk=publication_id).values_list('author_id', flat=True).first()
+
+def _profile_user(profile_id):
+    return Profile.objects.filter(pk=profile_id).values_list('user_id', flat=True).first()
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .badges import bump_metric
+    bump_metric(_profile_user(instance.following_id), 'followers')
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    from .badges import bump_metric
+    bump_metric(_profile_user(instance.following_id), 'followers', -1)
+
+@receiver(post_save, sender=Publication)
+def count_publication(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .badges import bump_metric
+    bump_metric(instance.author_id, 'publications')
+
+@receiver(post_delete, sender=Publication)
+def count_publication_delete(sender, instance, **kwargs):
+    from .badges import bump_metric
+    bump_metric(instance.author_id, 'publications', -1)
+    # Its like rows go with it without m2m_changed
+    if instance.like_count:
+        bump_metric(instance.author_id, 'publication_likes', -instance.like_count)
+
+@receiver(m2m_changed, sender=Publication.likes.through)
+def count_publication_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    # Sent by the related managers and config.reactions.toggle_reaction()
+    from .badges import bump_metric
+    if action == 'pre_clear':
+        # clear() gives no pk_set: count what it is about to remove, per author
+        if reverse:
+            likes = Publication.objects.filter(likes=instance)
+        else:
+            likes = Publication.objects.filter(pk=instance.pk, likes__isnull=False)
+        totals = likes.order_by().values('author').annotate(total=models.Count('pk'))
+        instance._cleared_likes = list(totals.values_list('author', 'total'))
+        return
+    if action == 'post_clear':
+        for author_id, total in getattr(instance, '_cleared_likes', ()):
+            bump_metric(author_id, 'publication_likes', -total)
+        instance._cleared_likes = None
+        return
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    sign = 1 if action == 'post_add' else -1
+    if reverse:
+        # user.liked_publications: pk_set are publications, maybe of several authors
+        authors = Publication.objects.filter(pk__in=pk_set).order_by().values('author').annotate(total=models.Count('pk'))
+        for author_id, total in authors.values_list('author', 'total'):
+            bump_metric(author_id, 'publication_likes', sign * total)
+    else:
+        bump_metric(instance.author_id, 'publication_likes', sign * len(pk_set))
+
+@receiver(post_save, sender=Favorite)
+def count_favorite(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .badges import bump_metric
+    bump_metric(_publication_author(instance.publication_id), 'publication_favorites')
+
+@receiver(post_delete, sender=Favorite)
+def count_unfavorite(sender, instance, **kwargs):
+    from .badges import bump_metric
+    bump_metric(_publication_author(instance.publication_id), 'publication_favorites', -1)
+
+@receiver(post_save, sender=Topic)
+def count_topic_forum(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Also on edits: moving a topic changes the forums of its author
+    from .badges import refresh_metric
+    refresh_metric(instance.author_id, 'forums')
+
+@receiver(pre_delete, sender=Topic)
+def collect_topic_authors(sender, instance, **kwargs):
+    # Everyone whose replies go with the topic, recounted once in count_topic_delete()
+    instance._reply_authors = set(Reply.objects.filter(topic=instance).values_list('author_id', flat=True).distinct())
+
+@receiver(post_delete, sender=Topic)
+def count_topic_delete(sender, instance, **kwargs):
+    from .badges import recount_metrics
+    authors = getattr(instance, '_reply_authors', set()) | {instance.author_id}
+    recount_metrics(authors, ['replies', 'forums'], create=False)
+
+@receiver(post_save, sender=Reply)
+def count_reply(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .badges import bump_metric, refresh_metric
+    bump_metric(instance.author_id, 'replies')
+    refresh_metric(instance.author_id, 'forums')
+
+@receiver(post_delete, sender=Reply)
+def count_reply_delete(sender, instance, **kwargs):
+    from .badges import bump_metric, refresh_metric
+    from discussions.stats import deleting_topics
+    if instance.topic_id in deleting_topics():
+        # Recounted per author once the topic is gone
+        return
+    bump_metric(instance.author_id, 'replies', -1)
+    refresh_metric(instance.author_id, 'forums', create=False)
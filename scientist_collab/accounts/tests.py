@@ -2,7 +2,14 @@ from django.test import TestCase, Client, override_settings, RequestFactory
 from django.urls import reverse
 from django.contrib.auth.models import User
 from .models import Profile, Badge, UserBadge
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
 from unittest.mock import patch
+from discussions.models import Forum, Topic, Reply, path_segment
+from publications.models import Publication, StoredFile
 
 # Override settings to disable secure transport for testing
 @override_settings(SECURE_SSL_REDIRECT=False, SESSION_COOKIE_SECURE=False, CSRF_COOKIE_SECURE=False)
@@ -133,3 +140,384 @@ class AccountsViewTests(TestCase):
             response = self.client.get(reverse('accounts:profile'))
             self.assertEqual(response.status_code, 200)
             self.assertTrue(response.context['user'].is_authenticated)
+
+class BadgeEngineTests(TestCase):
+    """Tests for the set-based badge computation"""
+    
+    def setUp(self):
+        """Setup test data"""
+        from datetime import date
+        from discussions.models import Forum, Topic, Reply
+        from publications.models import Publication, Favorite
+        
+        self.author = User.objects.create_user(username='author', password='testpassword123')
+        self.reader = User.objects.create_user(username='reader', password='testpassword123')
+        self.idle = User.objects.create_user(username='idle', password='testpassword123')
+        publication = Publication.objects.create(
+            title='Test Publication', abstract='Abstract', author=self.author,
+            publication_date=date.today(), keywords='test', document='publications/test.pdf'
+        )
+        Publication.objects.filter(pk=publication.pk).update(like_count=3)
+        Favorite.objects.create(user=self.reader, publication=publication)
+        self.reader.profile.follow(self.author.profile)
+        self.author.profile.institution = 'Institute'
+        self.author.profile.bio = 'Bio'
+        self.author.profile.save()
+        
+        physics = Forum.objects.create(name='Physics', description='Physics')
+        Forum.objects.create(name='Chemistry', description='Chemistry')
+        topic = Topic.objects.create(title='Topic', content='Content', forum=physics, author=self.reader)
+        for _ in range(2):
+            Reply.objects.create(topic=topic, author=self.author, content='Reply')
+        
+        self.badges = {
+            requirement_type: Badge.objects.create(
+                name=requirement_type, description='', requirement_type=requirement_type, requirement_count=count
+            )
+            for requirement_type, count in (
+                ('publications_count', 1), ('publication_likes', 6), ('publication_favorites', 1),
+                ('forum_replies', 4), ('followers_count', 1), ('profile_completion', 1), ('forums_diversity', 1),
+            )
+        }
+    
+    def progress(self, user):
+        return dict(UserBadge.objects.filter(user=user).values_list('badge__requirement_type', 'progress'))
+    
+    def test_recompute_badges(self):
+        """Check the progress of every requirement type and that only users with progress get rows"""
+        from .badges import recompute_badges
+        
+        # Creating the badges computed them already
+        self.assertEqual(recompute_badges(), (0, 0, 0))
+        UserBadge.objects.all().delete()
+        created, updated, earned = recompute_badges()
+        self.assertEqual(self.progress(self.author), {
+            'publications_count': 100, 'publication_likes': 50, 'publication_favorites': 100,
+            'forum_replies': 50, 'followers_count': 100, 'profile_completion': 50, 'forums_diversity': 50,
+        })
+        self.assertEqual(self.progress(self.reader), {'forums_diversity': 50})
+        self.assertEqual(self.progress(self.idle), {})
+        self.assertEqual((created, updated, earned), (8, 0, 3))
+        
+        # A second run finds nothing to change
+        self.assertEqual(recompute_badges(), (0, 0, 0))
+        
+        # Rows gone stale (e.g. written without signals) are repaired
+        UserBadge.objects.filter(user=self.author, badge=self.badges['followers_count']).update(progress=10)
+        self.assertEqual(recompute_badges(), (0, 1, 1))
+        self.assertEqual(self.progress(self.author)['followers_count'], 100)
+    
+    def test_query_count_independent_of_users(self):
+        """Check that recomputing runs the same number of queries whatever the number of users"""
+        from .badges import recompute_badges
+        
+        recompute_badges()
+        UserBadge.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            recompute_badges()
+        for i in range(10):
+            User.objects.create_user(username=f'user{i}', password='testpassword123')
+        UserBadge.objects.all().delete()
+        with self.assertNumQueries(len(queries)):
+            recompute_badges()
+    
+    def test_calculate_badge_progress(self):
+        """Check that the single-user progress matches the batch computation"""
+        from .views import calculate_badge_progress
+        
+        self.assertEqual(calculate_badge_progress(self.author, self.badges['forum_replies']), 50)
+        self.assertEqual(calculate_badge_progress(self.reader, self.badges['forums_diversity']), 50)
+        self.assertEqual(calculate_badge_progress(self.idle, self.badges['publications_count']), 0)
+
+class BadgeEventTests(TestCase):
+    """Tests for the metrics and badges updated as users act"""
+    
+    def setUp(self):
+        """Setup test data"""
+        from discussions.models import Forum, Topic
+        
+        self.user = User.objects.create_user(username='scientist', password='testpassword123')
+        self.other = User.objects.create_user(username='colleague', password='testpassword123')
+        self.forum = Forum.objects.create(name='Physics', description='Physics')
+        Forum.objects.create(name='Chemistry', description='Chemistry')
+        self.topic = Topic.objects.create(title='Topic', content='Content', forum=self.forum, author=self.other)
+        self.replies_badge = Badge.objects.create(
+            name='Talkative', description='', requirement_type='forum_replies', requirement_count=2
+        )
+        self.followers_badge = Badge.objects.create(
+            name='Followed', description='', requirement_type='followers_count', requirement_count=1
+        )
+    
+    def reply(self):
+        from discussions.models import Reply
+        return Reply.objects.create(topic=self.topic, author=self.user, content='Reply')
+    
+    def badge_notifications(self):
+        from notifications.models import Notification
+        return Notification.objects.filter(recipient=self.user, notification_type=Notification.BADGE)
+    
+    def test_replies_earn_badge_once(self):
+        """Check that replies update the metrics and earn the badge, notified once"""
+        self.reply()
+        self.assertEqual(self.user.metrics.replies, 1)
+        self.assertEqual(UserBadge.objects.get(user=self.user, badge=self.replies_badge).progress, 50)
+        self.assertFalse(self.badge_notifications().exists())
+        
+        self.reply()
+        self.reply()
+        self.user.metrics.refresh_from_db()
+        self.assertEqual((self.user.metrics.replies, self.user.metrics.forums), (3, 1))
+        self.assertEqual(UserBadge.objects.get(user=self.user, badge=self.replies_badge).progress, 100)
+        self.assertEqual(self.badge_notifications().count(), 1)
+        self.assertEqual(self.badge_notifications().get().object_id, self.replies_badge.pk)
+    
+    def test_follow_and_unfollow(self):
+        """Check that followers are counted up and down"""
+        self.other.profile.follow(self.user.profile)
+        self.assertEqual(UserBadge.objects.get(user=self.user, badge=self.followers_badge).progress, 100)
+        
+        # The metric drops, the earned badge stays
+        self.other.profile.unfollow(self.user.profile)
+        self.user.metrics.refresh_from_db()
+        self.assertEqual(self.user.metrics.followers, 0)
+        self.assertEqual(UserBadge.objects.get(user=self.user, badge=self.followers_badge).progress, 100)
+    
+    def test_like_unlike_like_notifies_once(self):
+        """Check that a badge lost and regained by its metric is earned and notified once"""
+        from datetime import date
+        from config.reactions import toggle_reaction
+        from publications.models import Publication
+        
+        badge = Badge.objects.create(name='Liked', description='', requirement_type='publication_likes', requirement_count=1)
+        publication = Publication.objects.create(
+            title='Test Publication', abstract='Abstract', author=self.user,
+            publication_date=date.today(), keywords='test', document='publications/test.pdf'
+        )
+        for _ in range(3):
+            toggle_reaction(publication, self.other, 'likes', 'like_count', 'dislikes', 'dislike_count')
+        
+        earned = UserBadge.objects.get(user=self.user, badge=badge)
+        self.assertEqual(earned.progress, 100)
+        self.assertEqual(self.badge_notifications().filter(object_id=badge.pk).count(), 1)
+        
+        earned_date = earned.earned_date
+        toggle_reaction(publication, self.other, 'likes', 'like_count', 'dislikes', 'dislike_count')
+        toggle_reaction(publication, self.other, 'likes', 'like_count', 'dislikes', 'dislike_count')
+        self.assertEqual(UserBadge.objects.get(pk=earned.pk).earned_date, earned_date)
+        self.assertEqual(self.badge_notifications().filter(object_id=badge.pk).count(), 1)
+    
+    def test_publication_likes_and_profile(self):
+        """Check the likes received through config.reactions and the filled profile fields"""
+        from datetime import date
+        from config.reactions import toggle_reaction
+        from publications.models import Publication
+        
+        publication = Publication.objects.create(
+            title='Test Publication', abstract='Abstract', author=self.user,
+            publication_date=date.today(), keywords='test', document='publications/test.pdf'
+        )
+        toggle_reaction(publication, self.other, 'likes', 'like_count', 'dislikes', 'dislike_count')
+        self.user.profile.bio = 'Bio'
+        self.user.profile.save()
+        self.user.metrics.refresh_from_db()
+        self.assertEqual(
+            (self.user.metrics.publications, self.user.metrics.publication_likes, self.user.metrics.profile_fields),
+            (1, 1, 1)
+        )
+        
+        toggle_reaction(publication, self.other, 'likes', 'like_count', 'dislikes', 'dislike_count')
+        self.user.metrics.refresh_from_db()
+        self.assertEqual(self.user.metrics.publication_likes, 0)
+    
+    def test_likes_cleared_or_deleted_with_publication(self):
+        """Check that likes leaving through clear() or with their publication are counted"""
+        from datetime import date
+        from publications.models import Publication
+        
+        def publication():
+            return Publication.objects.create(
+                title='Test Publication', abstract='Abstract', author=self.user,
+                publication_date=date.today(), keywords='test', document='publications/test.pdf'
+            )
+        
+        def likes():
+            self.user.metrics.refresh_from_db()
+            return self.user.metrics.publication_likes
+        
+        first, second = publication(), publication()
+        first.likes.add(self.other)
+        second.likes.add(self.other)
+        self.assertEqual(likes(), 2)
+        first.likes.clear()
+        self.assertEqual(likes(), 1)
+        self.other.liked_publications.clear()
+        self.assertEqual(likes(), 0)
+        
+        first.likes.add(self.other)
+        Publication.objects.filter(pk=first.pk).update(like_count=1)
+        first.refresh_from_db()
+        first.delete()
+        self.user.metrics.refresh_from_db()
+        self.assertEqual((self.user.metrics.publications, self.user.metrics.publication_likes), (1, 0))
+    
+    def test_topic_delete_recounts_once(self):
+        """Check that deleting a topic recounts its repliers once, whatever the number of replies"""
+        from discussions.models import Topic, Reply
+        
+        def delete_topic(replies):
+            topic = Topic.objects.create(title='Thread', content='Content', forum=self.forum, author=self.other)
+            for i in range(replies):
+                Reply.objects.create(topic=topic, author=self.user if i % 2 else self.other, content='Reply')
+            with CaptureQueriesContext(connection) as queries:
+                topic.delete()
+            return len(queries)
+        
+        self.assertEqual(delete_topic(4), delete_topic(12))
+        self.reply()
+        self.user.metrics.refresh_from_db()
+        self.assertEqual((self.user.metrics.replies, self.user.metrics.forums), (1, 1))
+        self.forum.refresh_from_db()
+        self.assertEqual((self.forum.topic_count, self.forum.reply_count), (1, 1))
+    
+    def test_delete_user(self):
+        """Check that deleting a user with posts, followers and badges leaves no metrics behind"""
+        from .models import UserMetrics
+        
+        self.reply()
+        self.reply()
+        self.other.profile.follow(self.user.profile)
+        self.user.profile.follow(self.other.profile)
+        self.user.delete()
+        self.assertFalse(UserMetrics.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(UserBadge.objects.filter(user_id=self.user.pk).exists())
+        self.other.metrics.refresh_from_db()
+        self.assertEqual(self.other.metrics.followers, 0)
+    
+    def test_update_badges_rebuilds_metrics(self):
+        """Check that update_badges recounts metrics written without signals"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import UserMetrics
+        
+        self.reply()
+        UserMetrics.objects.filter(user=self.user).update(replies=0, forums=0)
+        call_command('update_badges', stdout=StringIO())
+        self.user.metrics.refresh_from_db()
+        self.assertEqual((self.user.metrics.replies, self.user.metrics.forums), (1, 1))
+
+@override_settings(SECURE_SSL_REDIRECT=False, SESSION_COOKIE_SECURE=False, CSRF_COOKIE_SECURE=False)
+class UserBadgesPageTests(TestCase):
+    """Tests for the badges page"""
+    
+    def setUp(self):
+        """Setup test data"""
+        from discussions.models import Forum, Topic, Reply
+        
+        self.user = User.objects.create_user(username='scientist', password='testpassword123')
+        forum = Forum.objects.create(name='Physics', description='Physics')
+        Forum.objects.create(name='Chemistry', description='Chemistry')
+        topic = Topic.objects.create(title='Topic', content='Content', forum=forum, author=self.user)
+        Reply.objects.create(topic=topic, author=self.user, content='Reply')
+        self.client.force_login(self.user)
+    
+    def create_badges(self, count):
+        requirement_types = ['forum_replies', 'forums_diversity', 'profile_completion', 'publications_count']
+        for i in range(count):
+            Badge.objects.create(
+                name=f'Badge {i}', description='', requirement_type=requirement_types[i % len(requirement_types)],
+                requirement_count=i + 1
+            )
+    
+    def test_progress_and_remaining(self):
+        """Check that progress and remaining text come from the user's metrics"""
+        self.create_badges(4)
+        response = self.client.get(reverse('accounts:user_badges'))
+        data = {item['badge'].name: item for item in response.context['badges_data']}
+        self.assertEqual((data['Badge 0']['progress'], data['Badge 0']['earned']), (100, True))
+        self.assertEqual(data['Badge 0']['remaining'], 'Badge earned!')
+        self.assertEqual(data['Badge 1']['progress'], 50)
+        self.assertEqual(data['Badge 1']['remaining'], 'Participate in 1 more forums')
+        self.assertEqual(data['Badge 2']['remaining'], 'Complete your profile')
+        self.assertEqual(data['Badge 3']['remaining'], 'Need 4 more publications')
+    
+    def test_query_count_independent_of_badges(self):
+        """Check that the page runs the same number of queries whatever the number of badges"""
+        self.create_badges(4)
+        self.client.get(reverse('accounts:user_badges'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('accounts:user_badges'))
+        
+        self.create_badges(12)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(reverse('accounts:user_badges'))
+        self.assertEqual(len(response.context['badges_data']), 16)
+
+
+class SeedLoadDataTests(TestCase):
+    """Tests for the seed_load_data command"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.forum = Forum.objects.create(name='Physics', description='Physics discussions')
+        self.options = dict(users=20, publications=10, topics=15, replies=60, batch_size=7, stdout=StringIO())
+    
+    def snapshot(self):
+        replies = Reply.objects.filter(author__username__startswith='load1_')
+        return (
+            list(User.objects.filter(username__startswith='load1_').values_list('username', 'first_name', 'date_joined')),
+            list(Topic.objects.filter(author__username__startswith='load1_').values_list(
+                'title', 'author__username', 'like_count', 'created_at'
+            )),
+            list(replies.values_list('content', 'author__username', 'topic__title', 'depth', 'like_count', 'created_at')),
+        )
+    
+    def test_generates_consistent_data(self):
+        """Check the volumes, reply threading and recomputed statistics"""
+        call_command('seed_load_data', **self.options)
+        
+        self.assertEqual(User.objects.filter(username__startswith='load1_', profile__isnull=False).count(), 20)
+        self.assertEqual(Topic.objects.count(), 15)
+        self.assertEqual(Reply.objects.count(), 60)
+        for reply in Reply.objects.select_related('parent'):
+            expected = (reply.parent.path if reply.parent else '') + path_segment(reply.pk)
+            self.assertEqual(reply.path, expected)
+            if reply.parent:
+                self.assertEqual(reply.topic_id, reply.parent.topic_id)
+            self.assertTrue(reply.content_html)
+        for topic in Topic.objects.all():
+            self.assertEqual(topic.reply_count, topic.replies.count())
+            self.assertEqual(topic.like_count, topic.likes.count())
+        self.assertEqual(Forum.objects.get().topic_count, 15)
+    
+    def test_publications_share_a_placeholder_document(self):
+        """Check that generated publications reference one stored placeholder PDF"""
+        call_command('seed_load_data', **self.options)
+        
+        names = set(Publication.objects.values_list('document', flat=True))
+        self.assertEqual(len(names), 1)
+        storage = Publication._meta.get_field('document').storage
+        name = names.pop()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(pk=storage.content_hash(name)).ref_count, 10)
+    
+    def test_badges_follow_the_generated_activity(self):
+        """Check that badges are earned from the generated data, not drawn at random"""
+        badge = Badge.objects.create(name='Author', description='First publication', requirement_type='publications_count')
+        
+        call_command('seed_load_data', **self.options)
+        
+        authors = set(Publication.objects.values_list('author_id', flat=True))
+        earned = set(UserBadge.objects.filter(badge=badge, progress=100).values_list('user_id', flat=True))
+        self.assertEqual(earned, authors)
+        self.assertFalse(UserBadge.objects.exclude(badge=badge).exists())
+    
+    def test_same_seed_same_data(self):
+        """Check that a seed always generates the same data, and can't be loaded twice"""
+        call_command('seed_load_data', **self.options)
+        first = self.snapshot()
+        with self.assertRaises(CommandError):
+            call_command('seed_load_data', **self.options)
+        
+        User.objects.filter(username__startswith='load1_').delete()
+        call_command('seed_load_data', **self.options)
+        self.assertEqual(self.snapshot(), first)
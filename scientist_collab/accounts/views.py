@@ -8,6 +8,7 @@ from django.views.generic import CreateView
 from django.http import JsonResponse
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
 from .models import Profile, Follow, Badge, UserBadge
+from .badges import REQUIREMENT_METRICS, badge_progress, badge_remaining, collect_metrics, user_metrics
 
 # Import notification utilities
 from notifications.utils import create_notification
@@ -15,7 +16,7 @@ from notifications.models import Notification
 
 # Import models from other apps
 from publications.models import Publication
-from discussions.models import Topic
+from discussions.models import Forum, Topic
 
 # Import custom utils
 from .utils import log_security_event, require_secure_transport
@@ -314,7 +315,7 @@ def public_profile(request, user_id):
 def user_publications(request, user_id):
     """View all publications by a user"""
     user = get_object_or_404(User, id=user_id)
-    publications = user.publications.all()
+    publications = user.publications.prefetch_related('tags')
     
     context = {
         'user_viewed': user,
@@ -462,39 +463,29 @@ def orcid_login(request):
 def user_badges(request):
     user = request.user
     
-    # Get all badges in the system
-    all_badges = Badge.objects.all()
+    # All badges and the user's rows, then one metrics snapshot for every badge:
+    # the queries don't depend on the number of badges
+    all_badges = list(Badge.objects.all())
+    user_badges = {user_badge.badge_id: user_badge for user_badge in UserBadge.objects.filter(user=user)}
+    metrics = user_metrics(user.pk)
+    forum_count = Forum.objects.count() if any(
+        badge.requirement_type == 'forums_diversity' for badge in all_badges
+    ) else 0
     
-    # Get user's earned badges
-    user_badges = UserBadge.objects.filter(user=user)
-    
-    # Create a dictionary of badges the user has earned or is progressing toward
     badges_data = []
-    
     for badge in all_badges:
-        user_badge = user_badges.filter(badge=badge).first()
-        
-        if user_badge:
-            # User has this badge or is making progress
-            badges_data.append({
-                'badge': badge,
-                'progress': user_badge.progress,
-                'earned': user_badge.progress == 100,
-                'earned_date': user_badge.earned_date if user_badge.progress == 100 else None,
-                'is_equipped': user_badge.is_equipped,
-                'remaining': calculate_remaining_for_badge(user, badge, user_badge.progress)
-            })
-        else:
-            # User doesn't have this badge yet
-            progress = calculate_badge_progress(user, badge)
-            badges_data.append({
-                'badge': badge,
-                'progress': progress,
-                'earned': False,
-                'earned_date': None,
-                'is_equipped': False,
-                'remaining': calculate_remaining_for_badge(user, badge, progress)
-            })
+        user_badge = user_badges.get(badge.pk)
+        value = getattr(metrics, REQUIREMENT_METRICS.get(badge.requirement_type, ''), 0)
+        earned = user_badge is not None and user_badge.progress == 100
+        badges_data.append({
+            'badge': badge,
+            # An earned badge stays earned if the metric drops afterwards
+            'progress': 100 if earned else badge_progress(badge, value, forum_count),
+            'earned': earned,
+            'earned_date': user_badge.earned_date if earned else None,
+            'is_equipped': user_badge.is_equipped if user_badge else False,
+            'remaining': 'Badge earned!' if earned else badge_remaining(badge, value, forum_count),
+        })
     
     return render(request, 'accounts/badges.html', {
         'badges_data': badges_data
@@ -521,189 +512,9 @@ def equip_badge(request, badge_id):
 
 def calculate_badge_progress(user, badge):
     """Calculate progress toward earning a badge."""
-    try:
-        if badge.requirement_type == 'publications_count':
-            # Count user's publications
-            try:
-                from publications.models import Publication
-                count = Publication.objects.filter(author=user).count()
-                progress = min(100, int((count / badge.requirement_count) * 100))
-                return progress
-            except (ImportError, ModuleNotFoundError):
-                return 0
-            
-        elif badge.requirement_type == 'publication_likes':
-            # Count likes on user's publications
-            try:
-                from publications.models import Publication
-                # Check if Like model exists
-                try:
-                    from publications.models import Like
-                    publications = Publication.objects.filter(author=user)
-                    likes_count = sum(p.likes.count() for p in publications)
-                    progress = min(100, int((likes_count / badge.requirement_count) * 100))
-                    return progress
-                except ImportError:
-                    # If Like model doesn't exist, assume 0 progress
-                    return 0
-            except (ImportError, ModuleNotFoundError):
-                return 0
-            
-        elif badge.requirement_type == 'publication_favorites':
-            # Count favorites on user's publications
-            try:
-                from publications.models import Publication
-                # Check if Favorite model exists
-                try:
-                    from publications.models import Favorite
-                    publications = Publication.objects.filter(author=user)
-                    favorites_count = sum(p.favorites.count() for p in publications)
-                    progress = min(100, int((favorites_count / badge.requirement_count) * 100))
-                    return progress
-                except ImportError:
-                    # If Favorite model doesn't exist, assume 0 progress
-                    return 0
-            except (ImportError, ModuleNotFoundError):
-                return 0
-            
-        elif badge.requirement_type == 'forum_replies':
-            # Count user's forum replies
-            try:
-                from discussions.models import Reply
-                replies_count = Reply.objects.filter(author=user).count()
-                progress = min(100, int((replies_count / badge.requirement_count) * 100))
-                return progress
-            except (ImportError, ModuleNotFoundError):
-                return 0
-            
-        elif badge.requirement_type == 'followers_count':
-            # Count user's followers
-            try:
-                followers_count = Follow.objects.filter(following__user=user).count()
-                progress = min(100, int((followers_count / badge.requirement_count) * 100))
-                return progress
-            except Exception:
-                return 0
-            
-        elif badge.requirement_type == 'profile_completion':
-            # Check if profile is complete
-            try:
-                profile = Profile.objects.get(user=user)
-                fields = [profile.institution, profile.field_of_study, profile.bio, profile.website]
-                filled_fields = sum(1 for field in fields if field)
-                completion_percentage = (filled_fields / len(fields)) * 100
-                progress = min(100, int(completion_percentage))
-                return progress
-            except Exception:
-                return 0
-            
-        elif badge.requirement_type == 'forums_diversity':
-            # Check if user has posted in different forums
-            try:
-                from discussions.models import Forum, Topic, Reply
-                forums = Forum.objects.all()
-                forum_count = forums.count()
-                
-                if forum_count == 0:
-                    return 0
-                    
-                forums_participated = set()
-                for topic in Topic.objects.filter(author=user):
-                    forums_participated.add(topic.forum_id)
-                    
-                for reply in Reply.objects.filter(author=user):
-                    forums_participated.add(reply.topic.forum_id)
-                    
-                progress = min(100, int((len(forums_participated) / forum_count) * 100))
-                return progress
-            except (ImportError, ModuleNotFoundError):
-                return 0
-    except Exception:
-        # For any other unexpected error, return 0 progress
+    metric = REQUIREMENT_METRICS.get(badge.requirement_type)
+    if metric is None:
         return 0
-    
-    return 0
-
-def calculate_remaining_for_badge(user, badge, current_progress):
-    """Calculate what's remaining to earn a badge."""
-    try:
-        if current_progress >= 100:
-            return "Badge earned!"
-            
-        if badge.requirement_type == 'publications_count':
-            try:
-                from publications.models import Publication
-                count = Publication.objects.filter(author=user).count()
-                remaining = badge.requirement_count - count
-                return f"Need {remaining} more publications"
-            except (ImportError, ModuleNotFoundError):
-                return "Need publications"
-            
-        elif badge.requirement_type == 'publication_likes':
-            try:
-                from publications.models import Publication
-                try:
-                    from publications.models import Like
-                    publications = Publication.objects.filter(author=user)
-                    likes_count = sum(p.likes.count() for p in publications)
-                    remaining = badge.requirement_count - likes_count
-                    return f"Need {remaining} more likes"
-                except ImportError:
-                    return "Need likes on publications"
-            except (ImportError, ModuleNotFoundError):
-                return "Need likes on publications"
-            
-        elif badge.requirement_type == 'publication_favorites':
-            try:
-                from publications.models import Publication
-                try:
-                    from publications.models import Favorite
-                    publications = Publication.objects.filter(author=user)
-                    favorites_count = sum(p.favorites.count() for p in publications)
-                    remaining = badge.requirement_count - favorites_count
-                    return f"Need {remaining} more favorites"
-                except ImportError:
-                    return "Need favorites on publications"
-            except (ImportError, ModuleNotFoundError):
-                return "Need favorites on publications"
-            
-        elif badge.requirement_type == 'forum_replies':
-            try:
-                from discussions.models import Reply
-                replies_count = Reply.objects.filter(author=user).count()
-                remaining = badge.requirement_count - replies_count
-                return f"Need {remaining} more replies"
-            except (ImportError, ModuleNotFoundError):
-                return "Need forum replies"
-            
-        elif badge.requirement_type == 'followers_count':
-            try:
-                followers_count = Follow.objects.filter(following__user=user).count()
-                remaining = badge.requirement_count - followers_count
-                return f"Need {remaining} more followers"
-            except Exception:
-                return "Need followers"
-            
-        elif badge.requirement_type == 'profile_completion':
-            return "Complete your profile"
-            
-        elif badge.requirement_type == 'forums_diversity':
-            try:
-                from discussions.models import Forum, Topic, Reply
-                forums = Forum.objects.all()
-                
-                forums_participated = set()
-                for topic in Topic.objects.filter(author=user):
-                    forums_participated.add(topic.forum_id)
-                    
-                for reply in Reply.objects.filter(author=user):
-                    forums_participated.add(reply.topic.forum_id)
-                    
-                remaining = forums.count() - len(forums_participated)
-                return f"Participate in {remaining} more forums"
-            except (ImportError, ModuleNotFoundError):
-                return "Participate in forums"
-    except Exception:
-        return "Keep going!"
-    
-    return "Keep going!"
+    value = collect_metrics([metric], [user.pk])[metric].get(user.pk, 0)
+    forum_count = Forum.objects.count() if badge.requirement_type == 'forums_diversity' else 0
+    return badge_progress(badge, value, forum_count)
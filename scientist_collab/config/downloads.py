@@ -0,0 +1,183 @@
+"""
+Authorized file downloads.
+
+Media files are only routed by Django when DEBUG is on, so protected files
+(e.g. publication documents) are served through a view instead. The view
+checks permissions and then either:
+
+- hands the transfer off to the front proxy (DOCUMENT_DOWNLOAD_BACKEND set
+  to 'nginx' for X-Accel-Redirect, or 'apache' for X-Sendfile), so no Python
+  worker is held for the duration of the download, or
+- streams the file itself in chunks, with ETag/Last-Modified validation and
+  single byte-range requests so interrupted downloads can be resumed.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _file_metadata(field_file):
+    """Return (size, last modified timestamp or None) of a stored file."""
+    storage = field_file.storage
+    size = storage.size(field_file.name)
+    try:
+        modified = int(storage.get_modified_time(field_file.name).timestamp())
+    except (NotImplementedError, AttributeError):
+        modified = None
+    return size, modified
+
+
+def _make_etag(field_file, size, modified):
+    # Content-addressed storages know the hash of the file: use it as a strong validator
+    content_hash = getattr(field_file.storage, 'content_hash', None)
+    digest = content_hash(field_file.name) if content_hash else None
+    if digest:
+        return f'"{digest}"'
+    name = field_file.name
+    if modified is None:
+        return '"%x-%s"' % (size, hashlib.md5(name.encode('utf-8')).hexdigest()[:12])
+    return f'"{size:x}-{modified:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header for a single byte range.
+
+    Returns (start, end) with end inclusive, None when the header should be
+    ignored (missing, malformed or multiple ranges) and raises ValueError
+    when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(0, size - length), size - 1
+    if start >= size:
+        raise ValueError("Range starts after the end of the file")
+    return start, end
+
+
+def _iter_range(file, start, length, chunk_size=CHUNK_SIZE):
+    try:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def _proxy_response(field_file, backend):
+    response = HttpResponse()
+    if backend == 'nginx':
+        internal_url = getattr(settings, 'DOCUMENT_DOWNLOAD_INTERNAL_URL', '/protected-media/')
+        response['X-Accel-Redirect'] = internal_url + quote(field_file.name)
+    else:
+        response['X-Sendfile'] = field_file.path
+    # Let the proxy work out the content type
+    del response['Content-Type']
+    return response
+
+
+def serve_file(request, field_file, filename=None, content_type=None, as_attachment=True):
+    """
+    Return a response serving field_file to an already authorized user.
+    """
+    filename = filename or os.path.basename(field_file.name)
+    backend = getattr(settings, 'DOCUMENT_DOWNLOAD_BACKEND', '')
+
+    if backend in ('nginx', 'apache'):
+        response = _proxy_response(field_file, backend)
+    else:
+        response = _stream_response(request, field_file, filename, content_type, as_attachment)
+        if response.status_code == 304:
+            # Keeps the validators and caching policy of the response it revalidates
+            response['Cache-Control'] = 'private'
+            return response
+        if response.status_code not in (200, 206):
+            return response
+
+    if content_type:
+        response['Content-Type'] = content_type
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def _stream_response(request, field_file, filename, content_type, as_attachment):
+    size, modified = _file_metadata(field_file)
+    etag = _make_etag(field_file, size, modified)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+    if not_modified is not None:
+        if not_modified.status_code == 304:
+            _set_validators(not_modified, etag, modified)
+        return not_modified
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if request.method == 'GET' and (not if_range or _if_range_matches(if_range, etag, modified)):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = field_file.storage.open(field_file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=as_attachment, filename=filename, content_type=content_type)
+        response.block_size = CHUNK_SIZE
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_range(file, start, length),
+            status=206,
+            content_type=content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        )
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    _set_validators(response, etag, modified)
+    return response
+
+
+def _set_validators(response, etag, modified):
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+
+
+def _if_range_matches(if_range, etag, modified):
+    """Check whether the validator sent in If-Range still matches the file."""
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and modified is not None and modified <= if_range_date
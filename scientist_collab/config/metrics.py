@@ -0,0 +1,40 @@
+"""
+Lightweight counters kept in the cache backend.
+
+Counters are shared by the processes using the same cache (per process with
+the default local-memory cache) and are meant for rough operational figures
+such as cache hit rates, not for exact accounting. Callers should count a
+whole page's events at once rather than one cache round trip per object.
+"""
+from django.core.cache import cache
+
+KEY_PREFIX = 'metrics:'
+
+
+def incr(name, amount=1):
+    """Add amount to counter name."""
+    if not amount:
+        return
+    key = KEY_PREFIX + name
+    # add() is a no-op if the counter exists, so concurrent first increments don't reset it
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, amount, timeout=None)
+
+
+def get(name):
+    return cache.get(KEY_PREFIX + name, 0)
+
+
+def reset(*names):
+    cache.delete_many([KEY_PREFIX + name for name in names])
+
+
+def hit_rate(name):
+    """Return (hits, misses, hit rate or None) of the counters name.hit and name.miss."""
+    hits, misses = get(f'{name}.hit'), get(f'{name}.miss')
+    total = hits + misses
+    return hits, misses, (hits / total if total else None)
@@ -0,0 +1,242 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET/LIMIT, each page is fetched with a WHERE clause on the
+ordering columns of the last row of the previous page, e.g.
+
+    WHERE (publication_date, id) < (:last_date, :last_id)
+    ORDER BY publication_date DESC, id DESC LIMIT 11
+
+so page N costs the same as page 1 and no COUNT(*) is needed. Cursors are
+opaque, URL-safe tokens encoding those column values and a direction.
+"""
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.http import Http404
+
+APPROXIMATE_COUNT_CACHE_TIMEOUT = 300
+
+
+def encode_cursor(payload):
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise Http404("Invalid page cursor.")
+    if not isinstance(payload, dict) or payload.get('d') not in ('n', 'p'):
+        raise Http404("Invalid page cursor.")
+    return payload
+
+
+def _serialize(value):
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def _parse_ordering(ordering):
+    """Turn ('-created_at', 'id') into [('created_at', True), ('id', False)]."""
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def cursor_at(obj, ordering):
+    """Return a cursor for the page that starts with obj."""
+    values = [_serialize(getattr(obj, name)) for name, _ in _parse_ordering(ordering)]
+    return encode_cursor({'d': 'n', 'v': values, 'i': 1})
+
+
+def approximate_count(queryset):
+    """
+    Return a cheap estimate of queryset.count().
+
+    Unfiltered MySQL tables use the row estimate kept by the storage engine;
+    everything else falls back to an exact count cached for a few minutes.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if not queryset.query.where and connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] is not None:
+            return row[0]
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except Exception:
+        return queryset.count()
+    cache_key = 'keyset:count:' + hashlib.md5(f'{sql}{params}'.encode('utf-8')).hexdigest()
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, APPROXIMATE_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class KeysetPage:
+    """One page of keyset-paginated results."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, approximate_total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_total = approximate_total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by its ordering columns.
+
+    The ordering must be unique (end with the primary key) and the columns
+    should be covered by a composite index. Sequences that are not
+    querysets (e.g. ranked search results) are paginated by offset instead,
+    using the same opaque cursors.
+    """
+
+    def __init__(self, ordering, page_size, with_total=False):
+        self.ordering = _parse_ordering(ordering)
+        self.page_size = page_size
+        self.with_total = with_total
+
+    def paginate(self, object_list, cursor=None):
+        payload = decode_cursor(cursor) if cursor else None
+        if isinstance(object_list, QuerySet):
+            return self._paginate_queryset(object_list, payload)
+        return self._paginate_sequence(object_list, payload)
+
+    def _cursor_for(self, obj, direction):
+        values = [_serialize(getattr(obj, name)) for name, _ in self.ordering]
+        return encode_cursor({'d': direction, 'v': values})
+
+    def _filter_after(self, queryset, values, backwards, inclusive=False):
+        """Build the WHERE clause selecting rows after (or before) the given values."""
+        model = queryset.model
+        condition = Q()
+        equal = Q()
+        for index, ((name, descending), value) in enumerate(zip(self.ordering, values)):
+            try:
+                # Columns of the model, or annotations such as a last activity time
+                annotation = queryset.query.annotations.get(name)
+                field = annotation.output_field if annotation is not None else model._meta.get_field(name)
+                value = field.to_python(value)
+            except Exception:
+                pass
+            lookup = 'lt' if descending != backwards else 'gt'
+            if inclusive and index == len(self.ordering) - 1:
+                lookup += 'e'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return queryset.filter(condition)
+
+    def _paginate_queryset(self, queryset, payload):
+        backwards = bool(payload) and payload['d'] == 'p'
+        order_by = [
+            ('-' if descending != backwards else '') + name
+            for name, descending in self.ordering
+        ]
+
+        page_queryset = queryset
+        if payload:
+            values = payload.get('v')
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise Http404("Invalid page cursor.")
+            page_queryset = self._filter_after(queryset, values, backwards, bool(payload.get('i')))
+
+        rows = list(page_queryset.order_by(*order_by)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            # Walking backwards we came from the next page; forwards, from the previous one
+            if backwards or has_more:
+                next_cursor = self._cursor_for(rows[-1], 'n')
+            if (backwards and has_more) or (payload and not backwards):
+                previous_cursor = self._cursor_for(rows[0], 'p')
+
+        total = approximate_count(queryset) if self.with_total else None
+        return KeysetPage(rows, next_cursor, previous_cursor, total)
+
+    def _paginate_sequence(self, sequence, payload):
+        offset = 0
+        if payload:
+            try:
+                offset = max(0, int(payload.get('o', 0)))
+            except (TypeError, ValueError):
+                raise Http404("Invalid page cursor.")
+            if payload['d'] == 'p':
+                offset = max(0, offset - self.page_size)
+
+        rows = list(sequence[offset:offset + self.page_size + 1])
+        next_cursor = previous_cursor = None
+        if len(rows) > self.page_size:
+            next_cursor = encode_cursor({'d': 'n', 'o': offset + self.page_size})
+        if offset > 0:
+            previous_cursor = encode_cursor({'d': 'p', 'o': offset})
+        total = len(sequence) if self.with_total else None
+        return KeysetPage(rows[:self.page_size], next_cursor, previous_cursor, total)
+
+
+class KeysetPaginationMixin:
+    """
+    View mixin adding keyset pagination.
+
+    Set keyset_ordering (ending with the primary key) and keyset_page_size,
+    then call paginate_keyset() on the queryset to display. Alternative
+    orderings selectable with ?sort= go in keyset_sort_orderings.
+    """
+    keyset_ordering = ('-created_at', '-id')
+    keyset_sort_orderings = {}
+    keyset_page_size = 10
+    keyset_cursor_param = 'cursor'
+    keyset_sort_param = 'sort'
+    keyset_with_total = False
+
+    def get_keyset_ordering(self):
+        sort = self.request.GET.get(self.keyset_sort_param)
+        return self.keyset_sort_orderings.get(sort, self.keyset_ordering)
+
+    def get_keyset_paginator(self):
+        return KeysetPaginator(self.get_keyset_ordering(), self.keyset_page_size, self.keyset_with_total)
+
+    def paginate_keyset(self, object_list):
+        cursor = self.request.GET.get(self.keyset_cursor_param)
+        return self.get_keyset_paginator().paginate(object_list, cursor)
@@ -0,0 +1,187 @@
+"""
+Like/dislike toggling with denormalized counters.
+
+Reactions are stored in the ManyToMany tables (e.g. Publication.likes) and
+mirrored in integer columns (e.g. Publication.like_count) so pages and AJAX
+responses never have to COUNT(*) the M2M tables.
+
+Pages showing what the current user reacted to load it for the whole page
+at once with load_viewer_state() / annotate_viewer_state().
+
+Rows are written to the M2M tables directly, which sends no signal, so
+toggle_reaction() sends m2m_changed itself, as the related managers do.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models.signals import m2m_changed
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _through(model, field_name):
+    """Return (through model, source column, user column) of a M2M field."""
+    field = model._meta.get_field(field_name)
+    return (
+        field.remote_field.through,
+        field.m2m_field_name() + '_id',
+        field.m2m_reverse_field_name() + '_id',
+    )
+
+
+def _send_changed(obj, field_name, action, user):
+    """Send the post_add/post_remove m2m_changed signal of obj.<field_name>.add/remove(user)."""
+    field = type(obj)._meta.get_field(field_name)
+    m2m_changed.send(
+        sender=field.remote_field.through, instance=obj, action=action, reverse=False,
+        model=field.related_model, pk_set={user.pk}, using=obj._state.db,
+    )
+
+
+def toggle_reaction(obj, user, field_name, counter, opposite=None, opposite_counter=None):
+    """
+    Toggle a user's reaction on obj and keep the counters in sync.
+
+    The reaction is removed if it exists and added otherwise; the opposite
+    reaction (e.g. a dislike when liking) is always removed. Counters are
+    updated with F() expressions in the same transaction, then read back
+    onto obj; both are skipped if no row changed.
+
+    This costs one DELETE per relation, an INSERT in a savepoint when
+    adding, then one UPDATE and one SELECT of the counters; nothing is read
+    before writing.
+
+    Returns True if the reaction was added, False if it was removed, and
+    None if a concurrent toggle had already added it, so callers only
+    notify on a real insert.
+    """
+    model = type(obj)
+    deltas = {}
+    changes = []
+
+    with transaction.atomic():
+        if opposite:
+            through, source, target = _through(model, opposite)
+            removed, _ = through.objects.filter(**{source: obj.pk, target: user.pk}).delete()
+            if removed:
+                deltas[opposite_counter] = -removed
+                changes.append((opposite, 'post_remove'))
+
+        through, source, target = _through(model, field_name)
+        removed, _ = through.objects.filter(**{source: obj.pk, target: user.pk}).delete()
+        if removed:
+            added = False
+            deltas[counter] = -removed
+            changes.append((field_name, 'post_remove'))
+        else:
+            added = True
+            try:
+                # In a savepoint: a concurrent toggle may have inserted the row since the delete
+                with transaction.atomic():
+                    through.objects.create(**{source: obj.pk, target: user.pk})
+            except IntegrityError:
+                added = None
+            else:
+                deltas[counter] = 1
+                changes.append((field_name, 'post_add'))
+
+        if deltas:
+            model.objects.filter(pk=obj.pk).update(
+                **{name: F(name) + delta for name, delta in deltas.items()}
+            )
+        for name, action in changes:
+            _send_changed(obj, name, action, user)
+
+    if deltas:
+        counters = [counter] + ([opposite_counter] if opposite_counter else [])
+        obj.refresh_from_db(fields=counters)
+    return added
+
+
+def count_subquery(model, field_name):
+    """Subquery counting the rows of a M2M field for the outer object."""
+    through, source, _ = _through(model, field_name)
+    return Coalesce(
+        Subquery(
+            through.objects.filter(**{source: OuterRef('pk')})
+            .order_by()
+            .values(source)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def reconcile_counter(model, field_name, counter, batch_size=1000, dry_run=False):
+    """
+    Repair a denormalized counter against its M2M table.
+
+    Drifted rows are found with a single annotated query and fixed with
+    bulk_update. Returns the number of rows that were out of sync.
+    """
+    drifted = list(
+        model.objects.annotate(actual=count_subquery(model, field_name))
+        .exclude(**{counter: F('actual')})
+        .only('pk', counter)
+    )
+    for obj in drifted:
+        setattr(obj, counter, obj.actual)
+    if drifted and not dry_run:
+        model.objects.bulk_update(drifted, [counter], batch_size=batch_size)
+    return len(drifted)
+
+
+class ViewerState:
+    """The reactions of one viewer on a batch of objects, as sets of ids."""
+
+    def __init__(self, liked=(), disliked=(), favorited=()):
+        self.liked = set(liked)
+        self.disliked = set(disliked)
+        self.favorited = set(favorited)
+
+    def annotate(self, objects):
+        """Set viewer_liked, viewer_disliked and viewer_favorited on each object."""
+        for obj in objects:
+            obj.viewer_liked = obj.pk in self.liked
+            obj.viewer_disliked = obj.pk in self.disliked
+            obj.viewer_favorited = obj.pk in self.favorited
+        return objects
+
+
+def load_viewer_state(user, model, ids, favorites=None):
+    """
+    Load which of the given objects a user liked, disliked or favorited.
+
+    Runs one query per relation the model has (likes, dislikes) plus one for
+    favorites, given as (bookmark model, name of its foreign key to model),
+    whatever the number of ids. Anonymous viewers cost no query.
+    """
+    ids = [pk for pk in ids if pk is not None]
+    if not ids or not user.is_authenticated:
+        return ViewerState()
+
+    sets = {}
+    for name, field_name in (('liked', 'likes'), ('disliked', 'dislikes')):
+        try:
+            through, source, target = _through(model, field_name)
+        except FieldDoesNotExist:
+            continue
+        sets[name] = through.objects.filter(**{f'{source}__in': ids, target: user.pk}).values_list(source, flat=True)
+
+    if favorites:
+        favorite_model, field_name = favorites
+        sets['favorited'] = favorite_model.objects.filter(
+            **{f'{field_name}_id__in': ids, 'user_id': user.pk}
+        ).values_list(f'{field_name}_id', flat=True)
+
+    return ViewerState(**sets)
+
+
+def annotate_viewer_state(user, objects, favorites=None):
+    """Load the viewer state of a list of objects and set it on them."""
+    objects = list(objects)
+    if not objects:
+        return ViewerState()
+    state = load_viewer_state(user, type(objects[0]), [obj.pk for obj in objects], favorites)
+    state.annotate(objects)
+    return state
@@ -231,10 +231,32 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Outside development, static files get content-hashed names (collectstatic
+# writes the manifest) so they can be served with far-future cache headers
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+    },
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Protected document downloads, see config.downloads
+# '' streams files from Django, 'nginx' uses X-Accel-Redirect, 'apache' uses X-Sendfile
+DOCUMENT_DOWNLOAD_BACKEND = os.getenv('DOCUMENT_DOWNLOAD_BACKEND', '')
+# Internal nginx location aliased to MEDIA_ROOT
+DOCUMENT_DOWNLOAD_INTERNAL_URL = os.getenv('DOCUMENT_DOWNLOAD_INTERNAL_URL', '/protected-media/')
+
+# Hours after which a like, favorite or reply counts half towards trending scores, see config.trending
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', '48'))
+
+# Extract uploaded PDF text in a background thread (False runs it inline, e.g. in tests)
+DOCUMENT_TEXT_EXTRACTION_ASYNC = os.getenv('DOCUMENT_TEXT_EXTRACTION_ASYNC', 'True').lower() == 'true'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
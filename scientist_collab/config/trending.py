@@ -0,0 +1,134 @@
+"""
+Trending scores with exponential time decay.
+
+Each trending object (a publication, a topic) has a rollup row holding a
+score and the time it was last decayed. Events add their weight to the
+score after decaying it to the present:
+
+    score = score * 0.5 ** (hours since decayed_at / half life) + weight
+
+so an event counts half as much after TRENDING_HALF_LIFE_HOURS. Rows are
+only touched when something happens to their object; the
+decay_trending_scores command periodically decays every row to the present
+(and drops the ones that faded out) so that ordering by the indexed score
+column stays accurate for objects nobody reacted to lately.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+# Weight of each kind of event
+WEIGHTS = {
+    'create': 1.0,
+    'like': 1.0,
+    'favorite': 2.0,
+    'reply': 2.0,
+}
+
+# Rows decayed below this score are deleted by decay_all()
+MIN_SCORE = 0.01
+
+
+def get_half_life_hours():
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48)
+
+
+def decay_factor(since, now):
+    """Return the factor a score decays by between since and now."""
+    hours = max((now - since).total_seconds(), 0) / 3600
+    return 0.5 ** (hours / get_half_life_hours())
+
+
+def record_event(model, key, weight, now=None, **defaults):
+    """
+    Add an event of the given weight to the trend row of object key.
+
+    Negative weights (an unlike, an unfavorite) take back a contribution,
+    never below zero. defaults are the extra columns of a new row, e.g. the
+    denormalized forum of a topic.
+    """
+    if not weight:
+        return
+    now = now or timezone.now()
+    with transaction.atomic():
+        row = model.objects.select_for_update().filter(pk=key).first()
+        if row is None:
+            if weight < 0:
+                return
+            try:
+                with transaction.atomic():
+                    model.objects.create(pk=key, score=weight, decayed_at=now, **defaults)
+                return
+            except IntegrityError:
+                # Created concurrently, add to the existing row
+                row = model.objects.select_for_update().get(pk=key)
+        row.score = max(row.score * decay_factor(row.decayed_at, now) + weight, 0.0)
+        row.decayed_at = now
+        row.save(update_fields=['score', 'decayed_at'])
+
+
+def record_reaction(model, key, like_delta, **defaults):
+    """Record a change of like_count (+1, -1 or 0) as a trending event."""
+    record_event(model, key, like_delta * WEIGHTS['like'], **defaults)
+
+
+def decay_all(model, batch_size=1000, now=None):
+    """
+    Decay every trend row of model to now and delete the ones below MIN_SCORE.
+
+    Rows are processed in primary key order, batch_size rows per transaction,
+    each batch locked so concurrent events are not overwritten.
+
+    Returns (decayed, deleted) row counts.
+    """
+    now = now or timezone.now()
+    decayed = deleted = 0
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            queryset = model.objects.select_for_update().order_by('pk')
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            rows = list(queryset[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+
+            faded = []
+            for row in rows:
+                row.score *= decay_factor(row.decayed_at, now)
+                row.decayed_at = now
+                if row.score < MIN_SCORE:
+                    faded.append(row.pk)
+            model.objects.bulk_update(rows, ['score', 'decayed_at'])
+            if faded:
+                model.objects.filter(pk__in=faded).delete()
+        decayed += len(rows) - len(faded)
+        deleted += len(faded)
+        if len(rows) < batch_size:
+            break
+    return decayed, deleted
+
+
+def seed_scores(model, events, now=None):
+    """
+    Create trend rows from past events, replacing existing rows.
+
+    events yields (key, weight, occurred_at, defaults); weights are decayed
+    from occurred_at to now, so a rebuilt table matches what the incremental
+    updates would have produced. Returns the number of rows written.
+    """
+    now = now or timezone.now()
+    scores = {}
+    for key, weight, occurred_at, defaults in events:
+        score, _ = scores.get(key, (0.0, defaults))
+        scores[key] = (score + weight * decay_factor(occurred_at, now), defaults)
+
+    rows = [
+        model(pk=key, score=score, decayed_at=now, **defaults)
+        for key, (score, defaults) in scores.items() if score >= MIN_SCORE
+    ]
+    with transaction.atomic():
+        model.objects.all().delete()
+        model.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
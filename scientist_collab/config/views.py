@@ -1,17 +1,36 @@
 from django.shortcuts import render
-from publications.models import Publication
-from discussions.models import Topic
+from publications.models import Publication, PublicationTrend, Favorite
+from discussions.models import Topic, TopicTrend
+from .reactions import annotate_viewer_state
 
 def home_view(request):
     """
-    View for the home page showing recent publications and discussions
+    View for the home page showing trending and recent publications and discussions
     """
-    recent_publications = Publication.objects.all().order_by('-created_at')[:3]
-    recent_discussions = Topic.objects.all().order_by('-created_at')[:5]
+    recent_publications = list(Publication.objects.select_related('author').order_by('-created_at')[:3])
+    recent_discussions = list(Topic.objects.select_related('author').order_by('-created_at')[:5])
+    
+    # Highest trending scores, read from the score indexes of the rollup tables
+    trending_publications = [
+        trend.publication for trend in
+        PublicationTrend.objects.select_related('publication__author').order_by('-score', '-publication_id')[:3]
+    ]
+    hot_discussions = [
+        trend.topic for trend in
+        TopicTrend.objects.select_related('topic__author').order_by('-score', '-topic_id')[:5]
+    ]
+    
+    # What the viewer liked or favorited, one query per relation
+    annotate_viewer_state(
+        request.user, recent_publications + trending_publications, favorites=(Favorite, 'publication')
+    )
+    annotate_viewer_state(request.user, recent_discussions + hot_discussions)
     
     context = {
         'recent_publications': recent_publications,
-        'recent_discussions': recent_discussions
+        'recent_discussions': recent_discussions,
+        'trending_publications': trending_publications,
+        'hot_discussions': hot_discussions,
     }
     
     return render(request, 'base/home.html', context) 
\ No newline at end of file
@@ -3,22 +3,18 @@ from .models import Forum, Topic, Reply
 
 @admin.register(Forum)
 class ForumAdmin(admin.ModelAdmin):
-    list_display = ('name', 'created_at', 'topic_count')
+    list_display = ('name', 'created_at', 'topic_count', 'reply_count', 'last_post_at', 'last_post_author')
     search_fields = ('name', 'description')
-    
-    def topic_count(self, obj):
-        return obj.topics.count()
-    topic_count.short_description = 'Topics'
+    list_select_related = ('last_post_author',)
+    readonly_fields = ('topic_count', 'reply_count', 'last_post_at', 'last_post_author')
 
 @admin.register(Topic)
 class TopicAdmin(admin.ModelAdmin):
     list_display = ('title', 'forum', 'author', 'created_at', 'reply_count')
     list_filter = ('forum', 'created_at')
     search_fields = ('title', 'content', 'author__username')
-    
-    def reply_count(self, obj):
-        return obj.replies.count()
-    reply_count.short_description = 'Replies'
+    list_select_related = ('forum', 'author')
+    readonly_fields = ('reply_count', 'last_reply_at')
 
 @admin.register(Reply)
 class ReplyAdmin(admin.ModelAdmin):
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Topic, Reply
+from .models import Forum, Topic, Reply
 
 class TopicForm(forms.ModelForm):
     class Meta:
@@ -12,10 +12,28 @@ class TopicForm(forms.ModelForm):
 class ReplyForm(forms.ModelForm):
     class Meta:
         model = Reply
-        fields = ['content']
+        fields = ['content', 'parent']
         widgets = {
             'content': forms.Textarea(attrs={'rows': 3}),
+            'parent': forms.HiddenInput(),
         }
         labels = {
             'content': 'Your Response',
-        } 
\ No newline at end of file
+        } 
+    
+    def __init__(self, *args, topic=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only replies of the same topic can be answered
+        if topic is not None:
+            self.fields['parent'].queryset = topic.replies.all()
+
+class DiscussionSearchForm(forms.Form):
+    q = forms.CharField(label='Search', max_length=200, required=False)
+    forum = forms.ModelChoiceField(queryset=Forum.objects.all(), required=False, empty_label='All forums')
+    author = forms.CharField(max_length=150, required=False, help_text='Username')
+    solved = forms.TypedChoiceField(
+        choices=[('', 'Solved or not'), ('yes', 'Solved'), ('no', 'Unsolved')],
+        coerce=lambda value: value == 'yes', empty_value=None, required=False
+    )
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from config import metrics
+
+class Command(BaseCommand):
+    help = 'Reports the hit rate of the stored rendered content of topics and replies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after reporting')
+
+    def handle(self, *args, **options):
+        hits, misses, rate = metrics.hit_rate('post_render')
+        if rate is None:
+            self.stdout.write('No posts rendered since the counters were reset')
+        else:
+            self.stdout.write(f'Rendered content: {hits} hits, {misses} misses, {rate:.1%} hit rate')
+        if options['reset']:
+            metrics.reset('post_render.hit', 'post_render.miss')
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from discussions.models import Topic, Reply, PostSearchDocument, PostSearchPosting
+from discussions.search import build_documents, invalidate_stats
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of topics and replies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of posts indexed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write('Clearing the discussion search index...')
+        PostSearchDocument.objects.all().delete()
+
+        indexed = 0
+        topics = Topic.objects.only('pk', 'title', 'content', 'forum_id', 'author_id', 'created_at').order_by('pk')
+        replies = (
+            Reply.objects.select_related('topic')
+            .only('pk', 'content', 'author_id', 'created_at', 'topic__forum_id')
+            .order_by('pk')
+        )
+        for queryset, kind in ((topics, 'topics'), (replies, 'replies')):
+            batch = []
+            for post in queryset.iterator(chunk_size=batch_size):
+                batch.append(post)
+                if len(batch) >= batch_size:
+                    indexed += self._flush(batch, kind, batch_size)
+                    self.stdout.write(f'Indexed {indexed} posts')
+            indexed += self._flush(batch, kind, batch_size)
+        invalidate_stats()
+
+        self.stdout.write(self.style.SUCCESS(f'Discussion search index rebuilt: {indexed} posts indexed'))
+
+    def _flush(self, batch, kind, batch_size):
+        entries = list(build_documents(batch, []) if kind == 'topics' else build_documents([], batch))
+        documents = [document for document, _ in entries]
+        PostSearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+        # Not every database returns the ids of bulk-created rows, read them back
+        if kind == 'topics':
+            ids = dict(PostSearchDocument.objects.filter(
+                topic_id__in=[d.topic_id for d in documents], reply__isnull=True
+            ).values_list('topic_id', 'pk'))
+            for document in documents:
+                document.pk = ids[document.topic_id]
+        else:
+            ids = dict(PostSearchDocument.objects.filter(
+                reply_id__in=[d.reply_id for d in documents]
+            ).values_list('reply_id', 'pk'))
+            for document in documents:
+                document.pk = ids[document.reply_id]
+        PostSearchPosting.objects.bulk_create(
+            [posting for _, postings in entries for posting in postings], batch_size=batch_size * 10
+        )
+        batch.clear()
+        return len(documents)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from discussions.models import Topic, TopicSignature, TopicBucket
+from discussions.similarity import build_buckets, signatures
+
+class Command(BaseCommand):
+    help = 'Rebuilds the MinHash/LSH index used to find similar topics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of topics indexed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write('Clearing the similarity index...')
+        TopicBucket.objects.all().delete()
+        TopicSignature.objects.all().delete()
+
+        indexed = 0
+        rows, buckets = [], []
+        for topic in Topic.objects.only('pk', 'title', 'content').order_by('pk').iterator(chunk_size=batch_size):
+            title_signature, content_signature = signatures(topic.title, topic.content)
+            rows.append(TopicSignature(topic_id=topic.pk, title_minhash=title_signature, content_minhash=content_signature))
+            buckets.extend(build_buckets(topic.pk, title_signature, content_signature))
+            if len(rows) >= batch_size:
+                indexed += self._flush(rows, buckets, batch_size)
+                self.stdout.write(f'Indexed {indexed} topics')
+        indexed += self._flush(rows, buckets, batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f'Similarity index rebuilt: {indexed} topics indexed'))
+
+    def _flush(self, rows, buckets, batch_size):
+        TopicSignature.objects.bulk_create(rows, batch_size=batch_size)
+        TopicBucket.objects.bulk_create(buckets, batch_size=batch_size * 10)
+        count = len(rows)
+        rows.clear()
+        buckets.clear()
+        return count
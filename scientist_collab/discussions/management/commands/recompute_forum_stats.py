@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from discussions.models import Forum, Topic, Reply
+from discussions.stats import recompute_stats
+
+class Command(BaseCommand):
+    help = 'Repairs the denormalized topic and reply statistics of forums and topics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows written per bulk update')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing changes')
+
+    def handle(self, *args, **options):
+        topics, forums = recompute_stats(
+            Forum, Topic, Reply,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run']
+        )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {topics} topics and {forums} forums would be repaired'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Forum statistics recomputed: {topics} topics and {forums} forums repaired'))
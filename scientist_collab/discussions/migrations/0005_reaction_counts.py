@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:13
+
+from django.db import migrations, models
+
+
+def populate_counts(apps, schema_editor):
+    from config.reactions import count_subquery
+
+    Topic = apps.get_model('discussions', 'Topic')
+    Topic.objects.update(like_count=count_subquery(Topic, 'likes'), dislike_count=count_subquery(Topic, 'dislikes'))
+    Reply = apps.get_model('discussions', 'Reply')
+    Reply.objects.update(like_count=count_subquery(Reply, 'likes'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0004_topic_is_solved_topic_solution'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicTrend',
+            fields=[
+                ('topic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='discussions.topic')),
+                ('score', models.FloatField(default=0)),
+                ('decayed_at', models.DateTimeField()),
+                ('forum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='discussions.forum')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-topic'], name='topic_trend_score_idx'), models.Index(fields=['forum', '-score', '-topic'], name='topic_trend_forum_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+# Frozen copy of discussions.stats.recompute_stats as of this migration, which later
+# versions extend to columns these historical models don't have
+def populate_stats(apps, schema_editor):
+    Forum = apps.get_model('discussions', 'Forum')
+    Topic = apps.get_model('discussions', 'Topic')
+    Reply = apps.get_model('discussions', 'Reply')
+
+    def grouped(queryset, field):
+        rows = queryset.order_by().values(field).annotate(total=Count('pk'), last=Max('created_at'))
+        return {row[field]: (row['total'], row['last']) for row in rows}
+
+    reply_stats = grouped(Reply.objects, 'topic')
+    topic_stats = grouped(Topic.objects, 'forum')
+    forum_reply_stats = grouped(Reply.objects, 'topic__forum')
+
+    batch = []
+    for topic in Topic.objects.only('pk').order_by('pk').iterator(chunk_size=1000):
+        topic.reply_count, topic.last_reply_at = reply_stats.get(topic.pk, (0, None))
+        batch.append(topic)
+        if len(batch) >= 1000:
+            Topic.objects.bulk_update(batch, ['reply_count', 'last_reply_at'])
+            batch = []
+    Topic.objects.bulk_update(batch, ['reply_count', 'last_reply_at'])
+
+    forums = list(Forum.objects.all())
+    for forum in forums:
+        forum.topic_count, last_topic_at = topic_stats.get(forum.pk, (0, None))
+        forum.reply_count, last_reply_at = forum_reply_stats.get(forum.pk, (0, None))
+        forum.last_post_at = max(filter(None, (last_topic_at, last_reply_at)), default=None)
+        forum.last_post_author_id = None
+        if forum.last_post_at is not None:
+            # Ties between a topic and a reply go to the reply
+            source = (
+                Reply.objects.filter(topic__forum=forum.pk)
+                if forum.last_post_at == last_reply_at else Topic.objects.filter(forum=forum.pk)
+            )
+            forum.last_post_author_id = (
+                source.filter(created_at=forum.last_post_at).order_by('-pk').values_list('author_id', flat=True).first()
+            )
+    Forum.objects.bulk_update(
+        forums, ['topic_count', 'reply_count', 'last_post_at', 'last_post_author'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0007_topic_trend'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forum',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forum',
+            name='last_post_author',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='forum',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='forum',
+            name='topic_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='last_reply_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
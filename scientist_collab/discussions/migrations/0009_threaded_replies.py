@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of discussions.models.path_segment as of this migration
+def path_segment(pk):
+    digits = []
+    while pk:
+        pk, digit = divmod(pk, 36)
+        digits.append('0123456789abcdefghijklmnopqrstuvwxyz'[digit])
+    return ''.join(reversed(digits)).rjust(8, '0')
+
+
+def populate_paths(apps, schema_editor):
+    # Existing replies become top-level replies, in id order
+    Reply = apps.get_model('discussions', 'Reply')
+    batch = []
+    for reply in Reply.objects.only('pk').order_by('pk').iterator(chunk_size=1000):
+        reply.path = path_segment(reply.pk)
+        batch.append(reply)
+        if len(batch) == 1000:
+            Reply.objects.bulk_update(batch, ['path'])
+            batch = []
+    Reply.objects.bulk_update(batch, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0008_forum_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='discussions.reply'),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=56),
+        ),
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(fields=['topic', 'path'], name='reply_topic_path_idx'),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
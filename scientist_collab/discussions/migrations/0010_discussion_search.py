@@ -0,0 +1,75 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_index(apps, schema_editor):
+    from discussions.search import analyze_post
+    from publications.search import encode_positions
+
+    Topic = apps.get_model('discussions', 'Topic')
+    Reply = apps.get_model('discussions', 'Reply')
+    PostSearchDocument = apps.get_model('discussions', 'PostSearchDocument')
+    PostSearchPosting = apps.get_model('discussions', 'PostSearchPosting')
+
+    def index(topic, reply=None):
+        source = reply or topic
+        length, checksum, postings = analyze_post(topic.title if reply is None else '', source.content)
+        document = PostSearchDocument.objects.create(
+            topic_id=topic.pk, reply_id=reply and reply.pk, forum_id=topic.forum_id, author_id=source.author_id,
+            created_at=source.created_at, length=length, checksum=checksum,
+        )
+        PostSearchPosting.objects.bulk_create([
+            PostSearchPosting(term=term, document=document, weight=weight, positions=encode_positions(positions))
+            for term, (weight, positions) in postings.items()
+        ])
+
+    for topic in Topic.objects.iterator(chunk_size=500):
+        index(topic)
+    for reply in Reply.objects.select_related('topic').iterator(chunk_size=500):
+        index(reply.topic, reply)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0009_threaded_replies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='reply',
+            options={'ordering': ['path'], 'verbose_name_plural': 'Replies'},
+        ),
+        migrations.CreateModel(
+            name='PostSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('length', models.FloatField(default=0)),
+                ('checksum', models.CharField(max_length=40)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('forum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='discussions.forum')),
+                ('reply', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='discussions.reply')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='discussions.topic')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostSearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('positions', models.TextField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='discussions.postsearchdocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', '-weight'], name='post_posting_term_weight_idx')],
+                'unique_together': {('term', 'document')},
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:11
+
+from django.db import migrations, models
+
+
+def render_posts(apps, schema_editor):
+    from discussions.shortcodes import render_content
+
+    for model_name in ('Topic', 'Reply'):
+        model = apps.get_model('discussions', model_name)
+        batch = []
+        for post in model.objects.only('pk', 'content').iterator(chunk_size=500):
+            post.content_ast, post.content_html, post.content_modules = render_content(post.content)
+            batch.append(post)
+            if len(batch) >= 500:
+                model.objects.bulk_update(batch, ['content_ast', 'content_html', 'content_modules'])
+                batch = []
+        model.objects.bulk_update(batch, ['content_ast', 'content_html', 'content_modules'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0011_read_marks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='content_ast',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='content_html',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='content_modules',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='content_ast',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='content_html',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='content_modules',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(render_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_index(apps, schema_editor):
+    from discussions.similarity import bucket_keys, signatures
+
+    Topic = apps.get_model('discussions', 'Topic')
+    TopicSignature = apps.get_model('discussions', 'TopicSignature')
+    TopicBucket = apps.get_model('discussions', 'TopicBucket')
+
+    for topic in Topic.objects.only('pk', 'title', 'content').iterator(chunk_size=500):
+        title_signature, content_signature = signatures(topic.title, topic.content)
+        TopicSignature.objects.create(topic_id=topic.pk, title_minhash=title_signature, content_minhash=content_signature)
+        keys = set(bucket_keys(title_signature, 'title')) | set(bucket_keys(content_signature, 'content'))
+        TopicBucket.objects.bulk_create([TopicBucket(bucket=key, topic_id=topic.pk) for key in keys])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0012_rendered_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicSignature',
+            fields=[
+                ('topic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='discussions.topic')),
+                ('title_minhash', models.JSONField(default=list)),
+                ('content_minhash', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TopicBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField()),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='discussions.topic')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket', 'topic'], name='topic_bucket_idx')],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:02
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def checksum_rendered_posts(apps, schema_editor):
+    # Posts rendered so far were rendered from their current content; the others stay
+    # without a checksum and are rendered when shown
+    for model_name in ('Topic', 'Reply'):
+        model = apps.get_model('discussions', model_name)
+        batch = []
+        for post in model.objects.exclude(content_html='').only('pk', 'content').iterator(chunk_size=500):
+            post.content_checksum = hashlib.sha1(post.content.encode('utf-8')).hexdigest()
+            batch.append(post)
+            if len(batch) >= 500:
+                model.objects.bulk_update(batch, ['content_checksum'])
+                batch = []
+        model.objects.bulk_update(batch, ['content_checksum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0013_similarity_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='content_checksum',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='content_checksum',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.RunPython(checksum_rendered_posts, migrations.RunPython.noop),
+    ]
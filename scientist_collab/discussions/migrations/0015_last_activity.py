@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:20
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_last_activity(apps, schema_editor):
+    Forum = apps.get_model('discussions', 'Forum')
+    Topic = apps.get_model('discussions', 'Topic')
+    Forum.objects.update(last_activity_at=Coalesce('last_post_at', 'created_at'))
+    Topic.objects.update(last_activity_at=Coalesce('last_reply_at', 'created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0014_content_checksum'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forum',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(populate_last_activity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='forum_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topic',
+            index=models.Index(fields=['forum', '-last_activity_at', '-id'], name='topic_forum_activity_idx'),
+        ),
+    ]
@@ -1,11 +1,49 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
+
+# Display order of replies within a topic (also the keyset pagination key):
+# depth-first by materialized path, see Reply.path
+REPLY_ORDERING = ('path',)
+
+# Replies are nested at most this deep, deeper replies go to the deepest ancestor allowed
+MAX_REPLY_DEPTH = 6
+
+# Width of one path segment, the base-36 reply id
+PATH_SEGMENT_WIDTH = 8
+PATH_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def path_segment(pk):
+    """Encode a reply id as a fixed-width, lexicographically sortable path segment."""
+    digits = []
+    while pk:
+        pk, digit = divmod(pk, 36)
+        digits.append(PATH_DIGITS[digit])
+    return ''.join(reversed(digits)).rjust(PATH_SEGMENT_WIDTH, '0')
+
+
+def path_successor(path):
+    """Return the first path after every descendant of path (its last segment plus one)."""
+    last = int(path[-PATH_SEGMENT_WIDTH:], 36)
+    return path[:-PATH_SEGMENT_WIDTH] + path_segment(last + 1)
+
+# Forum columns maintained by discussions.stats
+FORUM_STATS_FIELDS = ('topic_count', 'reply_count', 'last_post_at', 'last_post_author_id', 'last_activity_at')
 
 class Forum(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized statistics, see discussions.stats
+    topic_count = models.PositiveIntegerField(default=0)
+    reply_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(null=True, blank=True)
+    last_post_author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now)  # last_post_at, or created_at without posts
     
     def __str__(self):
         return self.name
@@ -15,6 +53,10 @@ class Forum(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Keyset pagination of ?sort=activity, see config.pagination
+            models.Index(fields=['-last_activity_at', '-id'], name='forum_activity_idx'),
+        ]
 
 class Topic(models.Model):
     title = models.CharField(max_length=200)
@@ -25,8 +67,18 @@ class Topic(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name='liked_topics', blank=True)
     dislikes = models.ManyToManyField(User, related_name='disliked_topics', blank=True)
+    like_count = models.PositiveIntegerField(default=0)  # Denormalized likes.count(), see config.reactions
+    dislike_count = models.PositiveIntegerField(default=0)  # Denormalized dislikes.count()
     solution = models.ForeignKey('Reply', on_delete=models.SET_NULL, null=True, blank=True, related_name='solved_topic')
     is_solved = models.BooleanField(default=False)
+    reply_count = models.PositiveIntegerField(default=0)  # Denormalized replies.count(), see discussions.stats
+    last_reply_at = models.DateTimeField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(default=timezone.now)  # last_reply_at, or created_at without replies
+    # content rendered at save time, see discussions.shortcodes
+    content_ast = models.JSONField(default=list, blank=True)
+    content_html = models.TextField(blank=True, default='')
+    content_modules = models.JSONField(default=list, blank=True)  # Visualizer modules the content uses
+    content_checksum = models.CharField(max_length=40, blank=True, default='')  # Of the content rendered above
     
     def __str__(self):
         return self.title
@@ -35,13 +87,18 @@ class Topic(models.Model):
         return reverse('discussions:topic_detail', kwargs={'pk': self.pk})
     
     def total_likes(self):
-        return self.likes.count()
+        return self.like_count
     
     def total_dislikes(self):
-        return self.dislikes.count()
+        return self.dislike_count
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a forum's topics, see config.pagination
+            models.Index(fields=['forum', '-created_at', '-id'], name='topic_forum_created_idx'),
+            models.Index(fields=['forum', '-last_activity_at', '-id'], name='topic_forum_activity_idx'),
+        ]
 
 class Reply(models.Model):
     content = models.TextField()
@@ -50,13 +107,294 @@ class Reply(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name='liked_replies', blank=True)
+    like_count = models.PositiveIntegerField(default=0)  # Denormalized likes.count(), see config.reactions
+    # Threading: path is the parent's path followed by this reply's path_segment(),
+    # so sorting by path lists each reply right after its parent, in depth-first order
+    parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='children')
+    path = models.CharField(max_length=PATH_SEGMENT_WIDTH * (MAX_REPLY_DEPTH + 1), blank=True, default='')
+    depth = models.PositiveSmallIntegerField(default=0)
+    # content rendered at save time, see discussions.shortcodes
+    content_ast = models.JSONField(default=list, blank=True)
+    content_html = models.TextField(blank=True, default='')
+    content_modules = models.JSONField(default=list, blank=True)  # Visualizer modules the content uses
+    content_checksum = models.CharField(max_length=40, blank=True, default='')  # Of the content rendered above
     
     def __str__(self):
         return f"Reply by {self.author.username} on {self.topic.title}"
     
+    def save(self, *args, **kwargs):
+        creating = self._state.adding and not self.path
+        if creating and self.parent_id:
+            parent = self.parent
+            while parent.depth >= MAX_REPLY_DEPTH and parent.parent_id:
+                parent = parent.parent
+            self.parent = parent
+            self.depth = parent.depth + 1
+        super().save(*args, **kwargs)
+        if creating:
+            # The path ends with the id, known only after the insert
+            prefix = self.parent.path if self.parent_id else ''
+            self.path = prefix + path_segment(self.pk)
+            Reply.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+    
+    def subtree(self):
+        """This reply and all its descendants, in display order (one range scan of reply_topic_path_idx)."""
+        # A range rather than LIKE 'path%', which MySQL runs as LIKE BINARY without using the index
+        return Reply.objects.filter(
+            topic_id=self.topic_id, path__gte=self.path, path__lt=path_successor(self.path)
+        ).order_by('path')
+    
+    def get_absolute_url(self):
+        # Link to the page of the topic that starts with this reply
+        from config.pagination import cursor_at
+        url = reverse('discussions:topic_detail', kwargs={'pk': self.topic_id})
+        return f"{url}?cursor={cursor_at(self, REPLY_ORDERING)}#reply-{self.pk}"
+    
     def total_likes(self):
-        return self.likes.count()
+        return self.like_count
     
     class Meta:
-        ordering = ['created_at']
+        ordering = ['path']
         verbose_name_plural = 'Replies'
+        indexes = [
+            # Last reply of a topic, see discussions.stats
+            models.Index(fields=['topic', 'created_at', 'id'], name='reply_topic_created_idx'),
+            # Threads and subtrees in display order, and their keyset pagination
+            models.Index(fields=['topic', 'path'], name='reply_topic_path_idx'),
+        ]
+
+
+class TopicTrend(models.Model):
+    """Time-decayed activity of a topic, see config.trending."""
+    topic = models.OneToOneField(Topic, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    forum = models.ForeignKey(Forum, on_delete=models.CASCADE, related_name='+')  # Denormalized topic.forum
+    score = models.FloatField(default=0)
+    decayed_at = models.DateTimeField()  # Time the score was last decayed to
+    
+    class Meta:
+        indexes = [
+            # Hot topics overall and per forum
+            models.Index(fields=['-score', '-topic'], name='topic_trend_score_idx'),
+            models.Index(fields=['forum', '-score', '-topic'], name='topic_trend_forum_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic_id}: {self.score:.2f}"
+
+
+class TopicReadMark(models.Model):
+    """How far a user has read a topic: posts created up to read_at are read, see discussions.unread."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='+')
+    read_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'topic')
+    
+    def __str__(self):
+        return f"{self.user_id} read topic {self.topic_id} up to {self.read_at}"
+
+
+class ForumReadMark(models.Model):
+    """A user's "mark all read" watermark of a forum, see discussions.unread."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    forum = models.ForeignKey(Forum, on_delete=models.CASCADE, related_name='+')
+    marked_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'forum')
+    
+    def __str__(self):
+        return f"{self.user_id} read forum {self.forum_id} up to {self.marked_at}"
+
+
+class TopicSignature(models.Model):
+    """MinHash signatures of a topic's title and content, see discussions.similarity."""
+    topic = models.OneToOneField(Topic, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    title_minhash = models.JSONField(default=list)
+    content_minhash = models.JSONField(default=list)
+    
+    def __str__(self):
+        return f"Signature of topic {self.topic_id}"
+
+
+class TopicBucket(models.Model):
+    """An LSH bucket a topic falls in, one per signature band, see discussions.similarity."""
+    bucket = models.BigIntegerField()
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        indexes = [
+            # Candidate topics of a set of bucket keys, read from the index alone
+            models.Index(fields=['bucket', 'topic'], name='topic_bucket_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.bucket} -> {self.topic_id}"
+
+
+class PostSearchDocument(models.Model):
+    """A post in the discussion search index: a topic's opening post or a reply, see discussions.search."""
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='+')
+    reply = models.OneToOneField(Reply, on_delete=models.CASCADE, null=True, blank=True, related_name='search_document')  # Null for the opening post
+    forum = models.ForeignKey(Forum, on_delete=models.CASCADE, related_name='+')  # Denormalized topic.forum
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    length = models.FloatField(default=0)  # Field-weighted number of indexed tokens
+    checksum = models.CharField(max_length=40)  # SHA-1 of the indexed text, used to skip no-op reindexing
+    
+    def __str__(self):
+        return f"Search document for topic {self.topic_id}, reply {self.reply_id}"
+
+
+class PostSearchPosting(models.Model):
+    """One entry of the discussion inverted index: a term occurring in a post."""
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(PostSearchDocument, on_delete=models.CASCADE, related_name='postings')
+    weight = models.FloatField()  # Field-weighted term frequency
+    positions = models.TextField()  # Encoded as 'field:1 5 9|field:3', see publications.search
+    
+    class Meta:
+        unique_together = ('term', 'document')
+        indexes = [
+            models.Index(fields=['term', '-weight'], name='post_posting_term_weight_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} -> {self.document_id}"
+
+
+@receiver(pre_save, sender=Forum)
+def keep_forum_stats(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    # Don't write back statistics loaded before concurrent posts
+    stored = Forum.objects.filter(pk=instance.pk).values(*FORUM_STATS_FIELDS).first()
+    for name, value in (stored or {}).items():
+        setattr(instance, name, value)
+
+
+@receiver(post_save, sender=Forum)
+def update_stats_on_forum_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .stats import forum_created
+    forum_created(instance)
+
+
+@receiver(pre_save, sender=Topic)
+def remember_previous_forum(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    stored = Topic.objects.filter(pk=instance.pk).values('forum_id', 'reply_count', 'last_reply_at', 'last_activity_at').first()
+    if stored is None:
+        return
+    instance._previous_forum_id = stored['forum_id']
+    # Don't write back reply statistics loaded before concurrent replies
+    instance.reply_count = stored['reply_count']
+    instance.last_reply_at = stored['last_reply_at']
+    instance.last_activity_at = stored['last_activity_at']
+
+
+@receiver(post_save, sender=Topic)
+def update_forum_stats_on_topic_save(sender, instance, created=False, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_forum_id', None)
+    instance._previous_forum_id = None
+    if raw:
+        return
+    from .stats import topic_created, topic_moved
+    if created:
+        topic_created(instance)
+    elif previous is not None and previous != instance.forum_id:
+        topic_moved(instance, previous)
+
+
+@receiver(pre_delete, sender=Topic)
+def start_topic_delete(sender, instance, **kwargs):
+    from .stats import topic_deleting
+    topic_deleting(instance)
+
+
+@receiver(post_delete, sender=Topic)
+def update_forum_stats_on_topic_delete(sender, instance, **kwargs):
+    from .stats import topic_deleted
+    topic_deleted(instance)
+
+
+@receiver(post_save, sender=Reply)
+def update_stats_on_reply_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .stats import reply_created
+    reply_created(instance)
+
+
+@receiver(post_delete, sender=Reply)
+def update_stats_on_reply_delete(sender, instance, **kwargs):
+    from .stats import reply_deleted
+    reply_deleted(instance)
+
+
+@receiver(post_save, sender=Topic)
+def record_topic_activity(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        # Keep the denormalized forum in sync when a topic is moved
+        TopicTrend.objects.filter(topic=instance).exclude(forum_id=instance.forum_id).update(forum_id=instance.forum_id)
+        return
+    from config.trending import WEIGHTS, record_event
+    record_event(TopicTrend, instance.pk, WEIGHTS['create'], forum_id=instance.forum_id)
+
+
+@receiver(post_save, sender=Reply)
+def record_reply_activity(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from config.trending import WEIGHTS, record_event
+    record_event(TopicTrend, instance.topic_id, WEIGHTS['reply'], forum_id=instance.topic.forum_id)
+
+
+@receiver(pre_save, sender=Topic)
+@receiver(pre_save, sender=Reply)
+def render_post_content(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'content' not in update_fields):
+        return
+    from .shortcodes import render_post
+    render_post(instance)
+
+
+@receiver(post_save, sender=Topic)
+def index_topic_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .search import index_topic
+    index_topic(instance)
+
+
+@receiver(post_save, sender=Topic)
+def index_topic_similarity(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .similarity import index_topic
+    index_topic(instance)
+
+
+@receiver(post_save, sender=Reply)
+def index_reply_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .search import index_reply
+    index_reply(instance)
+
+
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=Reply)
+def refresh_search_stats(sender, instance, **kwargs):
+    # The search documents go with their post (CASCADE), only the cached statistics change
+    from .search import invalidate_stats
+    from .stats import deleting_topics
+    if sender is Reply and instance.topic_id in deleting_topics():
+        return
+    invalidate_stats()
+
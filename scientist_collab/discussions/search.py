@@ -0,0 +1,341 @@
+"""
+Full-text search across topics and replies.
+
+Every post - the opening post of a topic (its title and content) and each
+reply - is a document of an inverted index (PostSearchDocument and
+PostSearchPosting), kept up to date by the Topic and Reply signal receivers.
+Tokenizing, the query syntax ("phrases", prefix*) and BM25 ranking are
+shared with publications.search.
+
+Matching posts are grouped under their topic, topics ranked by their best
+post. Filters (forum, author, solved, date) are applied to the candidate
+posts in the same query that loads their lengths, and only the topics of
+the displayed page are loaded to build highlighted snippets.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from publications.search import (
+    MAX_POSTINGS_PER_TERM, MAX_PREFIX_EXPANSIONS, MAX_RESULTS, TOKEN_RE,
+    document_frequencies, encode_positions, filter_phrases, parse_query, score_candidates, stem, tokenize,
+)
+
+# Weight of each indexed field when computing term frequencies
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'content': 1.0,
+}
+
+# Reply matches shown under each topic of the results
+MAX_REPLIES_PER_TOPIC = 3
+
+# Words of context in a snippet
+SNIPPET_WORDS = 30
+
+STATS_CACHE_KEY = 'discussions:search:stats'
+STATS_CACHE_TIMEOUT = 300
+
+
+def analyze_post(title, content):
+    """
+    Build the postings of a post.
+
+    Returns (length, checksum, postings) where postings maps each term to
+    (weighted term frequency, {field: [positions]}).
+    """
+    field_texts = {'title': title or '', 'content': content or ''}
+    checksum = hashlib.sha1('\x00'.join(field_texts.values()).encode('utf-8')).hexdigest()
+
+    length = 0.0
+    postings = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        tokens = tokenize(field_texts[field])
+        length += weight * len(tokens)
+        for position, term in tokens:
+            entry = postings.setdefault(term, [0.0, {}])
+            entry[0] += weight
+            entry[1].setdefault(field, []).append(position)
+    return length, checksum, postings
+
+
+def _index_post(topic, reply=None, force=False):
+    """(Re)index the opening post of a topic, or one of its replies."""
+    from .models import PostSearchDocument, PostSearchPosting
+
+    if reply is None:
+        title, content, author_id, created_at = topic.title, topic.content, topic.author_id, topic.created_at
+    else:
+        title, content, author_id, created_at = '', reply.content, reply.author_id, reply.created_at
+    length, checksum, postings = analyze_post(title, content)
+
+    document = PostSearchDocument.objects.filter(topic_id=topic.pk, reply=reply).first()
+    if document is not None and document.checksum == checksum and not force:
+        return False
+
+    with transaction.atomic():
+        if document is None:
+            document = PostSearchDocument.objects.create(
+                topic_id=topic.pk, reply=reply, forum_id=topic.forum_id, author_id=author_id,
+                created_at=created_at, length=length, checksum=checksum,
+            )
+        else:
+            PostSearchPosting.objects.filter(document=document).delete()
+            PostSearchDocument.objects.filter(pk=document.pk).update(length=length, checksum=checksum)
+        PostSearchPosting.objects.bulk_create([
+            PostSearchPosting(term=term, document=document, weight=weight, positions=encode_positions(positions))
+            for term, (weight, positions) in postings.items()
+        ])
+    invalidate_stats()
+    return True
+
+
+def index_topic(topic, force=False):
+    """Index a topic's opening post and follow it if it moved to another forum."""
+    from .models import PostSearchDocument
+
+    PostSearchDocument.objects.filter(topic_id=topic.pk).exclude(forum_id=topic.forum_id).update(forum_id=topic.forum_id)
+    return _index_post(topic, force=force)
+
+
+def index_reply(reply, force=False):
+    return _index_post(reply.topic, reply, force=force)
+
+
+def build_documents(topics, replies):
+    """
+    Yield (PostSearchDocument, [PostSearchPosting]) for topics and replies
+    that are not indexed yet, for bulk indexing (see rebuild_discussion_index).
+    Replies need their topic's forum_id.
+    """
+    from .models import PostSearchDocument, PostSearchPosting
+
+    posts = [(topic, None) for topic in topics] + [(reply.topic, reply) for reply in replies]
+    for topic, reply in posts:
+        source = reply or topic
+        length, checksum, postings = analyze_post(topic.title if reply is None else '', source.content)
+        document = PostSearchDocument(
+            topic_id=topic.pk, reply_id=reply and reply.pk, forum_id=topic.forum_id, author_id=source.author_id,
+            created_at=source.created_at, length=length, checksum=checksum,
+        )
+        yield document, [
+            PostSearchPosting(term=term, document=document, weight=weight, positions=encode_positions(positions))
+            for term, (weight, positions) in postings.items()
+        ]
+
+
+def invalidate_stats():
+    cache.delete(STATS_CACHE_KEY)
+
+
+def get_stats():
+    """Return (document count, average document length), cached."""
+    from .models import PostSearchDocument
+
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        aggregate = PostSearchDocument.objects.aggregate(count=Count('pk'), avg_length=Avg('length'))
+        stats = (aggregate['count'] or 0, aggregate['avg_length'] or 0.0)
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def expand_prefixes(prefixes):
+    """Map each prefix to the indexed terms it matches (an index range scan)."""
+    from .models import PostSearchPosting
+
+    expanded = []
+    for prefix in prefixes:
+        expanded.extend(
+            PostSearchPosting.objects.filter(term__startswith=prefix)
+            .order_by('term')
+            .values_list('term', flat=True)
+            .distinct()[:MAX_PREFIX_EXPANSIONS]
+        )
+    return expanded
+
+
+def fetch_postings(terms):
+    """
+    Load the postings of the given terms.
+
+    Returns {term: {document_id: (weight, positions)}}, at most
+    MAX_POSTINGS_PER_TERM rows per term, highest weight first.
+    """
+    from .models import PostSearchPosting
+
+    postings = {}
+    for term in terms:
+        rows = (
+            PostSearchPosting.objects.filter(term=term)
+            .order_by('-weight')
+            .values_list('document_id', 'weight', 'positions')[:MAX_POSTINGS_PER_TERM]
+        )
+        postings[term] = {pk: (weight, positions) for pk, weight, positions in rows}
+    return postings
+
+
+def filter_documents(queryset, forum=None, author=None, solved=None, date_from=None, date_to=None):
+    """Apply the search filters to a PostSearchDocument queryset."""
+    if forum:
+        queryset = queryset.filter(forum=forum)
+    if author:
+        queryset = queryset.filter(author__username=author)
+    if solved is not None:
+        queryset = queryset.filter(topic__is_solved=solved)
+    if date_from:
+        queryset = queryset.filter(created_at__date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(created_at__date__lte=date_to)
+    return queryset
+
+
+def rank(query, **filters):
+    """
+    Rank the posts matching a query.
+
+    Returns a list of (document_id, topic_id, reply_id, score), best first.
+    """
+    from .models import PostSearchDocument, PostSearchPosting
+
+    terms, prefixes, phrases = parse_query(query)
+    terms = list(dict.fromkeys(terms + expand_prefixes(prefixes)))
+    if not terms:
+        return []
+
+    postings = fetch_postings(terms)
+    candidates = set()
+    for term_postings in postings.values():
+        candidates.update(term_postings)
+    if phrases:
+        candidates = filter_phrases(candidates, postings, phrases)
+    if not candidates:
+        return []
+
+    # Lengths for BM25, restricted to the posts passing the filters
+    rows = filter_documents(PostSearchDocument.objects.filter(pk__in=candidates), **filters).values_list(
+        'pk', 'length', 'topic_id', 'reply_id'
+    )
+    documents = {pk: (length, topic_id, reply_id) for pk, length, topic_id, reply_id in rows}
+    count, avg_length = get_stats()
+    scores = score_candidates(
+        postings, documents.keys(), {pk: entry[0] for pk, entry in documents.items()}, count, avg_length,
+        document_frequencies(PostSearchPosting, postings),
+    )
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:MAX_RESULTS]
+    return [(pk, documents[pk][1], documents[pk][2], score) for pk, score in ranked]
+
+
+def highlight(text, terms, prefixes=(), words=SNIPPET_WORDS):
+    """Return an HTML snippet of text around the first match, matched words in <mark>."""
+    text = text or ''
+    matches = list(TOKEN_RE.finditer(text))
+    if not matches:
+        return ''
+
+    def is_hit(word):
+        word = word.lower()
+        return stem(word) in terms or any(word.startswith(prefix) for prefix in prefixes)
+
+    hits = {index for index, match in enumerate(matches) if is_hit(match.group())}
+    start = max(0, min(hits) - words // 3) if hits else 0
+    window = matches[start:start + words]
+
+    parts = ['… ' if start else '']
+    position = window[0].start() if start else 0
+    for index, match in enumerate(window, start):
+        parts.append(escape(text[position:match.start()]))
+        word = escape(match.group())
+        parts.append(f'<mark>{word}</mark>' if index in hits else word)
+        position = match.end()
+    if start + words < len(matches):
+        parts.append(' …')
+    else:
+        parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
+
+
+class TopicHit:
+    """A topic in the search results, with its matching replies."""
+
+    def __init__(self, topic_id, score):
+        self.topic_id = topic_id
+        self.score = score
+        self.matches_topic = False
+        self.reply_ids = []
+        self.reply_count = 0
+        self.topic = None
+        self.title = ''
+        self.snippet = ''
+        self.replies = []  # (reply, snippet)
+
+
+class DiscussionResults:
+    """
+    Ranked search results grouped by topic.
+
+    Behaves like a sequence of TopicHit so it can be paginated; slicing
+    loads the topics and replies of the slice only, with their snippets.
+    """
+
+    def __init__(self, query, ranked):
+        terms, prefixes, _ = parse_query(query)
+        self.terms = set(terms)
+        self.prefixes = prefixes
+        self.post_count = len(ranked)
+        hits = {}
+        for _, topic_id, reply_id, score in ranked:
+            hit = hits.get(topic_id)
+            if hit is None:
+                hit = hits[topic_id] = TopicHit(topic_id, score)
+            if reply_id is None:
+                hit.matches_topic = True
+            else:
+                hit.reply_count += 1
+                if len(hit.reply_ids) < MAX_REPLIES_PER_TOPIC:
+                    hit.reply_ids.append(reply_id)
+        self.hits = list(hits.values())
+
+    def __len__(self):
+        return len(self.hits)
+
+    def count(self):
+        return len(self.hits)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._load(self.hits[index])
+        return self[index:index + 1 or None][0]
+
+    def _load(self, hits):
+        from .models import Topic, Reply
+
+        topics = Topic.objects.select_related('author', 'forum').in_bulk([hit.topic_id for hit in hits])
+        replies = Reply.objects.select_related('author').in_bulk(
+            [pk for hit in hits for pk in hit.reply_ids]
+        )
+        loaded = []
+        for hit in hits:
+            hit.topic = topics.get(hit.topic_id)
+            if hit.topic is None:
+                continue
+            hit.snippet = highlight(hit.topic.content, self.terms, self.prefixes)
+            hit.title = highlight(hit.topic.title, self.terms, self.prefixes, words=len(hit.topic.title))
+            hit.replies = [
+                (replies[pk], highlight(replies[pk].content, self.terms, self.prefixes))
+                for pk in hit.reply_ids if pk in replies
+            ]
+            loaded.append(hit)
+        return loaded
+
+
+def search_discussions(query, **filters):
+    """Search topics and replies; filters are those of filter_documents()."""
+    return DiscussionResults(query, rank(query, **filters))
@@ -0,0 +1,211 @@
+"""
+Server-side rendering of post content and its visualizer shortcodes.
+
+Posts may embed interactive visualizers with shortcodes:
+
+    [wave {"amplitude": 2}]...[/wave]
+    [dna sequence="CCCCHHHHOOOO" chainType="biofuel" energyEfficiency="0.85"]...[/dna]
+    [datastructure type="graph" data="{...}"]...[/datastructure]
+
+When a topic or reply is saved its content is parsed once into a list of
+nodes (the AST) with validated visualizer configurations, rendered to HTML,
+and the visualizer modules it needs are recorded (see the
+render_post_content receiver). Pages output the stored HTML and include the
+scripts of the modules their posts use, see required_scripts().
+
+The stored HTML acts as a render cache, versioned by content_checksum, the
+checksum of the content it was rendered from. save() renders it with the
+content; rows written otherwise (bulk_create(), update(content=...)) have no
+or stale HTML, which ensure_rendered() renders and stores the first time
+they are shown. Hits and misses are counted in the post_render metrics (see
+the content_cache_stats command).
+
+The markup matches what static/js/visualizers/simplified_post_parser.js
+generates for previews, so the same scripts initialize both.
+"""
+import hashlib
+import json
+import re
+import uuid
+
+from django.utils.html import format_html, linebreaks
+
+from config import metrics
+
+# Static scripts of each visualizer module, in load order
+MODULE_SCRIPTS = {
+    'three': ['js/visualizers/three.min.js', 'js/visualizers/OrbitControls.js'],
+    'wave': ['js/visualizers/waves/wave_3d.js', 'js/visualizers/waves/fallback_wave.js'],
+    'dna': ['js/visualizers/dna/dna_visualizer.js'],
+    'datastructure': ['js/visualizers/datastructures/data_structure_visualizer.js'],
+}
+
+# Scripts needed by any page showing a visualizer
+RUNTIME_SCRIPTS = ['js/visualizers/fallback_visualizer.js', 'js/visualizers/simplified_post_parser.js']
+
+# Shortcode tag: (data-visualizer-type, title, modules)
+SHORTCODES = {
+    'wave': ('energy-wave-simulator', 'Energy Wave Simulator', ['three', 'wave']),
+    'dna': ('molecular-energy-chain', 'Molecular Energy Chain Visualizer', ['three', 'dna']),
+    'datastructure': ('energy-network', 'Energy Network Visualizer', ['three', 'datastructure']),
+}
+
+CHAIN_TYPES = ('hydrocarbon', 'biofuel', 'polymer')
+MAX_SEQUENCE_LENGTH = 500
+
+# Attributes may contain brackets inside quotes, e.g. markers="[1, 2]"
+SHORTCODE_RE = re.compile(r'\[(wave|dna|datastructure)(?:\s+((?:"[^"]*"|[^\[\]"])*))?\](.*?)\[/\1\]', re.DOTALL)
+ATTRIBUTE_RE = re.compile(r'(\w+)="([^"]*)"')
+SEQUENCE_RE = re.compile(r'^[A-Za-z]*$')
+
+
+def _json(value, expected):
+    """Parse a JSON attribute, None if invalid or not of the expected type."""
+    try:
+        value = json.loads(value)
+    except ValueError:
+        return None
+    return value if isinstance(value, expected) else None
+
+
+def _wave_config(params):
+    # [wave {...}] takes a JSON object of simulator options
+    return _json(params or '', dict) or {}
+
+
+def _dna_config(params):
+    attributes = dict(ATTRIBUTE_RE.findall(params or ''))
+    config = {}
+    sequence = attributes.get('sequence', '')
+    if sequence and SEQUENCE_RE.match(sequence):
+        config['sequence'] = sequence[:MAX_SEQUENCE_LENGTH].upper()
+    markers = _json(attributes.get('markers', ''), list)
+    if markers is not None:
+        config['markers'] = markers
+    if attributes.get('chainType') in CHAIN_TYPES:
+        config['chainType'] = attributes['chainType']
+    try:
+        config['energyEfficiency'] = min(max(float(attributes['energyEfficiency']), 0.0), 1.0)
+    except (KeyError, ValueError):
+        pass
+    return config
+
+
+def _datastructure_config(params):
+    attributes = dict(ATTRIBUTE_RE.findall(params or ''))
+    config = {}
+    if attributes.get('type'):
+        config['structureType'] = attributes['type']
+        config['mode'] = '3d'
+    data = _json(attributes.get('data', ''), (dict, list))
+    if data is not None:
+        config['data'] = data
+    return config
+
+
+CONFIG_PARSERS = {
+    'wave': _wave_config,
+    'dna': _dna_config,
+    'datastructure': _datastructure_config,
+}
+
+
+def parse_content(content):
+    """
+    Parse post content into a list of nodes:
+    {'type': 'text', 'text': ...} and {'type': 'visualizer', 'tag': ..., 'config': {...}}.
+    """
+    content = content or ''
+    nodes = []
+    position = 0
+    for match in SHORTCODE_RE.finditer(content):
+        if match.start() > position:
+            nodes.append({'type': 'text', 'text': content[position:match.start()]})
+        tag, params = match.group(1), match.group(2)
+        nodes.append({'type': 'visualizer', 'tag': tag, 'config': CONFIG_PARSERS[tag](params)})
+        position = match.end()
+    if position < len(content):
+        nodes.append({'type': 'text', 'text': content[position:]})
+    return nodes
+
+
+def render_visualizer(tag, config):
+    visualizer_type, title, _ = SHORTCODES[tag]
+    return format_html(
+        '<div class="card my-3">'
+        '<div class="card-header"><span>{}</span>'
+        '<span class="viz-status-indicator badge bg-secondary float-end">Loading...</span></div>'
+        '<div class="card-body">'
+        '<div id="{}" class="visualizer-container" data-visualizer-type="{}" data-visualizer-config="{}">'
+        '<div class="text-center"><div class="spinner-border text-primary" role="status">'
+        '<span class="visually-hidden">Loading...</span></div>'
+        '<p class="mt-2">Loading visualization...</p></div>'
+        '</div></div></div>',
+        title, f'viz-{tag}-{uuid.uuid4().hex[:12]}', visualizer_type, json.dumps(config),
+    )
+
+
+def render_nodes(nodes):
+    """Render parsed nodes to HTML; text is escaped and split into paragraphs like |linebreaks."""
+    parts = []
+    for node in nodes:
+        if node['type'] == 'visualizer':
+            parts.append(render_visualizer(node['tag'], node['config']))
+        elif node['text'].strip():
+            parts.append(linebreaks(node['text'], autoescape=True))
+    return '\n'.join(parts)
+
+
+def render_content(content):
+    """Return (nodes, html, modules) of post content."""
+    nodes = parse_content(content)
+    modules = []
+    for node in nodes:
+        if node['type'] != 'visualizer':
+            continue
+        for module in SHORTCODES[node['tag']][2]:
+            if module not in modules:
+                modules.append(module)
+    return nodes, render_nodes(nodes), modules
+
+
+def content_checksum(content):
+    """Version of a render: the checksum of the content it was made from."""
+    return hashlib.sha1((content or '').encode('utf-8')).hexdigest()
+
+
+RENDERED_FIELDS = ('content_ast', 'content_html', 'content_modules', 'content_checksum')
+
+
+def render_post(post):
+    """Render the content of a post (topic or reply) onto its RENDERED_FIELDS."""
+    post.content_ast, post.content_html, post.content_modules = render_content(post.content)
+    post.content_checksum = content_checksum(post.content)
+
+
+def ensure_rendered(posts):
+    """
+    Make sure posts (topics or replies) carry content rendered from their
+    current content.
+
+    Posts whose stored render is missing or stale are rendered and updated
+    in place; an empty render of blank content is a hit like any other.
+    The number of posts served from the stored HTML and rendered here are
+    counted as post_render hits and misses.
+    """
+    misses = [post for post in posts if post.content_checksum != content_checksum(post.content)]
+    for post in misses:
+        render_post(post)
+        # update() leaves updated_at alone, the post itself didn't change
+        type(post).objects.filter(pk=post.pk).update(**{field: getattr(post, field) for field in RENDERED_FIELDS})
+    metrics.incr('post_render.hit', len(posts) - len(misses))
+    metrics.incr('post_render.miss', len(misses))
+
+
+def required_scripts(posts):
+    """Static paths of the scripts needed to show posts (topics or replies), in load order."""
+    modules = {module for post in posts for module in post.content_modules}
+    if not modules:
+        return []
+    scripts = [path for module, paths in MODULE_SCRIPTS.items() if module in modules for path in paths]
+    return scripts + RUNTIME_SCRIPTS
@@ -0,0 +1,156 @@
+"""
+Similar-topic detection with MinHash and locality-sensitive hashing.
+
+Each topic has two MinHash signatures: one of its title and one of its
+content. The features of a title are its stemmed words (see
+publications.search.tokenize), so reworded or reordered titles still match.
+Content features also include consecutive word pairs. For two feature
+sets, the fraction of positions where their signatures agree estimates
+their Jaccard similarity.
+
+Signatures are split into BANDS bands. Each band is hashed into a bucket
+key stored in TopicBucket, so topics sharing a band land in the same
+bucket. Finding the topics similar to a new title is then one indexed
+lookup of its bucket keys. The topics sharing the most buckets with it are
+the candidates, ranked by comparing their stored signatures. Lookups
+compare a bounded number of signatures whatever the number of topics.
+
+The index is updated by the Topic signal receivers; rebuild_similarity_index
+repairs it in bulk.
+"""
+import hashlib
+import random
+
+from django.db import transaction
+from django.db.models import Count
+
+from publications.search import tokenize
+
+NUM_HASHES = 32
+BANDS = 16  # 2 rows per band: pairs above ~25% similarity usually share a bucket
+ROWS_PER_BAND = NUM_HASHES // BANDS
+
+# Content beyond this many words doesn't change what a topic is about
+MAX_CONTENT_TOKENS = 300
+
+# Candidate topics compared, and minimum similarity, of suggestions
+MAX_CANDIDATES = 200
+MIN_SIMILARITY = 0.3
+
+# Similarity above which creating a topic asks for confirmation
+DUPLICATE_SIMILARITY = 0.6
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: signatures must be comparable across processes and deployments
+_rng = random.Random(20240517)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def features(text, max_tokens=None, pairs=False):
+    """The stemmed words of text, and its consecutive word pairs if pairs is set."""
+    terms = [term for _, term in tokenize(text or '')][:max_tokens]
+    if not pairs:
+        return set(terms)
+    return set(terms) | {f'{first} {second}' for first, second in zip(terms, terms[1:])}
+
+
+def minhash(feature_set):
+    """MinHash signature of a feature set, an empty list if it has no features."""
+    if not feature_set:
+        return []
+    hashes = [_hash(feature) for feature in feature_set]
+    return [min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def signatures(title, content=''):
+    """Return (title signature, content signature)."""
+    return minhash(features(title)), minhash(features(content, MAX_CONTENT_TOKENS, pairs=True))
+
+
+def bucket_keys(signature, field):
+    """LSH bucket keys of a signature, one per band, as signed 64-bit integers."""
+    if not signature:
+        return []
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        value = _hash(f"{field}:{band}:{','.join(map(str, rows))}")
+        keys.append(value - (1 << 63))
+    return keys
+
+
+def estimate(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    if not first or not second:
+        return 0.0
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+def index_topic(topic):
+    """(Re)index a topic's signatures and buckets, if its text changed."""
+    from .models import TopicSignature, TopicBucket
+
+    title_signature, content_signature = signatures(topic.title, topic.content)
+    current = TopicSignature.objects.filter(topic_id=topic.pk).first()
+    if current is not None and (current.title_minhash, current.content_minhash) == (title_signature, content_signature):
+        return False
+
+    with transaction.atomic():
+        TopicSignature.objects.update_or_create(
+            topic_id=topic.pk, defaults={'title_minhash': title_signature, 'content_minhash': content_signature}
+        )
+        TopicBucket.objects.filter(topic_id=topic.pk).delete()
+        TopicBucket.objects.bulk_create(build_buckets(topic.pk, title_signature, content_signature))
+    return True
+
+
+def build_buckets(topic_id, title_signature, content_signature):
+    from .models import TopicBucket
+
+    keys = set(bucket_keys(title_signature, 'title')) | set(bucket_keys(content_signature, 'content'))
+    return [TopicBucket(bucket=key, topic_id=topic_id) for key in keys]
+
+
+def find_similar(title, content='', exclude=None, limit=5, min_similarity=MIN_SIMILARITY):
+    """
+    Topics similar to a title (and content, if given), most similar first.
+
+    Returns a list of (topic, similarity). Titles are compared with titles
+    and content with content; a topic's similarity is the higher of the two.
+    Runs three queries: buckets, signatures, topics.
+    """
+    from .models import Topic, TopicSignature, TopicBucket
+
+    title_signature, content_signature = signatures(title, content)
+    keys = bucket_keys(title_signature, 'title') + bucket_keys(content_signature, 'content')
+    if not keys:
+        return []
+
+    candidates = TopicBucket.objects.filter(bucket__in=keys)
+    if exclude is not None:
+        candidates = candidates.exclude(topic_id=exclude)
+    # Topics sharing more buckets are more likely similar: keep the best, not the first rows read
+    candidate_ids = set(
+        candidates.values('topic_id').annotate(hits=Count('pk'))
+        .order_by('-hits', '-topic_id').values_list('topic_id', flat=True)[:MAX_CANDIDATES]
+    )
+    if not candidate_ids:
+        return []
+
+    scores = {}
+    for topic_id, stored_title, stored_content in TopicSignature.objects.filter(pk__in=candidate_ids).values_list(
+        'topic_id', 'title_minhash', 'content_minhash'
+    ):
+        score = max(estimate(title_signature, stored_title), estimate(content_signature, stored_content))
+        if score >= min_similarity:
+            scores[topic_id] = score
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+    if not ranked:
+        return []
+
+    topics = Topic.objects.select_related('forum').in_bulk([topic_id for topic_id, _ in ranked])
+    return [(topics[topic_id], score) for topic_id, score in ranked if topic_id in topics]
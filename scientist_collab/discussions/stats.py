@@ -0,0 +1,256 @@
+"""
+Denormalized forum and topic statistics.
+
+Forum.topic_count, reply_count, last_post_at and last_post_author, and
+Topic.reply_count and last_reply_at, are maintained by the signal receivers
+in discussions.models when topics and replies are created, moved or
+deleted. So is last_activity_at of both, the last post time or, without
+posts, the creation time, which activity sorting pages through by index. Counters change through F() expressions, so concurrent posts
+don't lose updates. recompute_stats() repairs everything in bulk (see the
+recompute_forum_stats command).
+
+Deleting a topic deletes its replies first. While that cascade runs the
+topic is listed in deleting_topics(), and receivers skip the per-reply
+work the topic's own receivers then do once for all its replies.
+"""
+import threading
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+
+def _if_newer(field, created_at, value):
+    """Expression setting field to value if created_at is newer than the stored last_* time."""
+    return Case(
+        When(Q(**{f'{field}__isnull': True}) | Q(**{f'{field}__lte': created_at}), then=Value(value)),
+        default=F(field),
+        output_field=models.DateTimeField(),
+    )
+
+
+def _newer_author(created_at, author_id):
+    return Case(
+        When(Q(last_post_at__isnull=True) | Q(last_post_at__lte=created_at), then=Value(author_id)),
+        default=F('last_post_author'),
+        output_field=models.IntegerField(),
+    )
+
+
+def _decrement(field, amount=1):
+    """Expression lowering a counter without going below zero."""
+    return Case(
+        When(**{f'{field}__gte': amount}, then=F(field) - amount),
+        default=Value(0),
+        output_field=models.PositiveIntegerField(),
+    )
+
+
+_local = threading.local()
+
+
+def deleting_topics():
+    """Ids of the topics this thread is deleting, see topic_deleting()."""
+    if not hasattr(_local, 'topics'):
+        _local.topics = set()
+    return _local.topics
+
+
+def topic_deleting(topic):
+    """Called before a topic and its replies are deleted."""
+    from .models import Topic
+
+    deleting_topics().add(topic.pk)
+    # The stored statistics, the instance may have been loaded before recent replies
+    topic._deleted_stats = Topic.objects.filter(pk=topic.pk).values('reply_count', 'last_reply_at').first()
+
+
+def _start_activity(obj):
+    """Set the last activity of a new forum or topic to its creation time, set by the insert."""
+    # The default was taken when the object was built, before created_at
+    type(obj).objects.filter(pk=obj.pk, last_activity_at__lt=obj.created_at).update(last_activity_at=obj.created_at)
+    obj.last_activity_at = max(obj.last_activity_at, obj.created_at)
+
+
+def forum_created(forum):
+    _start_activity(forum)
+
+
+def refresh_last_post(forum_id):
+    """Recompute the last post (topic or reply) of a forum."""
+    from .models import Forum, Topic, Reply
+
+    candidates = [
+        Topic.objects.filter(forum_id=forum_id).order_by('-created_at').values('created_at', 'author_id').first(),
+        Reply.objects.filter(topic__forum_id=forum_id).order_by('-created_at').values('created_at', 'author_id').first(),
+    ]
+    latest = max(filter(None, candidates), key=lambda post: post['created_at'], default=None)
+    Forum.objects.filter(pk=forum_id).update(
+        last_post_at=latest and latest['created_at'],
+        last_post_author_id=latest and latest['author_id'],
+        last_activity_at=latest['created_at'] if latest else F('created_at'),
+    )
+
+
+def topic_created(topic):
+    from .models import Forum
+
+    _start_activity(topic)
+    Forum.objects.filter(pk=topic.forum_id).update(
+        topic_count=F('topic_count') + 1,
+        # Evaluated against the row before the update, author first
+        last_post_author_id=_newer_author(topic.created_at, topic.author_id),
+        last_post_at=_if_newer('last_post_at', topic.created_at, topic.created_at),
+        last_activity_at=_if_newer('last_activity_at', topic.created_at, topic.created_at),
+    )
+
+
+def topic_moved(topic, old_forum_id):
+    """Move a topic's counts from its previous forum to its current one."""
+    from .models import Forum, Topic
+
+    with transaction.atomic():
+        replies = Topic.objects.values_list('reply_count', flat=True).get(pk=topic.pk)
+        Forum.objects.filter(pk=old_forum_id).update(
+            topic_count=_decrement('topic_count'),
+            reply_count=_decrement('reply_count', replies),
+        )
+        Forum.objects.filter(pk=topic.forum_id).update(
+            topic_count=F('topic_count') + 1,
+            reply_count=F('reply_count') + replies,
+        )
+        refresh_last_post(old_forum_id)
+        refresh_last_post(topic.forum_id)
+
+
+def topic_deleted(topic):
+    from .models import Forum
+
+    deleting_topics().discard(topic.pk)
+    # Its replies, deleted first, were skipped by reply_deleted(): count them down at once
+    stats = getattr(topic, '_deleted_stats', None) or {'reply_count': 0, 'last_reply_at': None}
+    replies = stats['reply_count']
+    last_post = max(filter(None, [topic.created_at, stats['last_reply_at']]))
+    with transaction.atomic():
+        Forum.objects.filter(pk=topic.forum_id).update(
+            topic_count=_decrement('topic_count'),
+            reply_count=_decrement('reply_count', replies),
+        )
+        if Forum.objects.filter(pk=topic.forum_id, last_post_at__lte=last_post).exists():
+            refresh_last_post(topic.forum_id)
+
+
+def reply_created(reply):
+    from .models import Forum, Topic
+
+    with transaction.atomic():
+        Topic.objects.filter(pk=reply.topic_id).update(
+            reply_count=F('reply_count') + 1,
+            last_reply_at=_if_newer('last_reply_at', reply.created_at, reply.created_at),
+            last_activity_at=_if_newer('last_activity_at', reply.created_at, reply.created_at),
+        )
+        Forum.objects.filter(pk=reply.topic.forum_id).update(
+            reply_count=F('reply_count') + 1,
+            last_post_author_id=_newer_author(reply.created_at, reply.author_id),
+            last_post_at=_if_newer('last_post_at', reply.created_at, reply.created_at),
+            last_activity_at=_if_newer('last_activity_at', reply.created_at, reply.created_at),
+        )
+
+
+def reply_deleted(reply):
+    from .models import Forum, Topic, Reply
+
+    if reply.topic_id in deleting_topics():
+        return
+    forum_id = Topic.objects.filter(pk=reply.topic_id).values_list('forum_id', flat=True).first()
+    if forum_id is None:
+        return
+    last_reply_at = Subquery(
+        Reply.objects.filter(topic=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    )
+    with transaction.atomic():
+        Topic.objects.filter(pk=reply.topic_id).update(
+            reply_count=_decrement('reply_count'),
+            last_reply_at=last_reply_at,
+            last_activity_at=Coalesce(last_reply_at, F('created_at')),
+        )
+        Forum.objects.filter(pk=forum_id).update(reply_count=_decrement('reply_count'))
+        if Forum.objects.filter(pk=forum_id, last_post_at__lte=reply.created_at).exists():
+            refresh_last_post(forum_id)
+
+
+def recompute_stats(forum_model, topic_model, reply_model, batch_size=1000, dry_run=False):
+    """
+    Repair the statistics of every topic and forum.
+
+    Counts and last post times come from three GROUP BY queries (replies per
+    topic, topics per forum, replies per forum); the author of the last post
+    costs one query per forum. Only drifted rows are written, with
+    bulk_update. Takes the models as arguments so migrations can pass their
+    historical versions. Returns (topics repaired, forums repaired).
+    """
+    reply_stats = {
+        row['topic']: (row['total'], row['last'])
+        for row in reply_model.objects.order_by().values('topic').annotate(total=Count('pk'), last=Max('created_at'))
+    }
+    topic_stats = {
+        row['forum']: (row['total'], row['last'])
+        for row in topic_model.objects.order_by().values('forum').annotate(total=Count('pk'), last=Max('created_at'))
+    }
+    forum_reply_stats = {
+        row['topic__forum']: (row['total'], row['last'])
+        for row in reply_model.objects.order_by().values('topic__forum').annotate(total=Count('pk'), last=Max('created_at'))
+    }
+
+    drifted_topics = 0
+    batch = []
+    topic_fields = ['reply_count', 'last_reply_at', 'last_activity_at']
+    topics = topic_model.objects.only('pk', 'created_at', *topic_fields).order_by('pk')
+    for topic in topics.iterator(chunk_size=batch_size):
+        reply_count, last_reply_at = reply_stats.get(topic.pk, (0, None))
+        stats = (reply_count, last_reply_at, last_reply_at or topic.created_at)
+        if (topic.reply_count, topic.last_reply_at, topic.last_activity_at) == stats:
+            continue
+        topic.reply_count, topic.last_reply_at, topic.last_activity_at = stats
+        batch.append(topic)
+        if len(batch) >= batch_size:
+            drifted_topics += len(batch)
+            if not dry_run:
+                topic_model.objects.bulk_update(batch, topic_fields)
+            batch = []
+    drifted_topics += len(batch)
+    if batch and not dry_run:
+        topic_model.objects.bulk_update(batch, topic_fields)
+
+    drifted_forums = []
+    for forum in forum_model.objects.all():
+        topic_count, last_topic_at = topic_stats.get(forum.pk, (0, None))
+        reply_count, last_reply_at = forum_reply_stats.get(forum.pk, (0, None))
+        last_post_at = max(filter(None, (last_topic_at, last_reply_at)), default=None)
+        last_post_author_id = None
+        if last_post_at is not None:
+            # Ties between a topic and a reply go to the reply
+            source = (
+                reply_model.objects.filter(topic__forum=forum.pk)
+                if last_post_at == last_reply_at else topic_model.objects.filter(forum=forum.pk)
+            )
+            last_post_author_id = (
+                source.filter(created_at=last_post_at).order_by('-pk').values_list('author_id', flat=True).first()
+            )
+
+        actual = (topic_count, reply_count, last_post_at, last_post_author_id, last_post_at or forum.created_at)
+        stored = (
+            forum.topic_count, forum.reply_count, forum.last_post_at, forum.last_post_author_id, forum.last_activity_at
+        )
+        if actual == stored:
+            continue
+        (
+            forum.topic_count, forum.reply_count, forum.last_post_at, forum.last_post_author_id, forum.last_activity_at
+        ) = actual
+        drifted_forums.append(forum)
+    if drifted_forums and not dry_run:
+        forum_model.objects.bulk_update(
+            drifted_forums, ['topic_count', 'reply_count', 'last_post_at', 'last_post_author', 'last_activity_at'],
+            batch_size=batch_size,
+        )
+    return drifted_topics, len(drifted_forums)
@@ -1,7 +1,18 @@
 from django.test import TestCase, Client
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import StringIO
+from unittest.mock import patch
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Forum, Topic, Reply
+from .models import Forum, Topic, TopicTrend, Reply, PostSearchDocument, TopicReadMark, ForumReadMark, TopicBucket, MAX_REPLY_DEPTH, path_segment
+from .search import search_discussions, highlight
+from .unread import annotate_unread
+from .shortcodes import parse_content, render_content
+from .similarity import find_similar, estimate, features, minhash
+from config.trending import WEIGHTS
+from config import metrics
 
 class DiscussionsModelTests(TestCase):
     """Tests for the discussions app models"""
@@ -167,3 +178,724 @@ class DiscussionsViewTests(TestCase):
         
         # Check if the reply was created
         self.assertContains(response, 'This is a test reply from an unauthenticated user')
+
+    def test_topic_replies_are_paginated(self):
+        """Check that replies are paginated and new replies link to their page"""
+        for i in range(25):
+            Reply.objects.create(content=f'Reply number {i}', author=self.user, topic=self.topic)
+        
+        response = self.client.get(reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk}))
+        self.assertEqual(len(response.context['replies']), 20)
+        self.assertEqual(response.context['reply_count'], 25)
+        self.assertTrue(response.context['page'].has_next)
+        
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('discussions:add_reply', kwargs={'pk': self.topic.pk}),
+            {'content': 'The newest reply'}
+        )
+        reply = Reply.objects.get(content='The newest reply')
+        self.assertRedirects(response, reply.get_absolute_url(), fetch_redirect_response=False)
+        
+        response = self.client.get(reply.get_absolute_url())
+        self.assertEqual(response.context['replies'][0], reply)
+
+    def test_topic_detail_viewer_state(self):
+        """Check that topic and reply reactions of the viewer are loaded per page"""
+        replies = [Reply.objects.create(content=f'Reply {i}', author=self.user, topic=self.topic) for i in range(3)]
+        replies[1].likes.add(self.user)
+        self.topic.dislikes.add(self.user)
+        self.client.force_login(self.user)
+        
+        response = self.client.get(reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk}))
+        
+        self.assertFalse(response.context['is_topic_liked'])
+        self.assertTrue(response.context['is_topic_disliked'])
+        self.assertEqual([reply.viewer_liked for reply in response.context['replies']], [False, True, False])
+        self.assertContains(response, 'like-reply-btn active', count=1)
+    
+    def test_topic_detail_query_count(self):
+        """Check that the number of queries does not grow with the replies and their authors"""
+        self.client.force_login(self.user)
+        url = reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk})
+        
+        def add_replies(count):
+            for _ in range(count):
+                author = User.objects.create_user(username=f'author{User.objects.count()}', password='testpassword123')
+                reply = Reply.objects.create(content='Reply', author=author, topic=self.topic)
+                reply.likes.add(author, self.user)
+        
+        # The first visit creates the user's read mark, later ones move it
+        self.client.get(url)
+        add_replies(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        add_replies(18)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        
+        self.assertEqual(len(response.context['replies']), 20)
+        self.assertEqual(len(few), len(many))
+
+
+class TopicTrendTests(TestCase):
+    """Tests for the trending scores of topics"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.forum = Forum.objects.create(name='Test Forum', description='Test forum description')
+        self.other_forum = Forum.objects.create(name='Other Forum', description='Other forum description')
+        self.quiet = Topic.objects.create(title='Quiet Topic', content='Content', forum=self.forum, author=self.user)
+        self.busy = Topic.objects.create(title='Busy Topic', content='Content', forum=self.forum, author=self.user)
+        self.client.force_login(self.user)
+    
+    def test_replies_and_likes_update_score(self):
+        """Check that replies and likes add to the topic's score"""
+        self.client.post(reverse('discussions:add_reply', kwargs={'pk': self.busy.pk}), {'content': 'A reply'})
+        self.client.post(reverse('discussions:like_topic', kwargs={'pk': self.busy.pk}))
+        
+        trend = TopicTrend.objects.get(topic=self.busy)
+        self.assertAlmostEqual(trend.score, WEIGHTS['create'] + WEIGHTS['reply'] + WEIGHTS['like'], places=3)
+        self.assertEqual(trend.forum_id, self.forum.pk)
+    
+    def test_moving_topic_updates_forum(self):
+        """Check that the denormalized forum follows the topic"""
+        self.busy.forum = self.other_forum
+        self.busy.save()
+        self.assertEqual(TopicTrend.objects.get(topic=self.busy).forum_id, self.other_forum.pk)
+    
+    def test_forum_sorted_by_trending(self):
+        """Check that ?sort=trending orders a forum's topics by score"""
+        Reply.objects.create(content='A reply', topic=self.quiet, author=self.user)
+        response = self.client.get(
+            reverse('discussions:forum_detail', kwargs={'pk': self.forum.pk}), {'sort': 'trending'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['topics']), [self.quiet, self.busy])
+
+
+class ForumListingTests(TestCase):
+    """Tests for the annotated, paginated forum and topic listings"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.forum = Forum.objects.create(name='Busy Forum', description='Many topics')
+        self.quiet_forum = Forum.objects.create(name='Another Forum', description='One topic')
+        self.topics = [
+            Topic.objects.create(title=f'Topic {i}', content='Content', forum=self.forum, author=self.user)
+            for i in range(25)
+        ]
+        Topic.objects.create(title='Lonely Topic', content='Content', forum=self.quiet_forum, author=self.user)
+        # The oldest topic gets the latest reply
+        for i in range(3):
+            Reply.objects.create(content=f'Reply {i}', topic=self.topics[0], author=self.user)
+        self.client.force_login(self.user)
+    
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+    
+    def test_forum_detail_annotations(self):
+        """Check that topics carry their reply count and last activity"""
+        url = reverse('discussions:forum_detail', kwargs={'pk': self.forum.pk})
+        response = self.client.get(url, {'sort': 'activity'})
+        
+        first = response.context['topics'][0]
+        self.assertEqual(first, self.topics[0])
+        self.assertEqual(first.reply_count, 3)
+        self.assertEqual(first.last_activity_at, self.topics[0].replies.latest('created_at').created_at)
+        self.assertEqual(len(response.context['topics']), 20)
+    
+    def test_forum_detail_activity_pages(self):
+        """Check that sorting by activity walks every topic exactly once"""
+        url = reverse('discussions:forum_detail', kwargs={'pk': self.forum.pk})
+        response = self.client.get(url, {'sort': 'activity'})
+        seen = [topic.pk for topic in response.context['topics']]
+        response = self.client.get(url, {'sort': 'activity', 'cursor': response.context['page'].next_cursor})
+        seen += [topic.pk for topic in response.context['topics']]
+        
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), {topic.pk for topic in self.topics})
+        self.assertEqual(seen[0], self.topics[0].pk)
+    
+    def test_forum_detail_query_count(self):
+        """Check that the topic listing costs the same number of queries for any number of topics"""
+        url = reverse('discussions:forum_detail', kwargs={'pk': self.forum.pk})
+        small, _ = self.count_queries(reverse('discussions:forum_detail', kwargs={'pk': self.quiet_forum.pk}))
+        large, _ = self.count_queries(url)
+        self.assertEqual(small, large)
+        for sort in ('activity', 'trending'):
+            queries, _ = self.count_queries(url, {'sort': sort})
+            self.assertLessEqual(queries, large + 1)
+    
+    def test_forum_list_annotations(self):
+        """Check that forums carry their statistics in a constant number of queries"""
+        queries, response = self.count_queries(reverse('discussions:forum_list'), {'sort': 'activity'})
+        forums = response.context['forums']
+        
+        # The busy forum has the latest reply
+        self.assertEqual(list(forums), [self.forum, self.quiet_forum])
+        self.assertEqual((forums[0].topic_count, forums[0].reply_count), (25, 3))
+        self.assertEqual((forums[1].topic_count, forums[1].reply_count), (1, 0))
+        Forum.objects.create(name='Empty Forum', description='No topics')
+        more_queries, _ = self.count_queries(reverse('discussions:forum_list'))
+        self.assertEqual(queries, more_queries)
+
+
+class ForumStatsTests(TestCase):
+    """Tests for the denormalized forum and topic statistics"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='testpassword123'
+        )
+        self.forum = Forum.objects.create(name='Physics', description='Physics discussions')
+        self.other_forum = Forum.objects.create(name='Chemistry', description='Chemistry discussions')
+        self.topic = Topic.objects.create(title='Topic', content='Content', forum=self.forum, author=self.user)
+        self.replies = [
+            Reply.objects.create(content=f'Reply {i}', topic=self.topic, author=self.other_user)
+            for i in range(3)
+        ]
+    
+    def stats(self, forum):
+        forum.refresh_from_db()
+        return forum.topic_count, forum.reply_count, forum.last_post_at, forum.last_post_author_id
+    
+    def test_counts_follow_posts(self):
+        """Check that creating topics and replies updates both levels"""
+        self.topic.refresh_from_db()
+        self.assertEqual((self.topic.reply_count, self.topic.last_reply_at), (3, self.replies[-1].created_at))
+        self.assertEqual(
+            self.stats(self.forum),
+            (1, 3, self.replies[-1].created_at, self.other_user.pk)
+        )
+        self.assertEqual(self.stats(self.other_forum), (0, 0, None, None))
+    
+    def test_reply_delete(self):
+        """Check that deleting the last reply moves the last post back"""
+        self.replies[-1].delete()
+        self.topic.refresh_from_db()
+        self.assertEqual((self.topic.reply_count, self.topic.last_reply_at), (2, self.replies[1].created_at))
+        self.assertEqual(self.stats(self.forum)[1:3], (2, self.replies[1].created_at))
+    
+    def test_last_activity_follows_posts(self):
+        """Check that last_activity_at is the last post, or the creation time without posts"""
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.last_activity_at, self.replies[-1].created_at)
+        self.assertEqual(Forum.objects.get(pk=self.forum.pk).last_activity_at, self.replies[-1].created_at)
+        self.other_forum.refresh_from_db()
+        self.assertEqual(self.other_forum.last_activity_at, self.other_forum.created_at)
+        
+        for reply in self.replies:
+            reply.delete()
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.last_activity_at, self.topic.created_at)
+        self.assertEqual(Forum.objects.get(pk=self.forum.pk).last_activity_at, self.topic.created_at)
+    
+    def test_topic_move(self):
+        """Check that moving a topic moves its counts to the new forum"""
+        self.topic.forum = self.other_forum
+        self.topic.save()
+        
+        self.assertEqual(self.stats(self.forum), (0, 0, None, None))
+        self.assertEqual(
+            self.stats(self.other_forum),
+            (1, 3, self.replies[-1].created_at, self.other_user.pk)
+        )
+    
+    def test_topic_delete(self):
+        """Check that deleting a topic removes it and its replies from the forum"""
+        later = Topic.objects.create(title='Later', content='Content', forum=self.forum, author=self.user)
+        self.assertEqual(self.stats(self.forum), (2, 3, later.created_at, self.user.pk))
+        
+        later.delete()
+        self.assertEqual(self.stats(self.forum), (1, 3, self.replies[-1].created_at, self.other_user.pk))
+        self.topic.delete()
+        self.assertEqual(self.stats(self.forum), (0, 0, None, None))
+    
+    def test_recompute_command(self):
+        """Check that the command repairs drifted statistics"""
+        expected = self.stats(self.forum)
+        Forum.objects.update(topic_count=7, reply_count=0, last_post_at=None, last_post_author=None)
+        Topic.objects.update(reply_count=0, last_reply_at=None)
+        
+        out = StringIO()
+        call_command('recompute_forum_stats', stdout=out)
+        
+        self.assertIn('1 topics and 2 forums repaired', out.getvalue())
+        self.assertEqual(self.stats(self.forum), expected)
+        self.assertEqual(self.stats(self.other_forum), (0, 0, None, None))
+        self.assertEqual(Topic.objects.get(pk=self.topic.pk).reply_count, 3)
+
+
+class ThreadedReplyTests(TestCase):
+    """Tests for nested replies stored with materialized paths"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.forum = Forum.objects.create(name='Physics', description='Physics discussions')
+        self.topic = Topic.objects.create(title='Topic', content='Content', forum=self.forum, author=self.user)
+        self.first = self.reply('First')
+        self.second = self.reply('Second')
+        self.answer = self.reply('Answer to first', parent=self.first)
+        self.nested = self.reply('Answer to answer', parent=self.answer)
+        self.client.force_login(self.user)
+    
+    def reply(self, content, parent=None, topic=None):
+        return Reply.objects.create(content=content, topic=topic or self.topic, author=self.user, parent=parent)
+    
+    def test_path_segments_sort_numerically(self):
+        """Check that path segments compare like the ids they encode"""
+        self.assertLess(path_segment(35), path_segment(36))
+        self.assertLess(path_segment(99), path_segment(1000))
+        self.assertEqual(len(path_segment(36 ** 5)), len(path_segment(1)))
+    
+    def test_display_order(self):
+        """Check that answers follow their parent, depth first"""
+        self.assertEqual(
+            [reply.content for reply in self.topic.replies.order_by('path')],
+            ['First', 'Answer to first', 'Answer to answer', 'Second']
+        )
+        self.nested.refresh_from_db()
+        self.assertEqual(self.nested.depth, 2)
+        self.assertEqual(self.nested.path, self.first.path + path_segment(self.answer.pk) + path_segment(self.nested.pk))
+    
+    def test_subtree_single_query(self):
+        """Check that a subtree loads with one query"""
+        with self.assertNumQueries(1):
+            subtree = list(self.first.subtree())
+        self.assertEqual(subtree, [self.first, self.answer, self.nested])
+    
+    def test_depth_is_capped(self):
+        """Check that replies beyond the maximum depth attach to the deepest allowed ancestor"""
+        parent = self.first
+        for _ in range(MAX_REPLY_DEPTH + 2):
+            parent = self.reply('Deeper', parent=parent)
+        self.assertEqual(parent.depth, MAX_REPLY_DEPTH)
+        self.assertEqual(parent.parent.depth, MAX_REPLY_DEPTH - 1)
+    
+    def test_add_nested_reply(self):
+        """Check that the reply form posts answers, but only to replies of the same topic"""
+        url = reverse('discussions:add_reply', kwargs={'pk': self.topic.pk})
+        self.client.post(url, {'content': 'Late answer', 'parent': self.first.pk})
+        late = Reply.objects.get(content='Late answer')
+        self.assertEqual((late.parent, late.depth), (self.first, 1))
+        
+        other_topic = Topic.objects.create(title='Other', content='Content', forum=self.forum, author=self.user)
+        foreign = self.reply('Elsewhere', topic=other_topic)
+        self.client.post(url, {'content': 'Misplaced answer', 'parent': foreign.pk})
+        self.assertFalse(Reply.objects.filter(content='Misplaced answer').exists())
+    
+    def test_thread_view(self):
+        """Check that ?thread= shows only a reply and its answers"""
+        response = self.client.get(
+            reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk}), {'thread': self.first.pk}
+        )
+        self.assertEqual(list(response.context['replies']), [self.first, self.answer, self.nested])
+        self.assertContains(response, 'reply-depth-2')
+    
+    def test_deleted_parent_keeps_answers(self):
+        """Check that answers stay in place when their parent is deleted"""
+        self.answer.delete()
+        self.nested.refresh_from_db()
+        self.assertIsNone(self.nested.parent)
+        self.assertEqual(
+            [reply.content for reply in self.topic.replies.all()],
+            ['First', 'Answer to answer', 'Second']
+        )
+
+
+class DiscussionSearchTests(TestCase):
+    """Tests for the full-text search of topics and replies"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.other = User.objects.create_user(username='otheruser', password='testpassword123')
+        self.physics = Forum.objects.create(name='Physics', description='Physics discussions')
+        self.biology = Forum.objects.create(name='Biology', description='Biology discussions')
+        self.quantum = Topic.objects.create(
+            title='Quantum entanglement experiments', content='How do you measure entangled photons?',
+            forum=self.physics, author=self.user
+        )
+        self.cells = Topic.objects.create(
+            title='Cell cultures', content='Growing cultures at low temperature.',
+            forum=self.biology, author=self.other
+        )
+        self.reply = Reply.objects.create(
+            content='We measured entanglement with a photon detector.', topic=self.cells, author=self.other
+        )
+    
+    def test_posts_indexed_on_save(self):
+        """Check that topics and replies are indexed when saved"""
+        self.assertEqual(PostSearchDocument.objects.count(), 3)
+        document = PostSearchDocument.objects.get(reply=self.reply)
+        self.assertEqual((document.topic_id, document.forum_id), (self.cells.pk, self.biology.pk))
+    
+    def test_results_grouped_by_topic(self):
+        """Check that matching replies are shown under their topic, title matches first"""
+        results = search_discussions('entanglement')
+        hits = results[:]
+        self.assertEqual([hit.topic for hit in hits], [self.quantum, self.cells])
+        self.assertTrue(hits[0].matches_topic)
+        self.assertFalse(hits[1].matches_topic)
+        self.assertEqual([reply for reply, _ in hits[1].replies], [self.reply])
+        self.assertEqual(results.post_count, 2)
+    
+    def test_filters(self):
+        """Check the forum, author and solved filters"""
+        self.assertEqual([hit.topic for hit in search_discussions('entanglement', forum=self.biology)[:]], [self.cells])
+        self.assertEqual([hit.topic for hit in search_discussions('entanglement', author='testuser')[:]], [self.quantum])
+        Topic.objects.filter(pk=self.cells.pk).update(is_solved=True)
+        self.assertEqual([hit.topic for hit in search_discussions('entanglement', solved=True)[:]], [self.cells])
+        self.assertEqual([hit.topic for hit in search_discussions('entanglement', solved=False)[:]], [self.quantum])
+    
+    def test_highlight(self):
+        """Check that snippets mark matching words and escape the text"""
+        snippet = highlight('<b>Entangled</b> photons', {'entangl'}, ['phot'])
+        self.assertEqual(snippet, '&lt;b&gt;<mark>Entangled</mark>&lt;/b&gt; <mark>photons</mark>')
+    
+    def test_reindexed_on_edit(self):
+        """Check that editing a post replaces its postings"""
+        self.reply.content = 'Nothing to see here.'
+        self.reply.save()
+        self.assertEqual([hit.topic for hit in search_discussions('entanglement')[:]], [self.quantum])
+        self.assertEqual([hit.topic for hit in search_discussions('nothing')[:]], [self.cells])
+    
+    def test_moved_topic_follows_forum(self):
+        """Check that moving a topic moves its indexed replies too"""
+        self.cells.forum = self.physics
+        self.cells.save()
+        self.assertEqual(PostSearchDocument.objects.filter(forum=self.physics).count(), 3)
+    
+    def test_search_view(self):
+        """Check the search page"""
+        response = self.client.get(reverse('discussions:search'), {'q': 'photon*', 'forum': self.physics.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([hit.topic for hit in response.context['hits']], [self.quantum])
+        self.assertContains(response, '<mark>photons</mark>')
+        
+        response = self.client.get(reverse('discussions:search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['results'])
+    
+    def test_rebuild_command(self):
+        """Check that the rebuild command recreates the index"""
+        PostSearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_discussion_index', stdout=out)
+        self.assertIn('3 posts indexed', out.getvalue())
+        self.assertEqual([hit.topic for hit in search_discussions('entanglement')[:]], [self.quantum, self.cells])
+
+
+class ReadTrackingTests(TestCase):
+    """Tests for the per-user unread state of topics"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(username='reader', password='testpassword123')
+        self.author = User.objects.create_user(username='writer', password='testpassword123')
+        self.forum = Forum.objects.create(name='Physics', description='Physics discussions')
+        self.topic = Topic.objects.create(title='Topic', content='Content', forum=self.forum, author=self.author)
+        self.replies = [
+            Reply.objects.create(content=f'Reply {i}', topic=self.topic, author=self.author) for i in range(3)
+        ]
+        self.client.force_login(self.user)
+    
+    def unread(self, topic=None):
+        return annotate_unread(Topic.objects.filter(pk=(topic or self.topic).pk), self.user).get()
+    
+    def test_unseen_topic_is_new(self):
+        """Check that topics posted since the user joined are new until viewed"""
+        topic = self.unread()
+        self.assertTrue(topic.is_new)
+        self.assertEqual(topic.new_reply_count, 3)
+    
+    def test_viewing_marks_read(self):
+        """Check that viewing a topic moves the read mark, and later replies count as new"""
+        self.client.get(reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk}))
+        topic = self.unread()
+        self.assertFalse(topic.is_new)
+        self.assertEqual(topic.new_reply_count, 0)
+        
+        later = Reply.objects.create(content='Later', topic=self.topic, author=self.author)
+        self.assertEqual(self.unread().new_reply_count, 1)
+        
+        response = self.client.get(reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk}))
+        self.assertEqual([reply.is_unread for reply in response.context['replies']], [False, False, False, True])
+        self.assertEqual(self.unread().new_reply_count, 0)
+        self.assertEqual(TopicReadMark.objects.get(user=self.user).read_at, later.created_at)
+    
+    def test_pages_in_thread_order(self):
+        """Check that a page only marks read the replies up to the first one it doesn't show"""
+        for i in range(3, 26):
+            Reply.objects.create(content=f'Reply {i}', topic=self.topic, author=self.author)
+        # Newest reply, displayed on page 1 right after its parent
+        Reply.objects.create(content='Late answer', topic=self.topic, author=self.author, parent=self.replies[0])
+        url = reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk})
+        
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['replies']), 20)
+        # The 7 replies of page 2, and the late answer newer than them
+        self.assertEqual(self.unread().new_reply_count, 8)
+        
+        # A subtree doesn't move the mark
+        self.client.get(url, {'thread': self.replies[0].pk})
+        self.assertEqual(self.unread().new_reply_count, 8)
+        
+        self.client.get(url, {'cursor': response.context['page'].next_cursor})
+        # The late answer was shown before the mark could cover it: it stays unread rather than the reverse
+        self.assertEqual(self.unread().new_reply_count, 1)
+        self.client.get(url)
+        self.assertEqual(self.unread().new_reply_count, 0)
+    
+    def test_jump_to_first_unread(self):
+        """Check that ?unread=1 redirects to the oldest unread reply"""
+        TopicReadMark.objects.create(user=self.user, topic=self.topic, read_at=self.replies[0].created_at)
+        url = reverse('discussions:topic_detail', kwargs={'pk': self.topic.pk})
+        response = self.client.get(url, {'unread': 1})
+        self.assertRedirects(response, self.replies[1].get_absolute_url(), fetch_redirect_response=False)
+    
+    def test_mark_all_read(self):
+        """Check that marking a forum read covers its topics and drops their marks"""
+        TopicReadMark.objects.create(user=self.user, topic=self.topic, read_at=self.replies[0].created_at)
+        self.client.post(reverse('discussions:mark_all_read', kwargs={'pk': self.forum.pk}))
+        self.assertTrue(ForumReadMark.objects.filter(user=self.user, forum=self.forum).exists())
+        self.assertFalse(TopicReadMark.objects.exists())
+        topic = self.unread()
+        self.assertEqual((topic.is_new, topic.new_reply_count), (False, 0))
+        
+        Reply.objects.create(content='Later', topic=self.topic, author=self.author)
+        self.assertEqual(self.unread().new_reply_count, 1)
+    
+    def test_forum_page_unread_single_query(self):
+        """Check that the unread state of a page of 50 topics comes with the page query"""
+        for i in range(49):
+            Topic.objects.create(title=f'Topic {i}', content='Content', forum=self.forum, author=self.author)
+        with self.assertNumQueries(1):
+            topics = list(annotate_unread(self.forum.topics.all(), self.user)[:50])
+        self.assertEqual(len(topics), 50)
+        self.assertEqual(sum(topic.new_reply_count for topic in topics), 3)
+        
+        response = self.client.get(reverse('discussions:forum_detail', kwargs={'pk': self.forum.pk}))
+        self.assertContains(response, '>New</span>')
+
+
+class ShortcodeTests(TestCase):
+    """Tests for the server-side rendering of visualizer shortcodes"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.forum = Forum.objects.create(name='Chemistry', description='Chemistry discussions')
+    
+    def test_parse_validates_attributes(self):
+        """Check that shortcode attributes are validated into a visualizer configuration"""
+        nodes = parse_content(
+            'Before [dna sequence="cchh" chainType="unknown" energyEfficiency="1.5" markers="[1, 2]"]x[/dna] after'
+            '[wave {broken]y[/wave]'
+        )
+        self.assertEqual([node['type'] for node in nodes], ['text', 'visualizer', 'text', 'visualizer'])
+        self.assertEqual(nodes[1]['config'], {'sequence': 'CCHH', 'markers': [1, 2], 'energyEfficiency': 1.0})
+        self.assertEqual(nodes[3], {'type': 'visualizer', 'tag': 'wave', 'config': {}})
+    
+    def test_render_escapes_text(self):
+        """Check that text renders like |linebreaks and configurations are escaped"""
+        _, html, modules = render_content('<script>alert(1)</script>\n\nSecond paragraph')
+        self.assertEqual(html, '<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>\n\n<p>Second paragraph</p>')
+        self.assertEqual(modules, [])
+        
+        _, html, modules = render_content('[datastructure type="x\'><b>" data="{}"]z[/datastructure]')
+        self.assertNotIn("<b>", html)
+        self.assertIn('data-visualizer-type="energy-network"', html)
+        self.assertEqual(modules, ['three', 'datastructure'])
+    
+    def test_rendered_on_save(self):
+        """Check that topics and replies store their rendered content"""
+        topic = Topic.objects.create(
+            title='Fuel', content='Look: [dna sequence="CCHH" chainType="biofuel"][/dna]', forum=self.forum, author=self.user
+        )
+        self.assertEqual(topic.content_modules, ['three', 'dna'])
+        self.assertIn('molecular-energy-chain', topic.content_html)
+        
+        reply = Reply.objects.create(content='Plain reply', topic=topic, author=self.user)
+        reply.refresh_from_db()
+        self.assertEqual((reply.content_html, reply.content_modules), ('<p>Plain reply</p>', []))
+        
+        topic.content = 'No more visualizers'
+        topic.save()
+        topic.refresh_from_db()
+        self.assertEqual(topic.content_modules, [])
+    
+    def test_page_loads_only_needed_scripts(self):
+        """Check that topic pages include the scripts of the visualizers they show, without cache-busters"""
+        plain = Topic.objects.create(title='Plain', content='Text only', forum=self.forum, author=self.user)
+        response = self.client.get(reverse('discussions:topic_detail', kwargs={'pk': plain.pk}))
+        self.assertNotContains(response, 'js/visualizers/')
+        
+        topic = Topic.objects.create(title='Waves', content='Text', forum=self.forum, author=self.user)
+        Reply.objects.create(content='[wave {"amplitude": 2}][/wave]', topic=topic, author=self.user)
+        response = self.client.get(reverse('discussions:topic_detail', kwargs={'pk': topic.pk}))
+        self.assertContains(response, 'js/visualizers/waves/wave_3d.js')
+        self.assertContains(response, 'js/visualizers/three.min.js')
+        self.assertNotContains(response, 'dna_visualizer.js')
+        self.assertNotContains(response, '?v=')
+    
+    def test_posts_without_html_rendered_lazily(self):
+        """Check that posts stored without rendered content are rendered once when shown, and counted"""
+        metrics.reset('post_render.hit', 'post_render.miss')
+        topic = Topic.objects.create(title='Topic', content='Opening post', forum=self.forum, author=self.user)
+        Reply.objects.bulk_create([
+            Reply(content=f'Imported reply {i}', topic=topic, author=self.user, path=path_segment(i + 1)) for i in range(2)
+        ])
+        url = reverse('discussions:topic_detail', kwargs={'pk': topic.pk})
+        
+        response = self.client.get(url)
+        self.assertContains(response, '<p>Imported reply 1</p>')
+        self.assertEqual(Reply.objects.filter(content_html='').count(), 0)
+        self.assertEqual(metrics.hit_rate('post_render'), (1, 2, 1 / 3))
+        
+        self.client.get(url)
+        self.assertEqual(metrics.hit_rate('post_render')[:2], (4, 2))
+        
+        out = StringIO()
+        call_command('content_cache_stats', '--reset', stdout=out)
+        self.assertIn('4 hits, 2 misses, 66.7% hit rate', out.getvalue())
+        self.assertEqual(metrics.hit_rate('post_render'), (0, 0, None))
+    
+    def test_stale_and_blank_renders(self):
+        """Check that content changed with update() is rendered again and blank content is a hit"""
+        topic = Topic.objects.create(title='Topic', content='Opening post', forum=self.forum, author=self.user)
+        blank = Reply.objects.create(content='   ', topic=topic, author=self.user)
+        Topic.objects.filter(pk=topic.pk).update(content='Edited in bulk')
+        url = reverse('discussions:topic_detail', kwargs={'pk': topic.pk})
+        metrics.reset('post_render.hit', 'post_render.miss')
+        
+        response = self.client.get(url)
+        self.assertContains(response, '<p>Edited in bulk</p>')
+        self.assertEqual(metrics.hit_rate('post_render')[:2], (1, 1))
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(metrics.hit_rate('post_render')[:2], (3, 1))
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "discussions_')])
+        blank.refresh_from_db()
+        self.assertEqual(blank.content_html, '')
+
+
+class SimilarTopicTests(TestCase):
+    """Tests for the detection of similar topics"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.forum = Forum.objects.create(name='Physics', description='Physics discussions')
+        self.topic = Topic.objects.create(
+            title='How to calibrate a photon detector for quantum experiments',
+            content='Our single photon detector gives inconsistent counts after cooling.',
+            forum=self.forum, author=self.user
+        )
+        self.other = Topic.objects.create(
+            title='Best buffer for protein crystallization',
+            content='Which buffer works for lysozyme crystals?',
+            forum=self.forum, author=self.user
+        )
+        self.client.force_login(self.user)
+    
+    def test_signature_estimates_jaccard(self):
+        """Check that identical texts agree everywhere and unrelated ones almost nowhere"""
+        first = minhash(features('calibrate photon detector'))
+        self.assertEqual(estimate(first, minhash(features('calibrate photon detector'))), 1.0)
+        self.assertLess(estimate(first, minhash(features('protein buffer crystals'))), 0.2)
+    
+    def test_find_similar(self):
+        """Check that a reworded title finds the existing topic and only it"""
+        similar = find_similar('Calibrating a photon detector for quantum experiments?')
+        self.assertEqual([topic for topic, _ in similar], [self.topic])
+        self.assertGreater(similar[0][1], 0.5)
+        self.assertEqual(find_similar('Unrelated gardening advice'), [])
+        self.assertEqual(find_similar(self.topic.title, exclude=self.topic.pk), [])
+    
+    def test_candidates_share_the_most_buckets(self):
+        """Check that the candidate limit keeps the topics sharing the most buckets"""
+        words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'theta', 'kappa', 'lambda', 'sigma', 'omega', 'tau']
+        for number in range(10):
+            # Partly similar topics, sharing a few buckets with the target
+            Topic.objects.create(
+                title='Photon detector shielding ' + ' '.join(words[number:number + 3]),
+                content='Cooling question.', forum=self.forum, author=self.user
+            )
+        target = Topic.objects.create(
+            title='Shielding a photon detector from stray laboratory light',
+            content='Dark counts rise when the lights are on.', forum=self.forum, author=self.user
+        )
+        
+        with patch('discussions.similarity.MAX_CANDIDATES', 1):
+            similar = find_similar(target.title, exclude=self.topic.pk)
+        
+        self.assertEqual([topic for topic, _ in similar], [target])
+    
+    def test_lookup_query_count(self):
+        """Check that a lookup runs a fixed number of queries"""
+        with self.assertNumQueries(3):
+            find_similar('photon detector calibration')
+    
+    def test_index_follows_edits(self):
+        """Check that editing a topic reindexes it and deleting it drops its buckets"""
+        self.other.title = 'Calibrate a photon detector for quantum experiments'
+        self.other.save()
+        self.assertIn(self.other, [topic for topic, _ in find_similar('calibrate photon detector quantum experiments')])
+        
+        self.other.delete()
+        self.assertFalse(TopicBucket.objects.filter(topic_id=self.other.pk).exists())
+    
+    def test_similar_topics_endpoint(self):
+        """Check the JSON suggestions for a typed title"""
+        response = self.client.get(reverse('discussions:similar_topics'), {'title': 'photon detector calibrate quantum'})
+        topics = response.json()['topics']
+        self.assertEqual([topic['id'] for topic in topics], [self.topic.pk])
+        self.assertEqual(topics[0]['url'], self.topic.get_absolute_url())
+    
+    def test_create_asks_before_duplicate(self):
+        """Check that creating a near-duplicate topic needs confirmation"""
+        data = {'title': self.topic.title, 'content': 'Same problem here.', 'forum': self.forum.pk}
+        response = self.client.post(reverse('discussions:topic_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([topic for topic, _ in response.context['similar_topics']], [self.topic])
+        self.assertEqual(Topic.objects.count(), 2)
+        
+        response = self.client.post(reverse('discussions:topic_create'), dict(data, confirm_duplicate='1'))
+        self.assertEqual(Topic.objects.count(), 3)
+    
+    def test_rebuild_command(self):
+        """Check that the rebuild command recreates the index"""
+        TopicBucket.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_similarity_index', stdout=out)
+        self.assertIn('2 topics indexed', out.getvalue())
+        self.assertEqual([topic for topic, _ in find_similar(self.topic.title)], [self.topic])
@@ -0,0 +1,107 @@
+"""
+Per-user read tracking of topics.
+
+What a user has read is stored as high-water marks, not as one row per
+read reply:
+
+* TopicReadMark holds, per (user, topic), the creation time of the newest
+  post the user has seen in the topic; everything up to it counts as read.
+* ForumReadMark is the "mark all read" watermark of a forum: everything
+  posted in the forum before it counts as read. Setting it deletes the
+  topic marks it supersedes, so a user's rows stay few.
+
+Without any mark, posts older than the user's account are read. The
+effective mark of a topic is the latest of these three times;
+annotate_unread() computes it, and the number of newer replies, for a whole
+page of topics in the query that loads the page.
+"""
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+
+def annotate_unread(queryset, user):
+    """
+    Annotate topics with the user's read_mark, is_new (created after it) and
+    new_reply_count (replies posted after it).
+
+    Anonymous users get the queryset unchanged.
+    """
+    from .models import Reply, TopicReadMark, ForumReadMark
+
+    if not user.is_authenticated:
+        return queryset
+    floor = Value(user.date_joined, output_field=models.DateTimeField())
+    topic_mark = TopicReadMark.objects.filter(user=user, topic=OuterRef('pk')).values('read_at')[:1]
+    forum_mark = ForumReadMark.objects.filter(user=user, forum=OuterRef('forum_id')).values('marked_at')[:1]
+    # Counted on reply_topic_created_idx
+    new_replies = (
+        Reply.objects.filter(topic=OuterRef('pk'), created_at__gt=OuterRef('read_mark'))
+        .order_by()
+        .values('topic')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return queryset.annotate(
+        read_mark=Greatest(
+            Coalesce(Subquery(topic_mark), floor),
+            Coalesce(Subquery(forum_mark), floor),
+        ),
+    ).annotate(
+        is_new=ExpressionWrapper(Q(created_at__gt=F('read_mark')), output_field=models.BooleanField()),
+        new_reply_count=Coalesce(Subquery(new_replies), Value(0)),
+    )
+
+
+def mark_topic_read(user, topic, read_at):
+    """Move the user's mark of topic forward to read_at (never back)."""
+    from .models import TopicReadMark
+
+    if TopicReadMark.objects.filter(user=user, topic=topic, read_at__lt=read_at).update(read_at=read_at):
+        return
+    try:
+        with transaction.atomic():
+            TopicReadMark.objects.create(user=user, topic=topic, read_at=read_at)
+    except IntegrityError:
+        # The mark is already at or past read_at
+        pass
+
+
+def mark_forum_read(user, forum, now=None):
+    """Mark everything posted in a forum until now as read by the user."""
+    from .models import TopicReadMark, ForumReadMark
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        ForumReadMark.objects.update_or_create(user=user, forum=forum, defaults={'marked_at': now})
+        # Topic marks behind the watermark are redundant
+        TopicReadMark.objects.filter(user=user, topic__forum=forum, read_at__lte=now).delete()
+
+
+def seen_until(topic, replies):
+    """
+    The newest time below which the user has now seen every post of a topic
+    annotated by annotate_unread(), given the replies displayed to them.
+
+    Pages are in thread order, not creation order, so the mark only moves up
+    to the first unread reply that isn't displayed.
+    """
+    shown = [reply.created_at for reply in replies if reply.created_at > topic.read_mark]
+    candidates = [topic.created_at] + shown
+    # On reply_topic_created_idx
+    missed = (
+        topic.replies.filter(created_at__gt=topic.read_mark)
+        .exclude(pk__in=[reply.pk for reply in replies])
+        .order_by('created_at')
+        .values_list('created_at', flat=True)
+        .first()
+    )
+    if missed is not None:
+        candidates = [time for time in candidates if time < missed]
+    return max(candidates, default=topic.read_mark)
+
+
+def first_unread_reply(topic):
+    """The oldest reply of a topic annotated by annotate_unread() that the user hasn't read, or None."""
+    return topic.replies.filter(created_at__gt=topic.read_mark).order_by('created_at', 'pk').first()
@@ -6,6 +6,9 @@ app_name = 'discussions'
 urlpatterns = [
     path('', views.ForumListView.as_view(), name='forum_list'),
     path('forum/<int:pk>/', views.ForumDetailView.as_view(), name='forum_detail'),
+    path('forum/<int:pk>/mark-read/', views.mark_all_read, name='mark_all_read'),
+    path('search/', views.discussion_search, name='search'),
+    path('topic/similar/', views.similar_topics, name='similar_topics'),
     path('topic/new/', views.TopicCreateView.as_view(), name='topic_create'),
     path('forum/<int:forum>/topic/new/', views.TopicCreateView.as_view(), name='topic_create_forum'),
     path('topic/<int:pk>/', views.TopicDetailView.as_view(), name='topic_detail'),
@@ -5,54 +5,140 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.http import JsonResponse
-from .models import Forum, Topic, Reply
-from .forms import TopicForm, ReplyForm
+from .models import Forum, Topic, TopicTrend, Reply, REPLY_ORDERING
+from .forms import TopicForm, ReplyForm, DiscussionSearchForm
+from .search import search_discussions
+from .shortcodes import ensure_rendered, required_scripts
+from .similarity import find_similar, DUPLICATE_SIMILARITY
+from .unread import annotate_unread, mark_topic_read, mark_forum_read, first_unread_reply, seen_until
 
 # Import notification utilities
 from notifications.utils import create_notification
 from notifications.models import Notification
+from config.reactions import toggle_reaction, load_viewer_state, annotate_viewer_state
+from config.trending import record_reaction
+from config.pagination import KeysetPaginationMixin, KeysetPaginator
 
-class ForumListView(ListView):
+def with_topic_stats(queryset):
+    """Topics with their author, shown next to their stored statistics."""
+    return queryset.select_related('author')
+
+def with_forum_stats(queryset):
+    """Forums with the author of their last post."""
+    return queryset.select_related('last_post_author')
+
+class ForumListView(KeysetPaginationMixin, ListView):
     model = Forum
     template_name = 'discussions/forum_list.html'
     context_object_name = 'forums'
+    keyset_ordering = ('name', 'id')
+    keyset_sort_orderings = {'activity': ('-last_activity_at', '-id')}
+    keyset_page_size = 20
+    
+    def get_queryset(self):
+        return with_forum_stats(Forum.objects.all())
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = self.paginate_keyset(self.object_list)
+        context['sort'] = self.request.GET.get('sort', '')
+        context['page'] = page
+        context['forums'] = page.object_list
+        return context
 
-class ForumDetailView(DetailView):
+class ForumDetailView(KeysetPaginationMixin, DetailView):
     model = Forum
     template_name = 'discussions/forum_detail.html'
     context_object_name = 'forum'
+    keyset_ordering = ('-created_at', '-id')
+    keyset_sort_orderings = {'activity': ('-last_activity_at', '-id')}
+    keyset_page_size = 20
+    # ?sort=trending, walks the topic_trend_forum_score_idx index of TopicTrend
+    trending_ordering = ('-score', '-topic_id')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['topics'] = self.object.topics.all()
+        sort = self.request.GET.get('sort', '')
+        if sort == 'trending':
+            trends = TopicTrend.objects.filter(forum=self.object).only('pk', 'score')
+            paginator = KeysetPaginator(self.trending_ordering, self.keyset_page_size)
+            page = paginator.paginate(trends, self.request.GET.get(self.keyset_cursor_param))
+            # Load the page's topics with their stats, in score order
+            ids = [trend.topic_id for trend in page.object_list]
+            topics = annotate_unread(with_topic_stats(Topic.objects.filter(pk__in=ids)), self.request.user).in_bulk()
+            page.object_list = [topics[pk] for pk in ids if pk in topics]
+        else:
+            # New replies of each topic for the current user, in the same query
+            page = self.paginate_keyset(annotate_unread(with_topic_stats(self.object.topics.all()), self.request.user))
+        context['sort'] = sort
+        context['page'] = page
+        context['topics'] = page.object_list
         return context
 
-class TopicDetailView(DetailView):
+class TopicDetailView(KeysetPaginationMixin, DetailView):
     model = Topic
     template_name = 'discussions/topic_detail.html'
     context_object_name = 'topic'
+    queryset = Topic.objects.select_related('author__profile', 'forum')
+    keyset_ordering = REPLY_ORDERING
+    keyset_page_size = 20
+    
+    def get_queryset(self):
+        return annotate_unread(super().get_queryset(), self.request.user)
+    
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        # ?unread=1 jumps to the first reply the user hasn't read
+        if request.GET.get('unread') and request.user.is_authenticated:
+            reply = first_unread_reply(self.object)
+            if reply is not None:
+                return redirect(reply)
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        topic = self.get_object()
-        context['replies'] = topic.replies.all()
+        topic = self.object
+        replies = topic.replies.all()
+        
+        # ?thread=<reply id> shows only that reply and its answers
+        thread = self.request.GET.get('thread')
+        if thread:
+            root = get_object_or_404(topic.replies.only('pk', 'topic', 'path'), pk=thread)
+            replies = root.subtree()
+            context['thread_root'] = root
+        
+        # One page of the thread in display order, with authors and profile pictures
+        page = self.paginate_keyset(replies.select_related('author__profile'))
+        context['page'] = page
+        context['replies'] = page.object_list
+        context['reply_count'] = topic.reply_count
         context['reply_form'] = ReplyForm()
         
-        # Check if user has liked/disliked this topic
-        if self.request.user.is_authenticated:
-            context['is_topic_liked'] = topic.likes.filter(id=self.request.user.id).exists()
-            context['is_topic_disliked'] = topic.dislikes.filter(id=self.request.user.id).exists()
-            
-            # Check if user has liked each reply
-            user_liked_replies = Reply.objects.filter(
-                id__in=[reply.id for reply in context['replies']], 
-                likes=self.request.user
-            ).values_list('id', flat=True)
-            context['user_liked_replies'] = user_liked_replies
+        # Check if user has liked/disliked this topic and liked each reply
+        state = load_viewer_state(self.request.user, Topic, [topic.pk])
+        context['is_topic_liked'] = topic.pk in state.liked
+        context['is_topic_disliked'] = topic.pk in state.disliked
+        annotate_viewer_state(self.request.user, context['replies'])
         
         # Add solution information to each reply
         for reply in context['replies']:
-            reply.is_solution = (topic.solution and topic.solution.id == reply.id)
+            reply.is_solution = reply.pk == topic.solution_id
+        
+        # Stored HTML of the displayed posts, and only the visualizer scripts they use
+        posts = [topic] + list(context['replies'])
+        ensure_rendered(posts)
+        context['visualizer_scripts'] = required_scripts(posts)
+        
+        # Flag the unread replies, then move the user's read mark past what they have now seen.
+        # A ?thread= subtree leaves out replies of the topic, so it never moves the mark
+        if self.request.user.is_authenticated:
+            for reply in context['replies']:
+                reply.is_unread = reply.created_at > topic.read_mark
+            if not thread:
+                seen = seen_until(topic, context['replies'])
+                if seen > topic.read_mark:
+                    mark_topic_read(self.request.user, topic, seen)
         
         return context
 
@@ -62,6 +148,14 @@ class TopicCreateView(LoginRequiredMixin, CreateView):
     template_name = 'discussions/topic_form.html'
     
     def form_valid(self, form):
+        # Ask before opening a question that was already asked, unless confirmed
+        if not self.request.POST.get('confirm_duplicate'):
+            duplicates = find_similar(
+                form.cleaned_data['title'], form.cleaned_data['content'], min_similarity=DUPLICATE_SIMILARITY
+            )
+            if duplicates:
+                form.add_error(None, 'Similar topics already exist. Please check whether one of them answers your question.')
+                return self.render_to_response(self.get_context_data(form=form, similar_topics=duplicates))
         form.instance.author = self.request.user
         messages.success(self.request, 'Topic created successfully!')
         return super().form_valid(form)
@@ -100,12 +194,35 @@ class TopicDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         messages.success(self.request, 'Topic deleted successfully!')
         return super().delete(request, *args, **kwargs)
 
+@login_required
+def similar_topics(request):
+    """Topics similar to the title (and content) of a topic being written, as JSON"""
+    title = request.GET.get('title', '')[:200]
+    content = request.GET.get('content', '')[:5000]
+    exclude = request.GET.get('exclude')
+    similar = find_similar(title, content, exclude=int(exclude) if exclude and exclude.isdigit() else None)
+    
+    return JsonResponse({
+        'topics': [
+            {
+                'id': topic.pk,
+                'title': topic.title,
+                'url': topic.get_absolute_url(),
+                'forum': topic.forum.name,
+                'is_solved': topic.is_solved,
+                'reply_count': topic.reply_count,
+                'similarity': round(score, 2),
+            }
+            for topic, score in similar
+        ]
+    })
+
 @login_required
 def add_reply(request, pk):
     topic = get_object_or_404(Topic, pk=pk)
     
     if request.method == 'POST':
-        form = ReplyForm(request.POST)
+        form = ReplyForm(request.POST, topic=topic)
         if form.is_valid():
             reply = form.save(commit=False)
             reply.topic = topic
@@ -121,7 +238,7 @@ def add_reply(request, pk):
             )
             
             messages.success(request, 'Your reply has been posted!')
-            return redirect('discussions:topic_detail', pk=topic.pk)
+            return redirect(reply)
     
     return redirect('discussions:topic_detail', pk=topic.pk)
 
@@ -142,22 +259,21 @@ class ReplyDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 @login_required
 def like_topic(request, pk):
-    topic = get_object_or_404(Topic, pk=pk)
+    topic = get_object_or_404(Topic.objects.select_related('author'), pk=pk)
     
-    # Remove dislike if exists when liking
-    if topic.dislikes.filter(id=request.user.id).exists():
-        topic.dislikes.remove(request.user)
-    
-    # Check if the user already liked this topic
-    if topic.likes.filter(id=request.user.id).exists():
-        # Unlike
-        topic.likes.remove(request.user)
-        liked = False
-    else:
-        # Like
-        topic.likes.add(request.user)
-        liked = True
-        
+    like_count = topic.like_count
+    
+    # Toggle the like (removing any dislike) and update the stored counters
+    liked = toggle_reaction(
+        topic, request.user, 'likes', 'like_count',
+        opposite='dislikes', opposite_counter='dislike_count'
+    )
+    
+    # Likes gained or lost count towards the trending score
+    record_reaction(TopicTrend, topic.pk, topic.like_count - like_count, forum_id=topic.forum_id)
+    
+    # Only a real insert notifies: None means a concurrent toggle already added it
+    if liked:
         # Create a notification for the topic author
         create_notification(
             recipient=topic.author, 
@@ -170,9 +286,9 @@ def like_topic(request, pk):
     if request.method in ['POST', 'GET'] and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'status': 'success',
-            'liked': liked,
-            'total_likes': topic.total_likes(),
-            'total_dislikes': topic.total_dislikes()
+            'liked': liked is not False,
+            'total_likes': topic.like_count,
+            'total_dislikes': topic.dislike_count
         })
     
     # Redirect to topic detail page
@@ -180,22 +296,21 @@ def like_topic(request, pk):
 
 @login_required
 def dislike_topic(request, pk):
-    topic = get_object_or_404(Topic, pk=pk)
+    topic = get_object_or_404(Topic.objects.select_related('author'), pk=pk)
     
-    # Remove like if exists when disliking
-    if topic.likes.filter(id=request.user.id).exists():
-        topic.likes.remove(request.user)
-    
-    # Check if the user already disliked this topic
-    if topic.dislikes.filter(id=request.user.id).exists():
-        # Undislike
-        topic.dislikes.remove(request.user)
-        disliked = False
-    else:
-        # Dislike
-        topic.dislikes.add(request.user)
-        disliked = True
-        
+    like_count = topic.like_count
+    
+    # Toggle the dislike (removing any like) and update the stored counters
+    disliked = toggle_reaction(
+        topic, request.user, 'dislikes', 'dislike_count',
+        opposite='likes', opposite_counter='like_count'
+    )
+    
+    # Likes gained or lost count towards the trending score
+    record_reaction(TopicTrend, topic.pk, topic.like_count - like_count, forum_id=topic.forum_id)
+    
+    # Only a real insert notifies: None means a concurrent toggle already added it
+    if disliked:
         # Create a notification for the topic author
         create_notification(
             recipient=topic.author, 
@@ -208,9 +323,9 @@ def dislike_topic(request, pk):
     if request.method in ['POST', 'GET'] and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'status': 'success',
-            'disliked': disliked,
-            'total_likes': topic.total_likes(),
-            'total_dislikes': topic.total_dislikes()
+            'disliked': disliked is not False,
+            'total_likes': topic.like_count,
+            'total_dislikes': topic.dislike_count
         })
     
     # Redirect to topic detail page
@@ -218,18 +333,13 @@ def dislike_topic(request, pk):
 
 @login_required
 def like_reply(request, pk):
-    reply = get_object_or_404(Reply, pk=pk)
+    reply = get_object_or_404(Reply.objects.select_related('author'), pk=pk)
     
-    # Check if the user already liked this reply
-    if reply.likes.filter(id=request.user.id).exists():
-        # Unlike
-        reply.likes.remove(request.user)
-        liked = False
-    else:
-        # Like
-        reply.likes.add(request.user)
-        liked = True
-        
+    # Toggle the like and update the stored counter
+    liked = toggle_reaction(reply, request.user, 'likes', 'like_count')
+    
+    # Only a real insert notifies: None means a concurrent toggle already added it
+    if liked:
         # Create a notification for the reply author
         create_notification(
             recipient=reply.author, 
@@ -242,12 +352,12 @@ def like_reply(request, pk):
     if request.method in ['POST', 'GET'] and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'status': 'success',
-            'liked': liked,
-            'total_likes': reply.total_likes()
+            'liked': liked is not False,
+            'total_likes': reply.like_count
         })
     
     # Redirect to topic detail page
-    return redirect('discussions:topic_detail', pk=reply.topic.pk)
+    return redirect('discussions:topic_detail', pk=reply.topic_id)
 
 @login_required
 def mark_solution(request, pk):
@@ -294,3 +404,38 @@ def unmark_solution(request, pk):
     
     messages.success(request, "Solution mark removed.")
     return redirect('discussions:topic_detail', pk=topic.pk)
+
+@login_required
+def mark_all_read(request, pk):
+    """Mark every topic of a forum as read"""
+    forum = get_object_or_404(Forum, pk=pk)
+    if request.method == 'POST':
+        mark_forum_read(request.user, forum)
+        messages.success(request, f"All topics in {forum.name} marked as read.")
+    return redirect(forum)
+
+def discussion_search(request):
+    """Full-text search over topics and replies, grouped by topic."""
+    form = DiscussionSearchForm(request.GET or None)
+    results = page = None
+    if form.is_valid() and form.cleaned_data['q'].strip():
+        data = form.cleaned_data
+        results = search_discussions(
+            data['q'],
+            forum=data['forum'],
+            author=data['author'],
+            solved=data['solved'],
+            date_from=data['date_from'],
+            date_to=data['date_to'],
+        )
+        # Ranked results are paginated by offset, with the same opaque cursors
+        page = KeysetPaginator(('-score',), 20, with_total=True).paginate(results, request.GET.get('cursor'))
+    
+    return render(request, 'discussions/search.html', {
+        'form': form,
+        'query': form.cleaned_data.get('q', '') if form.is_bound and form.is_valid() else '',
+        'results': results,
+        'page': page,
+        'hits': page.object_list if page else [],
+    })
+
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_alter_notification_notification_type'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('like', 'Like'), ('dislike', 'Dislike'), ('favorite', 'Favorite'), ('reply', 'Reply'), ('follow', 'Follow'), ('solution', 'Solution'), ('badge', 'Badge')], max_length=20),
+        ),
+    ]
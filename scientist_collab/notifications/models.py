@@ -11,6 +11,7 @@ class Notification(models.Model):
     REPLY = 'reply'
     FOLLOW = 'follow'
     SOLUTION = 'solution'
+    BADGE = 'badge'  # Sent by the recipient themselves, see accounts.badges
     
     NOTIFICATION_TYPES = [
         (LIKE, 'Like'),
@@ -19,6 +20,7 @@ class Notification(models.Model):
         (REPLY, 'Reply'),
         (FOLLOW, 'Follow'),
         (SOLUTION, 'Solution'),
+        (BADGE, 'Badge'),
     ]
     
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
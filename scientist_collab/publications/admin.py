@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Publication
+from .models import Publication, Keyword
 
 @admin.register(Publication)
 class PublicationAdmin(admin.ModelAdmin):
@@ -7,3 +7,8 @@ class PublicationAdmin(admin.ModelAdmin):
     search_fields = ('title', 'abstract', 'keywords', 'author__username', 'author__email')
     list_filter = ('publication_date', 'created_at')
     date_hierarchy = 'publication_date'
+
+@admin.register(Keyword)
+class KeywordAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
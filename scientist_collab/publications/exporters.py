@@ -0,0 +1,158 @@
+"""
+Streaming export of the publication catalog as CSV, JSON Lines or BibTeX.
+
+Exports are generated row by row and consumed by StreamingHttpResponse (or
+written to a file by the export_publications command). The queryset is
+walked in primary-key order, chunk_size rows per query, so memory use does
+not depend on the catalog size, even on database drivers that buffer whole
+result sets client-side.
+
+CSV cells that a spreadsheet would evaluate as a formula (=, +, -, @...)
+are prefixed with a quote, so an exported title can't run anything.
+"""
+import csv
+import datetime
+import json
+
+# Columns of the CSV export, also the keys of each JSONL object
+EXPORT_FIELDS = (
+    'id', 'title', 'author', 'author_username', 'co_authors', 'keywords',
+    'publication_date', 'abstract', 'like_count', 'url',
+)
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'bibtex': ('application/x-bibtex; charset=utf-8', 'bib'),
+}
+
+# Leading characters that make spreadsheet applications evaluate a cell
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+BIBTEX_ESCAPES = str.maketrans({
+    '{': r'\{', '}': r'\}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#', '_': r'\_',
+    '\\': r'\textbackslash{}',
+})
+
+
+class ExportError(ValueError):
+    """Invalid export parameters."""
+
+
+def filter_publications(queryset, author=None, keyword=None, date_from=None, date_to=None):
+    """
+    Apply the export filters: author username, keyword slug and an inclusive
+    publication date range (date objects or YYYY-MM-DD strings).
+    """
+    if author:
+        queryset = queryset.filter(author__username=author)
+    if keyword:
+        queryset = queryset.filter(tags__slug=keyword)
+    for lookup, value in (('gte', date_from), ('lte', date_to)):
+        if not value:
+            continue
+        if isinstance(value, str):
+            try:
+                value = datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ExportError(f"Invalid date: {value}")
+        queryset = queryset.filter(**{f'publication_date__{lookup}': value})
+    return queryset
+
+
+def iter_publications(queryset, chunk_size=2000):
+    """Yield the publications of a queryset, one keyset-paginated chunk at a time."""
+    queryset = queryset.select_related('author').only(
+        'pk', 'title', 'abstract', 'co_authors', 'keywords', 'publication_date', 'like_count',
+        'author__username', 'author__first_name', 'author__last_name',
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def to_row(publication, base_url=''):
+    author = publication.author
+    return {
+        'id': publication.pk,
+        'title': publication.title,
+        'author': author.get_full_name() or author.username,
+        'author_username': author.username,
+        'co_authors': publication.co_authors,
+        'keywords': publication.keywords,
+        'publication_date': publication.publication_date.isoformat(),
+        'abstract': publication.abstract,
+        'like_count': publication.like_count,
+        'url': base_url + publication.get_absolute_url(),
+    }
+
+
+class _Echo:
+    """File-like object returning what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    """Neutralize a text value a spreadsheet would read as a formula."""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_csv(publications, base_url=''):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for publication in publications:
+        row = to_row(publication, base_url)
+        yield writer.writerow([_csv_cell(row[field]) for field in EXPORT_FIELDS])
+
+
+def export_jsonl(publications, base_url=''):
+    for publication in publications:
+        yield json.dumps(to_row(publication, base_url), ensure_ascii=False) + '\n'
+
+
+def _bibtex_name(name):
+    """Turn 'Marie Curie' into 'Curie, Marie'."""
+    first, _, last = name.strip().rpartition(' ')
+    return f'{last}, {first}' if first else last
+
+
+def export_bibtex(publications, base_url=''):
+    for publication in publications:
+        row = to_row(publication, base_url)
+        authors = [row['author']] + [name for name in publication.get_co_authors_list() if name]
+        fields = [
+            ('title', row['title']),
+            ('author', ' and '.join(_bibtex_name(name) for name in authors)),
+            ('year', str(publication.publication_date.year)),
+            ('month', str(publication.publication_date.month)),
+            ('abstract', row['abstract']),
+            ('keywords', row['keywords']),
+            ('url', row['url']),
+        ]
+        body = ',\n'.join(
+            f'  {name} = {{{value.translate(BIBTEX_ESCAPES)}}}' for name, value in fields if value
+        )
+        key = f"{publication.author.username}{publication.publication_date.year}_{publication.pk}"
+        yield f'@article{{{key},\n{body}\n}}\n\n'
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'jsonl': export_jsonl,
+    'bibtex': export_bibtex,
+}
+
+
+def export_publications(queryset, export_format, base_url='', chunk_size=2000):
+    """Return an iterator over the text chunks of an export."""
+    if export_format not in EXPORTERS:
+        raise ExportError(f"Unknown export format: {export_format}")
+    return EXPORTERS[export_format](iter_publications(queryset, chunk_size), base_url)
@@ -0,0 +1,157 @@
+"""
+Background text extraction for uploaded publication PDFs.
+
+When a publication is saved with a new document, a DocumentText row is
+marked pending and, once the transaction commits, the PDF is handed to a
+background thread. Pages are read and stored one at a time (DocumentPage),
+so a large PDF is never held in memory as a whole. When extraction
+finishes, the publication is reindexed so search can see the paper body.
+
+Jobs left pending by a restarted process, and documents uploaded before
+this pipeline existed, are processed by the extract_document_text command.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Number of pages written per bulk insert
+PAGE_BATCH_SIZE = 20
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf-extraction')
+    return _executor
+
+
+def queue_extraction(publication):
+    """
+    Mark a publication's document for extraction if it changed.
+
+    Returns True if a job was queued.
+    """
+    from .models import DocumentText
+
+    if not publication.document:
+        return False
+    source_name = publication.document.name
+    if DocumentText.objects.filter(publication_id=publication.pk, source_name=source_name).exists():
+        return False
+
+    DocumentText.objects.update_or_create(
+        publication_id=publication.pk,
+        defaults={
+            'status': DocumentText.PENDING,
+            'source_name': source_name,
+            'page_count': 0,
+            'checksum': '',
+            'error': '',
+        },
+    )
+    transaction.on_commit(lambda: dispatch(publication.pk))
+    return True
+
+
+def dispatch(publication_id):
+    """Run an extraction job in the background thread, or inline if disabled."""
+    if getattr(settings, 'DOCUMENT_TEXT_EXTRACTION_ASYNC', True):
+        get_executor().submit(_run_in_thread, publication_id)
+    else:
+        extract_publication_text(publication_id)
+
+
+def _run_in_thread(publication_id):
+    close_old_connections()
+    try:
+        extract_publication_text(publication_id)
+    finally:
+        close_old_connections()
+
+
+def iter_pdf_pages(file):
+    """Yield the text of each page of a PDF file object, one page at a time."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file)
+    for page in reader.pages:
+        yield page.extract_text() or ''
+
+
+def extract_publication_text(publication_id):
+    """
+    Extract and store the text of a publication's document.
+
+    Returns the final DocumentText status.
+    """
+    from .models import Publication, DocumentText, DocumentPage
+    from .search import index_publication
+
+    publication = Publication.objects.filter(pk=publication_id).first()
+    if publication is None or not publication.document:
+        DocumentText.objects.filter(publication_id=publication_id).delete()
+        return None
+
+    DocumentPage.objects.filter(publication_id=publication_id).delete()
+    digest = hashlib.sha1()
+    page_count = 0
+    batch = []
+
+    try:
+        with publication.document.open('rb') as file:
+            for number, text in enumerate(iter_pdf_pages(file), start=1):
+                digest.update(text.encode('utf-8'))
+                batch.append(DocumentPage(publication_id=publication_id, number=number, text=text))
+                page_count = number
+                if len(batch) >= PAGE_BATCH_SIZE:
+                    DocumentPage.objects.bulk_create(batch)
+                    batch = []
+        DocumentPage.objects.bulk_create(batch)
+    except Exception as e:
+        logger.warning(f"Text extraction failed for publication {publication_id}: {e}")
+        DocumentPage.objects.filter(publication_id=publication_id).delete()
+        DocumentText.objects.update_or_create(
+            publication_id=publication_id,
+            defaults={
+                'status': DocumentText.FAILED,
+                'source_name': publication.document.name,
+                'page_count': 0,
+                'checksum': '',
+                'error': str(e)[:1000],
+            },
+        )
+        return DocumentText.FAILED
+
+    DocumentText.objects.update_or_create(
+        publication_id=publication_id,
+        defaults={
+            'status': DocumentText.DONE,
+            'source_name': publication.document.name,
+            'page_count': page_count,
+            'checksum': digest.hexdigest(),
+            'error': '',
+        },
+    )
+    index_publication(publication)
+    return DocumentText.DONE
+
+
+def init_worker():
+    """Initializer of the processes used by the extract_document_text command."""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def extract_in_worker(publication_id):
+    try:
+        return publication_id, extract_publication_text(publication_id)
+    finally:
+        close_old_connections()
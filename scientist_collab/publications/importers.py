@@ -0,0 +1,443 @@
+"""
+Bulk import of publications from BibTeX or JSON Lines.
+
+Input is parsed as a stream, one record at a time, so files of any size are
+imported in constant memory. Records are validated and mapped to Django
+users, then written in bulk_create batches, one transaction per batch:
+
+    importer = PublicationImporter(pdf_dir='/data/pdfs', default_author=user)
+    for batch in importer.batches(iter_bibtex(file), batch_size=500):
+        importer.save(batch)
+
+bulk_create skips the post_save receivers, so save() does their work in
+bulk: keyword links, search postings and trending rows are inserted per
+batch, related publications are updated, the authors' badge metrics are
+recounted, and PDFs are queued for text extraction (run
+extract_document_text afterwards).
+
+JSONL records are objects with the keys title, abstract, authors (list or
+"A and B" string), keywords (list or comma-separated string),
+publication_date (YYYY-MM-DD) or year, and optionally file and key.
+"""
+import datetime
+import json
+import os
+import re
+import unicodedata
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .keywords import get_or_create_keywords, invalidate_top_keywords, parse_keywords
+
+BIBTEX_SKIPPED_TYPES = frozenset(['comment', 'string', 'preamble'])
+
+MONTHS = {
+    name: number for number, name in enumerate(
+        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1
+    )
+}
+
+# LaTeX accent commands and the Unicode combining character they stand for
+LATEX_ACCENTS = {
+    "'": '\u0301', '`': '\u0300', '^': '\u0302', '"': '\u0308', '~': '\u0303',
+    '=': '\u0304', '.': '\u0307', 'c': '\u0327', 'v': '\u030c', 'u': '\u0306', 'H': '\u030b',
+}
+LATEX_ACCENT_RE = re.compile(r'''\\([`'^"~=.]|[cvuH](?=[\s{]))\s*\{?\s*([A-Za-z])\}?''')
+LATEX_COMMAND_RE = re.compile(r'\\[A-Za-z]+\s*')
+LATEX_ESCAPE_RE = re.compile(r'\\([{}&%$#_])')
+LATEX_ESCAPED_RE = re.compile('[\ue000-\ue07f]')
+
+
+class RecordError(ValueError):
+    """A record that cannot be imported."""
+
+
+class ImportRecord:
+    """A validated publication record, not yet saved."""
+
+    def __init__(self, position, title, abstract, authors, keywords, publication_date, file=None, key=None):
+        self.position = position
+        self.title = title
+        self.abstract = abstract
+        self.authors = authors
+        self.keywords = keywords
+        self.publication_date = publication_date
+        self.file = file
+        self.key = key
+
+
+def clean_latex(value):
+    """Turn a BibTeX field value into plain text."""
+    value = LATEX_ACCENT_RE.sub(
+        lambda match: unicodedata.normalize('NFC', match.group(2) + LATEX_ACCENTS[match.group(1)]), value
+    )
+    value = value.replace('\\textbackslash{}', '\x00').replace('~', ' ')
+    # Escaped special characters survive the removal of grouping braces
+    value = LATEX_ESCAPE_RE.sub(lambda match: chr(0xE000 + ord(match.group(1))), value)
+    value = LATEX_COMMAND_RE.sub('', value).replace('{', '').replace('}', '')
+    value = LATEX_ESCAPED_RE.sub(lambda match: chr(ord(match.group()) - 0xE000), value).replace('\x00', '\\')
+    return ' '.join(value.split())
+
+
+def iter_jsonl(file):
+    """Yield (line number, record dict or RecordError) for a JSON Lines file."""
+    for number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, RecordError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield number, RecordError("Expected a JSON object")
+            continue
+        yield number, record
+
+
+def _parse_bibtex_fields(body):
+    """Parse 'key, name = {value}, name = "value", year = 2020' into (key, fields)."""
+    key, _, rest = body.partition(',')
+    fields = {}
+    index, length = 0, len(rest)
+    while index < length:
+        equals = rest.find('=', index)
+        if equals == -1:
+            break
+        name = rest[index:equals].strip(' \t\r\n,').lower()
+        index = equals + 1
+        while index < length and rest[index].isspace():
+            index += 1
+        parts = []
+        # A value is a {braced} or "quoted" string or a bare word, concatenated with #
+        while index < length:
+            char = rest[index]
+            if char == '{':
+                depth, start = 0, index
+                while index < length:
+                    if rest[index] == '\\':
+                        index += 2
+                        continue
+                    if rest[index] == '{':
+                        depth += 1
+                    elif rest[index] == '}':
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    index += 1
+                parts.append(rest[start + 1:index])
+                index += 1
+            elif char == '"':
+                end = index + 1
+                depth = 0
+                while end < length and (rest[end] != '"' or depth):
+                    if rest[end] == '\\':
+                        end += 2
+                        continue
+                    depth += {'{': 1, '}': -1}.get(rest[end], 0)
+                    end += 1
+                parts.append(rest[index + 1:end])
+                index = end + 1
+            else:
+                match = re.match(r'[^,#\s]+', rest[index:])
+                word = match.group() if match else ''
+                parts.append(MONTHS.get(word.lower()[:3], word) if name == 'month' else word)
+                index += max(len(word), 1)
+            while index < length and rest[index].isspace():
+                index += 1
+            if index < length and rest[index] == '#':
+                index += 1
+                while index < length and rest[index].isspace():
+                    index += 1
+                continue
+            break
+        if name:
+            fields[name] = ''.join(str(part) for part in parts)
+        while index < length and rest[index] in ', \t\r\n':
+            index += 1
+    return key.strip(), fields
+
+
+def iter_bibtex(file):
+    """
+    Yield (line number, record dict or RecordError) for a BibTeX file.
+
+    Entries are read line by line and parsed as soon as their braces close,
+    so only one entry is held in memory at a time.
+    """
+    buffer, start_line, depth, opened = None, 0, 0, False
+    for number, line in enumerate(file, start=1):
+        if buffer is None:
+            at = line.find('@')
+            if at == -1:
+                continue
+            buffer, start_line, depth, opened = [], number, 0, False
+            line = line[at:]
+        buffer.append(line)
+        unescaped = LATEX_ESCAPE_RE.sub('', line)
+        depth += unescaped.count('{') - unescaped.count('}')
+        opened = opened or '{' in unescaped
+        if depth > 0 or not opened:
+            continue
+
+        text = ''.join(buffer).strip()
+        buffer = None
+        entry_type, _, body = text[1:].partition('{')
+        entry_type = entry_type.strip().lower()
+        if entry_type in BIBTEX_SKIPPED_TYPES:
+            continue
+        body = body.rstrip()
+        if body.endswith('}'):
+            body = body[:-1]
+        key, fields = _parse_bibtex_fields(body)
+        record = {name: clean_latex(value) for name, value in fields.items()}
+        record['key'] = key
+        if 'author' in record:
+            record['authors'] = [_bibtex_name(name) for name in re.split(r'\s+and\s+', record.pop('author'))]
+        yield start_line, record
+
+    if buffer is not None:
+        yield start_line, RecordError("Unterminated BibTeX entry")
+
+
+def _bibtex_name(name):
+    """Turn 'Curie, Marie' into 'Marie Curie'."""
+    last, comma, first = name.partition(',')
+    return f'{first.strip()} {last.strip()}'.strip() if comma else name.strip()
+
+
+def _split_list(value, separators):
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in re.split(separators, str(value or '')) if item.strip()]
+
+
+def parse_date(record):
+    value = record.get('publication_date') or record.get('date')
+    if value:
+        try:
+            return datetime.date.fromisoformat(str(value)[:10])
+        except ValueError:
+            raise RecordError(f"Invalid publication date: {value}")
+    year = str(record.get('year') or '').strip()
+    if not year.isdigit():
+        raise RecordError("Missing publication date or year")
+    month = str(record.get('month') or '1').strip()
+    month = int(month) if month.isdigit() else MONTHS.get(month[:3].lower(), 1)
+    try:
+        return datetime.date(int(year), month, 1)
+    except ValueError:
+        raise RecordError(f"Invalid year: {year}")
+
+
+def normalize_record(position, record):
+    """Validate a parsed record and return an ImportRecord."""
+    if isinstance(record, RecordError):
+        raise record
+    title = ' '.join(str(record.get('title') or '').split())
+    if not title:
+        raise RecordError("Missing title")
+    return ImportRecord(
+        position=position,
+        title=title[:200],
+        abstract=str(record.get('abstract') or '').strip(),
+        authors=_split_list(record.get('authors') or record.get('author'), r'\s+and\s+|;'),
+        keywords=', '.join(_split_list(record.get('keywords'), r'[,;]')),
+        publication_date=parse_date(record),
+        file=record.get('file') or record.get('pdf'),
+        key=record.get('key') or record.get('id'),
+    )
+
+
+class PublicationImporter:
+    """Maps records to users and files, and writes them in bulk."""
+
+    def __init__(self, pdf_dir=None, default_author=None, dry_run=False):
+        from .models import Publication
+
+        self.pdf_dir = pdf_dir
+        self.default_author = default_author
+        self.dry_run = dry_run
+        self.storage = Publication._meta.get_field('document').storage
+        self.errors = []
+        self.skipped = 0
+        self.imported = 0
+        self.files = 0
+        self._users = None
+
+    def get_user_index(self):
+        """Map lowercased usernames, emails and full names to user ids, loaded once."""
+        if self._users is None:
+            self._users = {}
+            rows = User.objects.values_list('pk', 'username', 'email', 'first_name', 'last_name')
+            for pk, username, email, first_name, last_name in rows.iterator():
+                full_name = f'{first_name} {last_name}'.strip().lower()
+                for key in (username.lower(), email.lower(), full_name):
+                    if key:
+                        self._users.setdefault(key, pk)
+        return self._users
+
+    def resolve_authors(self, names):
+        """Return (author id, co-author names): the first known author owns the record."""
+        users = self.get_user_index()
+        for index, name in enumerate(names):
+            user_id = users.get(' '.join(name.lower().split()))
+            if user_id:
+                return user_id, names[:index] + names[index + 1:]
+        if self.default_author is None:
+            raise RecordError(f"No known user among the authors: {', '.join(names) or '-'}")
+        return self.default_author.pk, names
+
+    def find_pdf(self, record):
+        """Return the path of the record's PDF in pdf_dir, or None."""
+        if not self.pdf_dir:
+            return None
+        candidates = []
+        if record.file:
+            # BibTeX tools write file = {Description:path/to/file.pdf:PDF}
+            parts = [part for part in str(record.file).split(':') if part.lower().endswith('.pdf')]
+            candidates.extend(os.path.basename(part) for part in parts or [record.file])
+        if record.key:
+            candidates.append(f'{record.key}.pdf')
+        for name in candidates:
+            path = os.path.join(self.pdf_dir, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def batches(self, records, batch_size=500):
+        """Normalize raw (position, record) pairs and group them in batches."""
+        batch = []
+        for position, raw in records:
+            try:
+                batch.append(normalize_record(position, raw))
+            except RecordError as e:
+                self.errors.append((position, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def build(self, batch):
+        """Turn a batch of ImportRecords into unsaved Publications, dropping duplicates."""
+        from .models import Publication
+
+        existing = set(
+            Publication.objects.filter(title__in=[record.title for record in batch])
+            .values_list('title', 'publication_date')
+        )
+        publications = []
+        for record in batch:
+            key = (record.title, record.publication_date)
+            if key in existing:
+                self.skipped += 1
+                continue
+            existing.add(key)
+            try:
+                author_id, co_authors = self.resolve_authors(record.authors)
+            except RecordError as e:
+                self.errors.append((record.position, str(e)))
+                continue
+            publications.append((record, Publication(
+                title=record.title,
+                abstract=record.abstract,
+                author_id=author_id,
+                co_authors=', '.join(co_authors)[:500],
+                keywords=record.keywords[:200],
+                publication_date=record.publication_date,
+            )))
+        return publications
+
+    def save(self, batch):
+        """
+        Write one batch in a transaction. Returns the number of publications created.
+
+        PDFs are stored before the rows that reference them; if the batch fails,
+        those no other publication references are removed after the rollback.
+        """
+        from .models import Publication, DocumentText, PublicationTrend
+        from .related import update_related
+        from .search import bulk_index_publications
+        from accounts.badges import recount_metrics
+        from config.trending import WEIGHTS
+
+        stored = []
+        try:
+            with transaction.atomic():
+                pairs = self.build(batch)
+                if self.dry_run or not pairs:
+                    self.imported += len(pairs)
+                    return len(pairs)
+
+                for record, publication in pairs:
+                    path = self.find_pdf(record)
+                    if path:
+                        with open(path, 'rb') as file:
+                            publication.document = self.storage.save(
+                                'publications/' + os.path.basename(path), File(file, name=os.path.basename(path))
+                            )
+                        stored.append(publication.document.name)
+                        self.files += 1
+
+                publications = [publication for _, publication in pairs]
+                last_pk = Publication.objects.aggregate(last=Max('pk'))['last'] or 0
+                Publication.objects.bulk_create(publications)
+                if not connection.features.can_return_rows_from_bulk_insert:
+                    self._fetch_pks(publications, last_pk)
+
+                self._link_keywords(publications)
+                bulk_index_publications(publications)
+                # New rows, so no existing score to decay, see record_new_publication
+                now = timezone.now()
+                PublicationTrend.objects.bulk_create([
+                    PublicationTrend(publication_id=publication.pk, score=WEIGHTS['create'], decayed_at=now)
+                    for publication in publications
+                ])
+                # After the search postings, which give update_related() its candidates
+                for publication in publications:
+                    update_related(publication)
+                DocumentText.objects.bulk_create([
+                    DocumentText(publication_id=publication.pk, source_name=publication.document.name)
+                    for publication in publications if publication.document
+                ])
+                # One recount per author of the batch, see accounts.badges
+                recount_metrics({publication.author_id for publication in publications}, ['publications'])
+        except Exception:
+            # The PDFs were stored before the batch failed; their references were rolled back
+            for name in stored:
+                transaction.on_commit(partial(self.storage.discard, name))
+            raise
+        self.imported += len(publications)
+        return len(publications)
+
+    def _fetch_pks(self, publications, last_pk):
+        """Set the primary keys of bulk-created rows on backends that do not return them."""
+        from .models import Publication
+
+        rows = Publication.objects.filter(pk__gt=last_pk).values_list('pk', 'title', 'publication_date', 'author_id')
+        pks = {(title, date, author_id): pk for pk, title, date, author_id in rows}
+        for publication in publications:
+            publication.pk = pks[(publication.title, publication.publication_date, publication.author_id)]
+
+    def _link_keywords(self, publications):
+        from .models import Publication
+
+        parsed = {publication.pk: parse_keywords(publication.keywords) for publication in publications}
+        all_pairs = {slug: name for pairs in parsed.values() for slug, name in pairs}
+        keywords = {keyword.slug: keyword.pk for keyword in get_or_create_keywords(list(all_pairs.items()))}
+        through = Publication.tags.through
+        through.objects.bulk_create([
+            through(publication_id=publication_id, keyword_id=keywords[slug])
+            for publication_id, pairs in parsed.items()
+            for slug, _ in pairs if slug in keywords
+        ], ignore_conflicts=True)
+        if keywords:
+            invalidate_top_keywords()
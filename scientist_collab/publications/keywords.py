@@ -0,0 +1,88 @@
+"""
+Normalized publication keywords.
+
+Publication.keywords stays the comma-separated field users edit; on save it
+is split once into Keyword rows linked through Publication.tags, which back
+tag filtering (?tag=<slug>), facet counts and the keyword cloud.
+"""
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils.text import slugify
+
+TOP_KEYWORDS_CACHE_KEY = 'publications:top_keywords'
+TOP_KEYWORDS_CACHE_TIMEOUT = 600
+
+
+def parse_keywords(value):
+    """Split a comma-separated keyword string into unique (slug, name) pairs."""
+    pairs = {}
+    for name in (value or '').split(','):
+        name = ' '.join(name.split())[:100]
+        slug = slugify(name, allow_unicode=True)[:100]
+        if slug and slug not in pairs:
+            pairs[slug] = name
+    return list(pairs.items())
+
+
+def get_or_create_keywords(pairs):
+    """Return the Keyword rows for (slug, name) pairs, creating missing ones in bulk."""
+    from .models import Keyword
+
+    slugs = [slug for slug, _ in pairs]
+    existing = {keyword.slug: keyword for keyword in Keyword.objects.filter(slug__in=slugs)}
+    missing = [Keyword(slug=slug, name=name) for slug, name in pairs if slug not in existing]
+    if missing:
+        Keyword.objects.bulk_create(missing, ignore_conflicts=True)
+        existing = {keyword.slug: keyword for keyword in Keyword.objects.filter(slug__in=slugs)}
+    return [existing[slug] for slug in slugs if slug in existing]
+
+
+def sync_keywords(publication):
+    """Link a publication to the Keyword rows of its keywords string."""
+    pairs = parse_keywords(publication.keywords)
+    current = set(publication.tags.values_list('slug', flat=True))
+    if current == {slug for slug, _ in pairs}:
+        return False
+
+    publication.tags.set(get_or_create_keywords(pairs))
+    invalidate_top_keywords()
+    return True
+
+
+def invalidate_top_keywords():
+    cache.delete(TOP_KEYWORDS_CACHE_KEY)
+
+
+def get_top_keywords(limit=30):
+    """Return the most used keywords as dicts (name, slug, count), cached."""
+    from .models import Keyword
+
+    keywords = cache.get(TOP_KEYWORDS_CACHE_KEY)
+    if keywords is None:
+        keywords = list(
+            Keyword.objects.annotate(count=Count('publications'))
+            .filter(count__gt=0)
+            .order_by('-count', 'name')
+            .values('name', 'slug', 'count')[:100]
+        )
+        cache.set(TOP_KEYWORDS_CACHE_KEY, keywords, TOP_KEYWORDS_CACHE_TIMEOUT)
+    return keywords[:limit]
+
+
+def keyword_facets(publications, limit=15):
+    """
+    Count keywords over a set of publications.
+
+    Accepts a Publication queryset or a list of publication ids and returns
+    dicts (name, slug, count), most frequent first.
+    """
+    from .models import Keyword
+
+    if hasattr(publications, 'values'):
+        publications = publications.values('pk')
+    return list(
+        Keyword.objects.filter(publications__in=publications)
+        .annotate(count=Count('publications'))
+        .order_by('-count', 'name')
+        .values('name', 'slug', 'count')[:limit]
+    )
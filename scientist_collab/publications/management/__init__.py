@@ -0,0 +1 @@
+# Django management commands for publications app 
\ No newline at end of file
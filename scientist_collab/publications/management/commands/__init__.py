@@ -0,0 +1 @@
+# Management commands for publications app
\ No newline at end of file
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from config.trending import WEIGHTS, decay_all, seed_scores
+from publications.models import Publication, PublicationTrend, Favorite
+from discussions.models import Topic, TopicTrend, Reply
+
+def publication_events():
+    """Past trending events of every publication, for --rebuild."""
+    # Likes have no timestamp, count them from the publication date
+    for pk, created_at, like_count in Publication.objects.values_list('pk', 'created_at', 'like_count').iterator():
+        yield pk, WEIGHTS['create'] + like_count * WEIGHTS['like'], created_at, {}
+    for pk, created_at in Favorite.objects.values_list('publication_id', 'created_at').iterator():
+        yield pk, WEIGHTS['favorite'], created_at, {}
+
+def topic_events():
+    """Past trending events of every topic, for --rebuild."""
+    for pk, forum_id, created_at, like_count in Topic.objects.values_list('pk', 'forum_id', 'created_at', 'like_count').iterator():
+        yield pk, WEIGHTS['create'] + like_count * WEIGHTS['like'], created_at, {'forum_id': forum_id}
+    for pk, forum_id, created_at in Reply.objects.values_list('topic_id', 'topic__forum_id', 'created_at').iterator():
+        yield pk, WEIGHTS['reply'], created_at, {'forum_id': forum_id}
+
+class Command(BaseCommand):
+    help = 'Decays the trending scores of publications and topics to the present (run periodically, e.g. hourly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows decayed per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute all scores from the stored likes, favorites and replies')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            for model, events in ((PublicationTrend, publication_events()), (TopicTrend, topic_events())):
+                written = seed_scores(model, events)
+                self.stdout.write(f'{model.__name__}: {written} rows rebuilt')
+            self.stdout.write(self.style.SUCCESS('Trending scores rebuilt'))
+            return
+
+        for model in (PublicationTrend, TopicTrend):
+            decayed, deleted = decay_all(model, batch_size=options['batch_size'])
+            self.stdout.write(f'{model.__name__}: {decayed} rows decayed, {deleted} faded out')
+        self.stdout.write(self.style.SUCCESS('Trending scores decayed'))
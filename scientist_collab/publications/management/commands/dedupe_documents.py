@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from publications.models import Publication, DocumentText
+
+class Command(BaseCommand):
+    help = 'Moves documents uploaded before content-addressed storage into it, deduplicating identical files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the documents that would be moved')
+
+    def handle(self, *args, **options):
+        storage = Publication._meta.get_field('document').storage
+        publications = Publication.objects.exclude(document='').only('pk', 'document').order_by('pk')
+
+        moved = missing = 0
+        bytes_before = 0
+        for publication in publications.iterator():
+            name = publication.document.name
+            if storage.content_hash(name):
+                continue
+            if not storage.exists(name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'Missing file for publication {publication.pk}: {name}'))
+                continue
+
+            bytes_before += storage.size(name)
+            moved += 1
+            if options['dry_run']:
+                continue
+
+            with storage.open(name, 'rb') as file:
+                new_name = storage.save(name, file)
+            # Update the row directly: saving the model would reindex and re-extract it
+            Publication.objects.filter(pk=publication.pk).update(document=new_name)
+            DocumentText.objects.filter(publication_id=publication.pk, source_name=name).update(source_name=new_name)
+            storage.delete(name)
+
+        if options['dry_run']:
+            self.stdout.write(f'{moved} documents ({bytes_before} bytes) would be moved, {missing} missing')
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} documents ({bytes_before} bytes) into content-addressed storage, {missing} missing'
+        ))
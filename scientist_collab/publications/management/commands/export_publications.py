@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from publications.exporters import EXPORT_FORMATS, ExportError, export_publications, filter_publications
+from publications.models import Publication
+
+class Command(BaseCommand):
+    help = 'Exports the publication catalog as CSV, JSON Lines or BibTeX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='Output format')
+        parser.add_argument('--output', '-o', help='Output file (default: standard output)')
+        parser.add_argument('--author', help='Only publications of this username')
+        parser.add_argument('--keyword', help='Only publications with this keyword slug')
+        parser.add_argument('--from', dest='date_from', help='Only publications published on or after YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', help='Only publications published on or before YYYY-MM-DD')
+        parser.add_argument('--base-url', default='', help='Prefix of the publication URLs, e.g. https://example.org')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Number of publications fetched per query')
+
+    def handle(self, *args, **options):
+        try:
+            publications = filter_publications(
+                Publication.objects.all(),
+                author=options['author'],
+                keyword=options['keyword'],
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        chunks = export_publications(
+            publications, options['format'], base_url=options['base_url'].rstrip('/'), chunk_size=options['chunk_size']
+        )
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Exported publications to {options['output']}"))
@@ -0,0 +1,52 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from publications.models import Publication, DocumentText
+from publications.extraction import extract_publication_text, extract_in_worker, init_worker
+
+class Command(BaseCommand):
+    help = 'Extracts the text of publication PDFs (backfill and retry of pending jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-extract every document, not only missing, pending or failed ones')
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes')
+
+    def handle(self, *args, **options):
+        publications = Publication.objects.exclude(document='')
+        if not options['all']:
+            publications = publications.exclude(document_text__status=DocumentText.DONE)
+        publication_ids = list(publications.order_by('pk').values_list('pk', flat=True))
+
+        self.stdout.write(f'Found {len(publication_ids)} documents to process')
+        if not publication_ids:
+            return
+
+        results = {DocumentText.DONE: 0, DocumentText.FAILED: 0, None: 0}
+        start = time.monotonic()
+
+        if options['processes'] > 1:
+            # Workers open their own connections
+            connections.close_all()
+            with multiprocessing.Pool(options['processes'], initializer=init_worker) as pool:
+                for index, (publication_id, status) in enumerate(
+                    pool.imap_unordered(extract_in_worker, publication_ids, chunksize=4), start=1
+                ):
+                    self._report(results, index, publication_id, status)
+        else:
+            for index, publication_id in enumerate(publication_ids, start=1):
+                self._report(results, index, publication_id, extract_publication_text(publication_id))
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Extracted {results[DocumentText.DONE]} documents in {elapsed:.1f}s '
+            f'({results[DocumentText.FAILED]} failed, {results[None]} skipped)'
+        ))
+
+    def _report(self, results, index, publication_id, status):
+        results[status] += 1
+        if status == DocumentText.FAILED:
+            self.stdout.write(self.style.WARNING(f'Extraction failed for publication {publication_id}'))
+        if index % 100 == 0:
+            self.stdout.write(f'Processed {index} documents')
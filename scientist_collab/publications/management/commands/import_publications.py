@@ -0,0 +1,62 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from publications.importers import PublicationImporter, iter_bibtex, iter_jsonl
+
+class Command(BaseCommand):
+    help = 'Imports publications from a BibTeX or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="BibTeX (.bib) or JSON Lines (.jsonl) file, or - for stdin")
+        parser.add_argument('--format', choices=['bibtex', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--pdf-dir', help='Directory with the PDFs, matched by file field or citation key')
+        parser.add_argument('--author', help='Username owning records whose authors match no user (default: skip them)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of publications inserted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Parse and validate without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'bibtex')
+        parse = iter_jsonl if input_format == 'jsonl' else iter_bibtex
+
+        default_author = None
+        if options['author']:
+            default_author = User.objects.filter(username=options['author']).first()
+            if default_author is None:
+                raise CommandError(f"Unknown user: {options['author']}")
+
+        importer = PublicationImporter(
+            pdf_dir=options['pdf_dir'],
+            default_author=default_author,
+            dry_run=options['dry_run'],
+        )
+
+        start = time.monotonic()
+        file = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            for batch in importer.batches(parse(file), batch_size=options['batch_size']):
+                importer.save(batch)
+                elapsed = time.monotonic() - start
+                self.stdout.write(
+                    f'{importer.imported} publications ({importer.imported / max(elapsed, 0.001):.0f}/s), '
+                    f'{importer.skipped} duplicates, {len(importer.errors)} errors'
+                )
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        for position, error in importer.errors[:20]:
+            self.stdout.write(self.style.WARNING(f'Record at line {position}: {error}'))
+        if len(importer.errors) > 20:
+            self.stdout.write(self.style.WARNING(f'... and {len(importer.errors) - 20} more errors'))
+
+        elapsed = time.monotonic() - start
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {importer.imported} publications ({importer.files} PDFs) in {elapsed:.1f}s, '
+            f'{importer.skipped} duplicates skipped, {len(importer.errors)} errors'
+        ))
+        if importer.files and not options['dry_run']:
+            self.stdout.write('Run extract_document_text to index the PDFs')
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from publications.models import Publication, PublicationVector, RelatedPublication
+from publications.related import TOP_K, build_vectors, encode_vector, nearest_neighbours
+from publications.search import compute_checksum
+
+class Command(BaseCommand):
+    help = 'Recomputes the vectors and related publications of every publication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows written per bulk insert')
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Number of related publications stored per publication')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        start = time.monotonic()
+        checksums = {}
+
+        def publications():
+            queryset = Publication.objects.only('pk', 'title', 'keywords', 'abstract').order_by('pk')
+            for publication in queryset.iterator(chunk_size=batch_size):
+                checksums[publication.pk] = compute_checksum(publication)
+                yield publication
+
+        vectors = build_vectors(publications())
+        self.stdout.write(f'Built {len(vectors)} vectors in {time.monotonic() - start:.1f}s')
+
+        with transaction.atomic():
+            RelatedPublication.objects.all().delete()
+            PublicationVector.objects.all().delete()
+
+            batch = []
+            for index, publication_id in enumerate(vectors.ids):
+                features, weights = encode_vector(
+                    vectors.features[vectors.ptr[index]:vectors.ptr[index + 1]],
+                    vectors.weights[vectors.ptr[index]:vectors.ptr[index + 1]],
+                )
+                batch.append(PublicationVector(
+                    publication_id=int(publication_id),
+                    features=features,
+                    weights=weights,
+                    checksum=checksums[publication_id],
+                ))
+                if len(batch) >= batch_size:
+                    PublicationVector.objects.bulk_create(batch)
+                    batch = []
+            PublicationVector.objects.bulk_create(batch)
+
+            related = 0
+            batch = []
+            for publication_id, neighbours in nearest_neighbours(vectors, k=options['top_k']):
+                batch.extend(
+                    RelatedPublication(publication_id=publication_id, related_id=related_id, score=score)
+                    for related_id, score in neighbours
+                )
+                if len(batch) >= batch_size:
+                    RelatedPublication.objects.bulk_create(batch)
+                    related += len(batch)
+                    batch = []
+            RelatedPublication.objects.bulk_create(batch)
+            related += len(batch)
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {related} related publications for {len(vectors)} publications in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from publications.models import Publication, SearchDocument, SearchPosting, DocumentText
+from publications.search import analyze_publication, encode_positions, invalidate_stats
+
+class Command(BaseCommand):
+    help = 'Rebuilds the publication full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of publications indexed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write('Clearing the search index...')
+        SearchPosting.objects.all().delete()
+        SearchDocument.objects.all().delete()
+
+        indexed = 0
+        postings, documents = [], []
+        publications = (
+            Publication.objects.only('pk', 'title', 'abstract', 'keywords', 'document_text')
+            .select_related('document_text')
+            .prefetch_related('document_pages')
+            .order_by('pk')
+        )
+
+        for publication in publications.iterator(chunk_size=batch_size):
+            body, body_checksum = self._get_body(publication)
+            length, checksum, terms = analyze_publication(publication, body, body_checksum)
+            documents.append(SearchDocument(publication_id=publication.pk, length=length, checksum=checksum))
+            postings.extend(
+                SearchPosting(
+                    term=term,
+                    publication_id=publication.pk,
+                    weight=weight,
+                    positions=encode_positions(positions),
+                )
+                for term, (weight, positions) in terms.items()
+            )
+            indexed += 1
+
+            if len(documents) >= batch_size:
+                self._flush(documents, postings, batch_size)
+                self.stdout.write(f'Indexed {indexed} publications')
+
+        self._flush(documents, postings, batch_size)
+        invalidate_stats()
+
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {indexed} publications indexed'))
+
+    def _get_body(self, publication):
+        try:
+            document_text = publication.document_text
+        except DocumentText.DoesNotExist:
+            return '', ''
+        if document_text.status != DocumentText.DONE:
+            return '', ''
+        return '\n'.join(page.text for page in publication.document_pages.all()), document_text.checksum
+
+    def _flush(self, documents, postings, batch_size):
+        SearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+        SearchPosting.objects.bulk_create(postings, batch_size=batch_size * 10)
+        documents.clear()
+        postings.clear()
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from config.reactions import reconcile_counter
+from publications.models import Publication
+from discussions.models import Topic, Reply
+
+# (model, M2M field, counter column)
+COUNTERS = [
+    (Publication, 'likes', 'like_count'),
+    (Publication, 'dislikes', 'dislike_count'),
+    (Topic, 'likes', 'like_count'),
+    (Topic, 'dislikes', 'dislike_count'),
+    (Reply, 'likes', 'like_count'),
+]
+
+class Command(BaseCommand):
+    help = 'Repairs the denormalized like/dislike counters against the reaction tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows written per bulk update')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing changes')
+
+    def handle(self, *args, **options):
+        total = 0
+
+        for model, field_name, counter in COUNTERS:
+            drifted = reconcile_counter(
+                model, field_name, counter,
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run']
+            )
+            total += drifted
+
+            label = f'{model.__name__}.{counter}'
+            if drifted:
+                self.stdout.write(self.style.WARNING(f'{label}: {drifted} rows out of sync'))
+            else:
+                self.stdout.write(f'{label}: in sync')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {total} rows would be repaired'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Reaction counters reconciled: {total} rows repaired'))
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_index(apps, schema_editor):
+    from publications.search import analyze_publication, encode_positions
+
+    Publication = apps.get_model('publications', 'Publication')
+    SearchDocument = apps.get_model('publications', 'SearchDocument')
+    SearchPosting = apps.get_model('publications', 'SearchPosting')
+
+    for publication in Publication.objects.iterator(chunk_size=500):
+        length, checksum, terms = analyze_publication(publication)
+        SearchDocument.objects.create(publication_id=publication.pk, length=length, checksum=checksum)
+        SearchPosting.objects.bulk_create([
+            SearchPosting(term=term, publication_id=publication.pk, weight=weight, positions=encode_positions(positions))
+            for term, (weight, positions) in terms.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publications', '0003_publication_dislikes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('publication', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='publications.publication')),
+                ('length', models.FloatField(default=0)),
+                ('checksum', models.CharField(max_length=40)),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('positions', models.TextField()),
+                ('publication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='publications.publication')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', '-weight'], name='pub_posting_term_weight_idx')],
+                'unique_together': {('term', 'publication')},
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:13
+
+from django.db import migrations, models
+
+
+def populate_counts(apps, schema_editor):
+    from config.reactions import count_subquery
+
+    Publication = apps.get_model('publications', 'Publication')
+    Publication.objects.update(like_count=count_subquery(Publication, 'likes'), dislike_count=count_subquery(Publication, 'dislikes'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publications', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:15
+
+from django.db import migrations, models
+
+
+def split_keywords(apps, schema_editor):
+    from publications.keywords import parse_keywords
+
+    Publication = apps.get_model('publications', 'Publication')
+    Keyword = apps.get_model('publications', 'Keyword')
+    PublicationTag = Publication.tags.through
+
+    parsed = {
+        pk: parse_keywords(keywords)
+        for pk, keywords in Publication.objects.exclude(keywords='').values_list('pk', 'keywords').iterator()
+    }
+    names = {}
+    for pairs in parsed.values():
+        for slug, name in pairs:
+            names.setdefault(slug, name)
+
+    Keyword.objects.bulk_create([Keyword(slug=slug, name=name) for slug, name in names.items()], batch_size=500)
+    keyword_ids = dict(Keyword.objects.values_list('slug', 'pk'))
+
+    PublicationTag.objects.bulk_create([
+        PublicationTag(publication_id=pk, keyword_id=keyword_ids[slug])
+        for pk, pairs in parsed.items()
+        for slug, _ in pairs
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publications', '0005_reaction_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Keyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(allow_unicode=True, max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='publications', to='publications.keyword'),
+        ),
+        migrations.RunPython(split_keywords, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publications', '0009_stored_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicationVector',
+            fields=[
+                ('publication', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='publications.publication')),
+                ('features', models.BinaryField()),
+                ('weights', models.BinaryField()),
+                ('checksum', models.CharField(max_length=40)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedPublication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('publication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='publications.publication')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='publications.publication')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['publication', '-score'], name='pub_related_score_idx')],
+                'unique_together': {('publication', 'related')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publications', '0010_related_publications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicationTrend',
+            fields=[
+                ('publication', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='publications.publication')),
+                ('score', models.FloatField(default=0)),
+                ('decayed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-publication'], name='pub_trend_score_idx')],
+            },
+        ),
+    ]
@@ -1,33 +1,77 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
 from django.urls import reverse
+from .keywords import parse_keywords
+from .storage import get_document_storage
+
+class Keyword(models.Model):
+    """A normalized publication keyword, used for tag filtering and facets."""
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True, allow_unicode=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    def get_absolute_url(self):
+        return f"{reverse('publications:list')}?tag={self.slug}"
+
 
 class Publication(models.Model):
     title = models.CharField(max_length=200)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='publications')
     co_authors = models.CharField(max_length=500, blank=True, help_text="Comma-separated list of co-authors")
     abstract = models.TextField()
-    document = models.FileField(upload_to='publications/')
+    document = models.FileField(upload_to='publications/', storage=get_document_storage)  # Content-addressed, see publications.storage
     keywords = models.CharField(max_length=200, blank=True, help_text="Comma-separated list of keywords")
+    tags = models.ManyToManyField(Keyword, related_name='publications', blank=True)  # Normalized keywords, synced on save
     publication_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name='liked_publications', blank=True)
     dislikes = models.ManyToManyField(User, related_name='disliked_publications', blank=True)
+    like_count = models.PositiveIntegerField(default=0)  # Denormalized likes.count(), see config.reactions
+    dislike_count = models.PositiveIntegerField(default=0)  # Denormalized dislikes.count()
     
     class Meta:
         ordering = ['-publication_date']
+        indexes = [
+            # Keyset pagination of the publication list, see config.pagination
+            models.Index(fields=['-publication_date', '-id'], name='pub_date_id_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        uploaded = bool(self.document) and not self.document._committed
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except Exception:
+            # The document was stored before the row failed to save; its reference was rolled back
+            if uploaded and self.document._committed:
+                name, storage = self.document.name, self.document.storage
+                transaction.on_commit(lambda: storage.discard(name))
+            raise
+    
     def get_absolute_url(self):
         return reverse('publications:detail', kwargs={'pk': self.pk})
     
+    def get_keywords(self):
+        """The tags in the order of the keywords field."""
+        # Uses the prefetched tags when available (see prefetch_related('tags'))
+        order = {slug: index for index, (slug, _) in enumerate(parse_keywords(self.keywords))}
+        return sorted(self.tags.all(), key=lambda tag: order.get(tag.slug, len(order)))
+    
     def get_keywords_list(self):
-        if self.keywords:
-            return [word.strip() for word in self.keywords.split(',')]
-        return []
+        # Read from the keywords field: no query, and in the author's order
+        return [name for _, name in parse_keywords(self.keywords)]
     
     def get_co_authors_list(self):
         if self.co_authors:
@@ -35,10 +79,10 @@ class Publication(models.Model):
         return []
     
     def total_likes(self):
-        return self.likes.count()
+        return self.like_count
     
     def total_dislikes(self):
-        return self.dislikes.count()
+        return self.dislike_count
 
 
 class Favorite(models.Model):
@@ -51,3 +95,222 @@ class Favorite(models.Model):
         
     def __str__(self):
         return f"{self.user.username} favorited {self.publication.title}"
+
+
+class StoredFile(models.Model):
+    """A deduplicated document blob and the number of publications using it."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)  # Storage name, sharded by hash
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+
+class DocumentText(models.Model):
+    """Extraction status of a publication's PDF, see publications.extraction."""
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    publication = models.OneToOneField(Publication, on_delete=models.CASCADE, primary_key=True, related_name='document_text')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    source_name = models.CharField(max_length=255)  # Document file the text was extracted from
+    page_count = models.PositiveIntegerField(default=0)
+    checksum = models.CharField(max_length=40, blank=True)  # SHA-1 of the extracted text
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Text of {self.publication_id} ({self.status})"
+
+
+class DocumentPage(models.Model):
+    """Extracted text of one page of a publication's PDF."""
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='document_pages')
+    number = models.PositiveIntegerField()
+    text = models.TextField()
+    
+    class Meta:
+        ordering = ['publication', 'number']
+        unique_together = ('publication', 'number')
+    
+    def __str__(self):
+        return f"Page {self.number} of {self.publication_id}"
+
+
+class SearchDocument(models.Model):
+    """Per-publication statistics of the search index."""
+    publication = models.OneToOneField(Publication, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    length = models.FloatField(default=0)  # Field-weighted number of indexed tokens
+    checksum = models.CharField(max_length=40)  # SHA-1 of the indexed text, used to skip no-op reindexing
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.publication_id}"
+
+
+class SearchPosting(models.Model):
+    """One entry of the inverted index: a term occurring in a publication."""
+    term = models.CharField(max_length=64)
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='search_postings')
+    weight = models.FloatField()  # Field-weighted term frequency
+    positions = models.TextField()  # Encoded as 'field:1 5 9|field:3'
+
+    class Meta:
+        unique_together = ('term', 'publication')
+        indexes = [
+            models.Index(fields=['term', '-weight'], name='pub_posting_term_weight_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.publication_id}"
+
+
+class PublicationVector(models.Model):
+    """TF-IDF vector of a publication, see publications.related."""
+    publication = models.OneToOneField(Publication, on_delete=models.CASCADE, primary_key=True, related_name='vector')
+    features = models.BinaryField()  # uint32 hashed stems, sorted
+    weights = models.BinaryField()  # float32, L2-normalized
+    checksum = models.CharField(max_length=40)  # Checksum of the vectorized text, see search.compute_checksum
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Vector of {self.publication_id}"
+
+
+class RelatedPublication(models.Model):
+    """A precomputed recommendation: related is similar to publication."""
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()  # Cosine similarity
+    
+    class Meta:
+        unique_together = ('publication', 'related')
+        indexes = [
+            models.Index(fields=['publication', '-score'], name='pub_related_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.publication_id} -> {self.related_id} ({self.score:.2f})"
+
+
+class PublicationTrend(models.Model):
+    """Time-decayed popularity of a publication, see config.trending."""
+    publication = models.OneToOneField(Publication, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    score = models.FloatField(default=0)
+    decayed_at = models.DateTimeField()  # Time the score was last decayed to
+    
+    class Meta:
+        indexes = [
+            # ?sort=trending keyset pagination, see PublicationListView
+            models.Index(fields=['-score', '-publication'], name='pub_trend_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.publication_id}: {self.score:.2f}"
+
+
+@receiver(pre_save, sender=Publication)
+def remember_previous_document(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    # A new upload takes a reference even when it stores the same content under the same name
+    instance._document_uploaded = bool(instance.document) and not instance.document._committed
+    instance._previous_document = (
+        Publication.objects.filter(pk=instance.pk).values_list('document', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Publication)
+def release_replaced_document(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_document', None)
+    uploaded = getattr(instance, '_document_uploaded', False)
+    instance._previous_document, instance._document_uploaded = None, False
+    if raw or not previous or (previous == instance.document.name and not uploaded):
+        return
+    storage = instance.document.storage
+    transaction.on_commit(lambda: storage.delete(previous))
+
+
+@receiver(post_save, sender=Publication)
+def index_publication_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .search import index_publication
+    index_publication(instance)
+
+
+@receiver(post_save, sender=Publication)
+def update_related_publications(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Runs after index_publication_on_save: document frequencies come from the search index
+    from .related import update_related
+    update_related(instance)
+
+
+@receiver(post_save, sender=Publication)
+def extract_publication_document(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .extraction import queue_extraction
+    queue_extraction(instance)
+
+
+@receiver(post_save, sender=Publication)
+def sync_publication_tags(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .keywords import sync_keywords
+    sync_keywords(instance)
+
+
+@receiver(post_save, sender=Publication)
+def record_new_publication(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from config.trending import WEIGHTS, record_event
+    record_event(PublicationTrend, instance.pk, WEIGHTS['create'])
+
+
+@receiver(post_save, sender=Favorite)
+def record_favorite(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from config.trending import WEIGHTS, record_event
+    record_event(PublicationTrend, instance.publication_id, WEIGHTS['favorite'])
+
+
+@receiver(post_delete, sender=Favorite)
+def record_unfavorite(sender, instance, **kwargs):
+    from config.trending import WEIGHTS, record_event
+    record_event(PublicationTrend, instance.publication_id, -WEIGHTS['favorite'])
+
+
+@receiver(post_delete, sender=Publication)
+def remove_publication_from_index(sender, instance, **kwargs):
+    from .search import remove_publication
+    remove_publication(instance.pk)
+
+
+@receiver(post_delete, sender=Publication)
+def refresh_top_keywords(sender, instance, **kwargs):
+    from .keywords import invalidate_top_keywords
+    invalidate_top_keywords()
+
+
+@receiver(post_delete, sender=Publication)
+def release_publication_document(sender, instance, **kwargs):
+    if not instance.document:
+        return
+    name, storage = instance.document.name, instance.document.storage
+    transaction.on_commit(lambda: storage.delete(name))
@@ -0,0 +1,367 @@
+"""
+"Related publications" recommendations.
+
+Each publication is turned into a sparse TF-IDF vector over the stems of its
+title, keywords and abstract (tokenized like the search index, see
+publications.search). Stems are hashed to 32-bit feature ids, so vectors are
+plain NumPy arrays (uint32 features, float32 weights) with no vocabulary to
+maintain, and are truncated to their MAX_TERMS strongest features.
+
+The top-k most similar publications (cosine similarity) are precomputed and
+stored in RelatedPublication, so the detail page reads a short list:
+
+- rebuild_related_publications recomputes every vector with exact document
+  frequencies and scores all publications in vectorized batches through an
+  in-memory inverted index;
+- update_related() handles a single new or edited publication, scoring it
+  against candidates found through the search index and inserting it into
+  its neighbours' lists when it ranks high enough.
+"""
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+
+from .search import FIELD_WEIGHTS, compute_checksum, get_field_texts, tokenize
+
+# Fields used for similarity (the PDF body is too noisy and too expensive)
+VECTOR_FIELDS = ('title', 'keywords', 'abstract')
+
+# Strongest features kept per publication
+MAX_TERMS = 48
+
+# Number of related publications stored per publication
+TOP_K = 10
+
+# Pairs scoring below this are not worth recommending
+MIN_SCORE = 0.05
+
+# Features present in more than this share of publications (and in more than
+# MIN_COMMON_DF of them) carry no signal and would blow up the candidate lists
+MAX_DF_RATIO = 0.05
+MIN_COMMON_DF = 50
+
+# Upper bound of (query feature, posting) pairs expanded per scoring batch
+MAX_BATCH_PAIRS = 4_000_000
+
+# Candidates considered by the incremental update
+MAX_CANDIDATES = 2000
+
+
+def hash_term(term):
+    return zlib.crc32(term.encode('utf-8'))
+
+
+def term_frequencies(publication):
+    """Return {stem: field-weighted frequency} over the vector fields."""
+    field_texts = get_field_texts(publication)
+    frequencies = defaultdict(float)
+    for field in VECTOR_FIELDS:
+        weight = FIELD_WEIGHTS[field]
+        for _, term in tokenize(field_texts[field]):
+            frequencies[term] += weight
+    return frequencies
+
+
+def weigh(frequencies, idf):
+    """Return TF-IDF weights, zeroing all but the MAX_TERMS strongest."""
+    weights = (1.0 + np.log(frequencies)) * idf
+    if len(weights) > MAX_TERMS:
+        weights[np.argsort(-weights, kind='stable')[MAX_TERMS:]] = 0.0
+    return weights
+
+
+class VectorSet:
+    """
+    Sparse vectors of many publications in CSR layout.
+
+    Row i belongs to ids[i]; its features are features[ptr[i]:ptr[i + 1]].
+    """
+
+    def __init__(self, ids, ptr, features, weights):
+        self.ids = ids
+        self.ptr = ptr
+        self.features = features
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self):
+        """Row number of every stored feature."""
+        return np.repeat(np.arange(len(self.ids)), np.diff(self.ptr))
+
+
+def build_vectors(publications):
+    """
+    Build the TF-IDF vectors of an iterable of publications.
+
+    Document frequencies are computed over the same publications, so this is
+    what the full rebuild uses.
+    """
+    ids, counts, features, frequencies = [], [], [], []
+    for publication in publications:
+        terms = term_frequencies(publication)
+        ids.append(publication.pk)
+        counts.append(len(terms))
+        features.append(np.fromiter((hash_term(term) for term in terms), dtype=np.uint32, count=len(terms)))
+        frequencies.append(np.fromiter(terms.values(), dtype=np.float32, count=len(terms)))
+
+    ids = np.array(ids, dtype=np.int64)
+    if not len(ids):
+        return VectorSet(ids, np.zeros(1, dtype=np.int64), np.zeros(0, np.uint32), np.zeros(0, np.float32))
+
+    features = np.concatenate(features)
+    frequencies = np.concatenate(frequencies)
+    rows = np.repeat(np.arange(len(ids)), counts)
+
+    _, inverse, df = np.unique(features, return_inverse=True, return_counts=True)
+    total = len(ids)
+    idf = (np.log((1.0 + total) / (1.0 + df)) + 1.0).astype(np.float32)
+    idf[df > max(MIN_COMMON_DF, MAX_DF_RATIO * total)] = 0.0
+    weights = (1.0 + np.log(frequencies)) * idf[inverse]
+
+    # Keep the MAX_TERMS strongest features of every row
+    order = np.lexsort((-weights, rows))
+    rank = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+    keep = order[(rank < MAX_TERMS) & (weights[order] > 0)]
+    keep.sort()
+    rows, features, weights = rows[keep], features[keep], weights[keep]
+
+    norms = np.sqrt(np.bincount(rows, weights=weights.astype(np.float64) ** 2, minlength=total))
+    weights = (weights / norms[rows]).astype(np.float32)
+
+    # Sort features within rows, rows stay in order
+    order = np.lexsort((features, rows))
+    ptr = np.zeros(total + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum(np.bincount(rows, minlength=total))
+    return VectorSet(ids, ptr, features[order], weights[order])
+
+
+def nearest_neighbours(vectors, k=TOP_K, min_score=MIN_SCORE):
+    """
+    Yield (publication id, [(related id, score), ...]) for every vector.
+
+    Similarities are computed through an inverted index (feature -> rows),
+    a batch of rows at a time; batches are sized by the number of
+    (feature, posting) pairs they expand to, which bounds memory use.
+    """
+    total = len(vectors)
+    if not total:
+        return
+    rows = vectors.rows()
+
+    # Inverted index: postings of each feature, contiguous
+    order = np.argsort(vectors.features, kind='stable')
+    posting_rows = rows[order]
+    posting_weights = vectors.weights[order]
+    vocabulary, starts = np.unique(vectors.features[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    slots = np.searchsorted(vocabulary, vectors.features)
+    lengths = ends[slots] - starts[slots]
+    row_cost = np.bincount(rows, weights=lengths, minlength=total)
+    cumulative_cost = np.cumsum(row_cost)
+
+    first = 0
+    while first < total:
+        offset = cumulative_cost[first - 1] if first else 0
+        last = int(np.searchsorted(cumulative_cost, offset + MAX_BATCH_PAIRS, side='right'))
+        last = min(max(last, first + 1), total)
+
+        start, end = vectors.ptr[first], vectors.ptr[last]
+        batch_lengths = lengths[start:end]
+        pair_count = int(batch_lengths.sum())
+        query_rows = np.repeat(rows[start:end] - first, batch_lengths)
+        query_weights = np.repeat(vectors.weights[start:end], batch_lengths)
+        posting_index = (
+            np.arange(pair_count)
+            - np.repeat(np.cumsum(batch_lengths) - batch_lengths, batch_lengths)
+            + np.repeat(starts[slots[start:end]], batch_lengths)
+        )
+
+        keys = query_rows.astype(np.int64) * total + posting_rows[posting_index]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        scores = np.bincount(inverse, weights=query_weights * posting_weights[posting_index])
+        query_rows, candidates = keys // total, keys % total
+        keep = (candidates != query_rows + first) & (scores >= min_score)
+        query_rows, candidates, scores = query_rows[keep], candidates[keep], scores[keep]
+
+        order = np.lexsort((-scores, query_rows))
+        query_rows, candidates, scores = query_rows[order], candidates[order], scores[order]
+        group_starts = np.searchsorted(query_rows, np.arange(last - first))
+        group_ends = np.append(group_starts[1:], len(query_rows))
+        for row in range(last - first):
+            group_end = min(group_ends[row], group_starts[row] + k)
+            yield int(vectors.ids[first + row]), [
+                (int(vectors.ids[candidate]), float(score))
+                for candidate, score in zip(candidates[group_starts[row]:group_end], scores[group_starts[row]:group_end])
+            ]
+        first = last
+
+
+def cosine_scores(features, weights, candidates):
+    """Similarity of one vector with each vector of a VectorSet."""
+    if not len(candidates) or not len(features):
+        return np.zeros(len(candidates), dtype=np.float64)
+    slots = np.searchsorted(features, candidates.features)
+    slots[slots == len(features)] = 0
+    matches = features[slots] == candidates.features
+    products = np.where(matches, weights[slots] * candidates.weights, 0.0)
+    return np.bincount(candidates.rows(), weights=products, minlength=len(candidates))
+
+
+def encode_vector(features, weights):
+    return features.astype(np.uint32).tobytes(), weights.astype(np.float32).tobytes()
+
+
+def decode_vector(vector):
+    return (
+        np.frombuffer(bytes(vector.features), dtype=np.uint32),
+        np.frombuffer(bytes(vector.weights), dtype=np.float32),
+    )
+
+
+def load_vectors(publication_ids):
+    """Load stored vectors into a VectorSet."""
+    from .models import PublicationVector
+
+    ids, counts, features, weights = [], [], [], []
+    for vector in PublicationVector.objects.filter(publication_id__in=publication_ids).order_by('pk'):
+        vector_features, vector_weights = decode_vector(vector)
+        ids.append(vector.publication_id)
+        counts.append(len(vector_features))
+        features.append(vector_features)
+        weights.append(vector_weights)
+    ptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum(counts)
+    return VectorSet(
+        np.array(ids, dtype=np.int64),
+        ptr,
+        np.concatenate(features) if features else np.zeros(0, np.uint32),
+        np.concatenate(weights) if weights else np.zeros(0, np.float32),
+    )
+
+
+def vectorize(publication):
+    """
+    Build the vector of a single publication.
+
+    Document frequencies come from the search index, which is updated before
+    this runs. Returns (features, weights, top terms).
+    """
+    from .models import SearchPosting
+    from .search import get_stats
+
+    frequencies = term_frequencies(publication)
+    if not frequencies:
+        return np.zeros(0, np.uint32), np.zeros(0, np.float32), []
+
+    terms = list(frequencies)
+    df = dict(
+        SearchPosting.objects.filter(term__in=terms)
+        .values_list('term')
+        .annotate(df=Count('pk'))
+        .values_list('term', 'df')
+    )
+    total = max(get_stats()[0], 1)
+    document_frequencies = np.array([df.get(term, 1) for term in terms], dtype=np.float32)
+    idf = (np.log((1.0 + total) / (1.0 + document_frequencies)) + 1.0).astype(np.float32)
+    idf[document_frequencies > max(MIN_COMMON_DF, MAX_DF_RATIO * total)] = 0.0
+
+    weights = weigh(np.array(list(frequencies.values()), dtype=np.float32), idf)
+    kept = [index for index in np.argsort(-weights, kind='stable') if weights[index] > 0]
+    weights = weights[kept]
+    norm = np.sqrt(np.sum(weights.astype(np.float64) ** 2))
+    if norm:
+        weights = weights / norm
+    top_terms = [terms[index] for index in kept]
+
+    features = np.array([hash_term(term) for term in top_terms], dtype=np.uint32)
+    order = np.argsort(features)
+    return features[order], weights[order].astype(np.float32), top_terms
+
+
+def update_related(publication, k=TOP_K):
+    """
+    Update the vector and recommendations of one publication.
+
+    Skips the work when its title, keywords and abstract did not change.
+    Returns True if the recommendations were recomputed.
+    """
+    from .models import PublicationVector, RelatedPublication, SearchPosting
+
+    checksum = compute_checksum(publication)
+    if PublicationVector.objects.filter(publication_id=publication.pk, checksum=checksum).exists():
+        return False
+
+    features, weights, top_terms = vectorize(publication)
+    candidate_ids = set()
+    if top_terms:
+        postings = (
+            SearchPosting.objects.filter(term__in=top_terms)
+            .exclude(publication_id=publication.pk)
+            .order_by('-weight')
+            .values_list('publication_id', flat=True)[:MAX_CANDIDATES]
+        )
+        candidate_ids = set(postings)
+    candidates = load_vectors(candidate_ids)
+    scores = cosine_scores(features, weights, candidates)
+
+    ranked = sorted(
+        ((float(score), int(candidate_id)) for candidate_id, score in zip(candidates.ids, scores) if score >= MIN_SCORE),
+        reverse=True,
+    )
+
+    stored_features, stored_weights = encode_vector(features, weights)
+    with transaction.atomic():
+        PublicationVector.objects.update_or_create(
+            publication_id=publication.pk,
+            defaults={'features': stored_features, 'weights': stored_weights, 'checksum': checksum},
+        )
+        RelatedPublication.objects.filter(publication_id=publication.pk).delete()
+        RelatedPublication.objects.filter(related_id=publication.pk).delete()
+        RelatedPublication.objects.bulk_create([
+            RelatedPublication(publication_id=publication.pk, related_id=related_id, score=score)
+            for score, related_id in ranked[:k]
+        ])
+        _insert_into_neighbours(publication.pk, ranked, k)
+    return True
+
+
+def _insert_into_neighbours(publication_id, ranked, k):
+    """Add a publication to the lists of the neighbours it now ranks in."""
+    from .models import RelatedPublication
+
+    neighbours = {related_id: score for score, related_id in ranked}
+    if not neighbours:
+        return
+
+    current = defaultdict(list)
+    for row in RelatedPublication.objects.filter(publication_id__in=neighbours).values('id', 'publication_id', 'score'):
+        current[row['publication_id']].append((row['score'], row['id']))
+
+    new_rows, dropped = [], []
+    for neighbour_id, score in neighbours.items():
+        entries = sorted(current[neighbour_id], reverse=True)
+        if len(entries) >= k and score <= entries[k - 1][0]:
+            continue
+        new_rows.append(RelatedPublication(publication_id=neighbour_id, related_id=publication_id, score=score))
+        dropped.extend(row_id for _, row_id in entries[k - 1:])
+    if dropped:
+        RelatedPublication.objects.filter(id__in=dropped).delete()
+    RelatedPublication.objects.bulk_create(new_rows)
+
+
+def get_related_publications(publication, limit=5):
+    """Return the precomputed related publications of a publication."""
+    from .models import RelatedPublication
+
+    rows = (
+        RelatedPublication.objects.filter(publication_id=publication.pk)
+        .select_related('related__author')
+        .order_by('-score')[:limit]
+    )
+    return [row.related for row in rows]
@@ -0,0 +1,461 @@
+"""
+Full-text search for publications.
+
+Publications are indexed into an inverted index (SearchPosting) with one row
+per (term, publication). Each posting stores a field-weighted term frequency
+and the term positions per field, so queries are answered with a handful of
+indexed lookups and ranked with BM25 in Python.
+
+Supported query syntax:
+    laser fusion        -> terms, ranked with BM25 (any term may match)
+    "laser effect"      -> phrase, all words must appear next to each other
+    quant*              -> prefix, matches every indexed term starting with "quant"
+"""
+import hashlib
+import math
+import re
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count
+
+# Weight of each indexed field when computing term frequencies
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'keywords': 2.0,
+    'abstract': 1.0,
+    'body': 0.5,  # Text extracted from the PDF, see publications.extraction
+}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Bounds that keep query cost independent of the catalog size
+MAX_POSTINGS_PER_TERM = 5000
+MAX_PREFIX_EXPANSIONS = 50
+MAX_RESULTS = 1000
+
+# Only the beginning of long papers is indexed, to bound the index size
+MAX_BODY_TOKENS = 20000
+
+STATS_CACHE_KEY = 'publications:search:stats'
+STATS_CACHE_TIMEOUT = 300
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or
+that the their there these this to was were which will with we our using
+""".split())
+
+# (suffix, replacement, minimum stem length) - checked in order, first match wins
+SUFFIX_RULES = (
+    ('ational', 'ate', 3), ('ization', 'ize', 3), ('fulness', 'ful', 3),
+    ('iveness', 'ive', 3), ('ousness', 'ous', 3), ('ations', 'ate', 3),
+    ('ation', 'ate', 3), ('ments', '', 4), ('ment', '', 4), ('ness', '', 3),
+    ('ities', '', 3), ('ity', '', 3), ('ings', '', 3), ('ing', '', 3),
+    ('ies', 'y', 2), ('ied', 'y', 2), ('edly', '', 3), ('ed', '', 3),
+    ('ly', '', 3), ('es', '', 3), ('s', '', 3),
+)
+
+
+def stem(word):
+    """Reduce a lowercase word to a crude stem with a light suffix stripper."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith('ss'):
+        return word
+    for suffix, replacement, min_stem in SUFFIX_RULES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= min_stem:
+            word = word[:-len(suffix)] + replacement
+            break
+    # Collapse doubled consonants left behind by -ing/-ed (e.g. "modell" -> "model")
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'aeiouslz':
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Split text into (position, stem) pairs.
+
+    Positions count every word, including stopwords, so that phrase queries
+    keep their spacing even though stopwords are not indexed.
+    """
+    tokens = []
+    for position, match in enumerate(TOKEN_RE.finditer((text or '').lower())):
+        word = match.group()
+        if word in STOPWORDS or len(word) > 64:
+            continue
+        tokens.append((position, stem(word)))
+    return tokens
+
+
+def get_field_texts(publication, body=''):
+    """Return the text indexed for each field of a publication."""
+    return {
+        'title': publication.title,
+        'keywords': (publication.keywords or '').replace(',', ' '),
+        'abstract': publication.abstract,
+        'body': body,
+    }
+
+
+def compute_checksum(publication, body_checksum=''):
+    """Fingerprint of everything indexed for a publication."""
+    field_texts = get_field_texts(publication)
+    parts = [field_texts[field] or '' for field in ('title', 'keywords', 'abstract')]
+    return hashlib.sha1('\x00'.join(parts + [body_checksum]).encode('utf-8')).hexdigest()
+
+
+def get_body_text(publication_id):
+    """Return the extracted document text of a publication, page by page."""
+    from .models import DocumentPage
+
+    pages = DocumentPage.objects.filter(publication_id=publication_id).order_by('number')
+    return '\n'.join(pages.values_list('text', flat=True).iterator())
+
+
+def encode_positions(positions):
+    """Encode {field: [positions]} as 'field:1 5 9|field:3'."""
+    return '|'.join(
+        f"{field}:{' '.join(str(p) for p in field_positions)}"
+        for field, field_positions in positions.items()
+    )
+
+
+def decode_positions(value):
+    """Inverse of encode_positions."""
+    positions = {}
+    for chunk in value.split('|') if value else []:
+        field, _, numbers = chunk.partition(':')
+        positions[field] = [int(p) for p in numbers.split()]
+    return positions
+
+
+def analyze_publication(publication, body='', body_checksum=''):
+    """
+    Build the postings for a publication.
+
+    Returns (length, checksum, postings) where postings maps each term to
+    (weighted term frequency, {field: [positions]}).
+    """
+    field_texts = get_field_texts(publication, body)
+    checksum = compute_checksum(publication, body_checksum)
+
+    length = 0.0
+    postings = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        tokens = tokenize(field_texts.get(field))
+        if field == 'body':
+            tokens = tokens[:MAX_BODY_TOKENS]
+        length += weight * len(tokens)
+        for position, term in tokens:
+            entry = postings.setdefault(term, [0.0, {}])
+            entry[0] += weight
+            entry[1].setdefault(field, []).append(position)
+    return length, checksum, postings
+
+
+def index_publication(publication, force=False):
+    """
+    (Re)index a single publication.
+
+    Skips the write when the indexed text did not change since the last run,
+    so saves that only touch other columns stay cheap.
+    """
+    from .models import SearchDocument, SearchPosting, DocumentText
+
+    body_checksum = DocumentText.objects.filter(
+        publication_id=publication.pk, status=DocumentText.DONE
+    ).values_list('checksum', flat=True).first() or ''
+    if not force and SearchDocument.objects.filter(
+        publication_id=publication.pk, checksum=compute_checksum(publication, body_checksum)
+    ).exists():
+        return False
+
+    body = get_body_text(publication.pk) if body_checksum else ''
+    length, checksum, postings = analyze_publication(publication, body, body_checksum)
+
+    with transaction.atomic():
+        SearchPosting.objects.filter(publication_id=publication.pk).delete()
+        SearchPosting.objects.bulk_create([
+            SearchPosting(
+                term=term,
+                publication_id=publication.pk,
+                weight=weight,
+                positions=encode_positions(positions),
+            )
+            for term, (weight, positions) in postings.items()
+        ])
+        SearchDocument.objects.update_or_create(
+            publication_id=publication.pk,
+            defaults={'length': length, 'checksum': checksum},
+        )
+    invalidate_stats()
+    return True
+
+
+def bulk_index_publications(publications, batch_size=500):
+    """
+    Index freshly inserted publications (e.g. from bulk_create) in bulk.
+
+    Unlike index_publication, this neither checks nor clears existing
+    entries, and the document body is left to the extraction pipeline.
+    """
+    from .models import SearchDocument, SearchPosting
+
+    documents, postings = [], []
+    for publication in publications:
+        length, checksum, terms = analyze_publication(publication)
+        documents.append(SearchDocument(publication_id=publication.pk, length=length, checksum=checksum))
+        postings.extend(
+            SearchPosting(term=term, publication_id=publication.pk, weight=weight, positions=encode_positions(positions))
+            for term, (weight, positions) in terms.items()
+        )
+    SearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+    SearchPosting.objects.bulk_create(postings, batch_size=batch_size * 10)
+    invalidate_stats()
+    return len(documents)
+
+
+def remove_publication(publication_id):
+    """Drop a publication from the index."""
+    from .models import SearchDocument, SearchPosting
+
+    SearchPosting.objects.filter(publication_id=publication_id).delete()
+    SearchDocument.objects.filter(publication_id=publication_id).delete()
+    invalidate_stats()
+
+
+def invalidate_stats():
+    cache.delete(STATS_CACHE_KEY)
+
+
+def get_stats():
+    """Return (document count, average document length), cached."""
+    from .models import SearchDocument
+
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        aggregate = SearchDocument.objects.aggregate(count=Count('pk'), avg_length=Avg('length'))
+        stats = (aggregate['count'] or 0, aggregate['avg_length'] or 0.0)
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def parse_query(query):
+    """
+    Parse a query string into (terms, prefixes, phrases).
+
+    Phrases are lists of (offset, stem) pairs relative to the first word.
+    """
+    terms, prefixes, phrases = [], [], []
+    for phrase, word in QUERY_RE.findall(query or ''):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) > 1:
+                start = tokens[0][0]
+                phrases.append([(position - start, term) for position, term in tokens])
+            terms.extend(term for _, term in tokens)
+        elif word.endswith('*'):
+            prefix = ''.join(TOKEN_RE.findall(word.lower()))
+            if prefix:
+                prefixes.append(prefix)
+        else:
+            terms.extend(term for _, term in tokenize(word))
+    return list(dict.fromkeys(terms)), list(dict.fromkeys(prefixes)), phrases
+
+
+def expand_prefixes(prefixes):
+    """Map each prefix to the indexed terms it matches (an index range scan)."""
+    from .models import SearchPosting
+
+    expanded = []
+    for prefix in prefixes:
+        expanded.extend(
+            SearchPosting.objects.filter(term__startswith=prefix)
+            .order_by('term')
+            .values_list('term', flat=True)
+            .distinct()[:MAX_PREFIX_EXPANSIONS]
+        )
+    return expanded
+
+
+def fetch_postings(terms):
+    """
+    Load the postings of the given terms.
+
+    Returns {term: {publication_id: (weight, positions)}}. Each term reads at
+    most MAX_POSTINGS_PER_TERM rows, highest weight first.
+    """
+    from .models import SearchPosting
+
+    postings = {}
+    for term in terms:
+        rows = (
+            SearchPosting.objects.filter(term=term)
+            .order_by('-weight')
+            .values_list('publication_id', 'weight', 'positions')[:MAX_POSTINGS_PER_TERM]
+        )
+        postings[term] = {pk: (weight, positions) for pk, weight, positions in rows}
+    return postings
+
+
+def document_frequencies(model, postings):
+    """
+    Return {term: number of documents containing it}, for IDF.
+
+    Postings are cut at MAX_POSTINGS_PER_TERM, so the terms that reached it
+    are counted in the index (model), in one grouped query.
+    """
+    frequencies = {term: len(term_postings) for term, term_postings in postings.items()}
+    capped = [term for term, df in frequencies.items() if df >= MAX_POSTINGS_PER_TERM]
+    if capped:
+        frequencies.update(
+            model.objects.filter(term__in=capped).order_by()
+            .values('term').annotate(df=Count('pk')).values_list('term', 'df')
+        )
+    return frequencies
+
+
+def matches_phrase(phrase, doc_postings):
+    """Check whether a phrase occurs in any single field of a document."""
+    decoded = []
+    for _, term in phrase:
+        if term not in doc_postings:
+            return False
+        decoded.append(decode_positions(doc_postings[term][1]))
+
+    for field, first_positions in decoded[0].items():
+        for start in first_positions:
+            if all(
+                start + offset in positions.get(field, ())
+                for (offset, _), positions in zip(phrase[1:], decoded[1:])
+            ):
+                return True
+    return False
+
+
+def bm25(weight, length, avg_length, idf):
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * (length / avg_length if avg_length else 1))
+    return idf * (weight * (BM25_K1 + 1)) / (weight + norm)
+
+
+def filter_phrases(candidates, postings, phrases):
+    """Keep the candidate documents that contain every phrase."""
+    by_doc = {}
+    for term, term_postings in postings.items():
+        for pk, entry in term_postings.items():
+            by_doc.setdefault(pk, {})[term] = entry
+    return {
+        pk for pk in candidates
+        if all(matches_phrase(phrase, by_doc[pk]) for phrase in phrases)
+    }
+
+
+def score_candidates(postings, candidates, lengths, count, avg_length, frequencies=None):
+    """
+    Sum the BM25 scores of each candidate document over the query terms.
+
+    frequencies are the document frequencies of the terms, see
+    document_frequencies(); by default the postings are counted.
+    """
+    scores = dict.fromkeys(candidates, 0.0)
+    for term, term_postings in postings.items():
+        df = frequencies[term] if frequencies else len(term_postings)
+        idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+        for pk, (weight, _) in term_postings.items():
+            if pk in scores:
+                scores[pk] += bm25(weight, lengths.get(pk, avg_length), avg_length, idf)
+    return scores
+
+
+def rank(query, queryset=None):
+    """
+    Return a list of (publication_id, score) for a query, best first.
+
+    If a filtered queryset is given, candidates outside it are dropped in
+    the query loading their lengths, before the results are cut at
+    MAX_RESULTS.
+    """
+    from .models import SearchDocument, SearchPosting
+
+    terms, prefixes, phrases = parse_query(query)
+    terms = list(dict.fromkeys(terms + expand_prefixes(prefixes)))
+    if not terms:
+        return []
+
+    postings = fetch_postings(terms)
+    candidates = set()
+    for term_postings in postings.values():
+        candidates.update(term_postings)
+
+    if phrases:
+        candidates = filter_phrases(candidates, postings, phrases)
+    if not candidates:
+        return []
+
+    count, avg_length = get_stats()
+    documents = SearchDocument.objects.filter(publication_id__in=candidates)
+    filtered = queryset is not None and queryset.query.where
+    if filtered:
+        documents = documents.filter(publication__in=queryset.values('pk'))
+    lengths = dict(documents.values_list('publication_id', 'length'))
+    if filtered:
+        candidates = candidates & lengths.keys()
+
+    frequencies = document_frequencies(SearchPosting, postings)
+    scores = score_candidates(postings, candidates, lengths, count, avg_length, frequencies)
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    return ranked[:MAX_RESULTS]
+
+
+class SearchResults:
+    """
+    Lazily materialized, ranked search results.
+
+    Behaves like a sequence so it can be handed to a Paginator: only the
+    publications of the requested slice are loaded from the database.
+    """
+
+    def __init__(self, ranked, queryset):
+        self.ranked = ranked
+        self.queryset = queryset
+        self.scores = dict(ranked)
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def count(self):
+        return len(self.ranked)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = [pk for pk, _ in self.ranked[index]]
+            objects = self.queryset.in_bulk(ids)
+            results = []
+            for pk in ids:
+                if pk in objects:
+                    objects[pk].search_score = self.scores[pk]
+                    results.append(objects[pk])
+            return results
+        return self[index:index + 1 or None][0]
+
+
+def search_publications(query, queryset=None):
+    """
+    Search publications and return ranked SearchResults.
+
+    If a queryset is given, results are restricted to it.
+    """
+    from .models import Publication
+
+    if queryset is None:
+        queryset = Publication.objects.all()
+    return SearchResults(rank(query, queryset), queryset.select_related('author'))
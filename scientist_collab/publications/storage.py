@@ -0,0 +1,137 @@
+"""
+Content-addressed storage for publication documents.
+
+Uploads are hashed with SHA-256 while they are written and stored under a
+sharded path derived from the hash, e.g.
+
+    publications/3f/a2/3fa2...e9.pdf
+
+so identical PDFs (a paper uploaded again by a co-author) are kept once and
+no directory grows beyond a few hundred entries. Each stored blob has a
+StoredFile row counting the documents that reference it; delete() only
+removes the file when the last reference goes away.
+
+Files saved before this backend existed keep their old names and are served
+and deleted as plain files, see the dedupe_documents command.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+
+HASH_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.[\w]+)?$')
+
+
+def hash_name(directory, digest, extension):
+    """Return the sharded storage name of a blob."""
+    return '/'.join(part for part in (directory.strip('/'), digest[:2], digest[2:4], digest + extension) if part)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by the SHA-256 of their content."""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content and is chosen in _save()
+        return name
+
+    def content_hash(self, name):
+        """Return the SHA-256 hex digest encoded in a stored name, or None."""
+        match = HASH_NAME_RE.search(name or '')
+        return match.group(1) if match else None
+
+    def _save(self, name, content):
+        from .models import StoredFile
+
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        temp_dir = os.path.join(self.location, '.tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp:
+            try:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                temp.close()
+                os.remove(temp.name)
+                raise
+
+        digest = digest.hexdigest()
+        try:
+            stored_name = self._add_reference(StoredFile, digest, hash_name(directory, digest, extension), size)
+            full_path = self.path(stored_name)
+            # Always replaced, even if the blob exists: a concurrent delete() may be unlinking it.
+            # The content is the same, and os.replace() is atomic
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp.name, self.file_permissions_mode)
+            os.replace(temp.name, full_path)
+        except BaseException:
+            if os.path.exists(temp.name):
+                os.remove(temp.name)
+            raise
+        return stored_name
+
+    def _add_reference(self, model, digest, name, size):
+        """Count one more reference to a blob and return its stored name."""
+        for _ in range(2):
+            if model.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1):
+                return model.objects.values_list('name', flat=True).get(pk=digest)
+            try:
+                with transaction.atomic():
+                    model.objects.create(sha256=digest, name=name, size=size, ref_count=1)
+                return name
+            except IntegrityError:
+                # Created concurrently, count the reference on the existing row
+                continue
+        raise IntegrityError(f"Could not reference stored file {digest}")
+
+    def delete(self, name):
+        """Drop one reference to a blob, removing the file with the last one."""
+        from .models import StoredFile
+
+        digest = self.content_hash(name)
+        if digest is None:
+            return super().delete(name)
+
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(pk=digest).first()
+            if stored is not None and stored.ref_count > 1:
+                StoredFile.objects.filter(pk=digest).update(ref_count=F('ref_count') - 1)
+                return
+            StoredFile.objects.filter(pk=digest).delete()
+            # Unlinked while the row is locked: a concurrent _save() of the same content
+            # waits on it, then creates a new row and writes the file again
+            super().delete(name)
+
+    def discard(self, name):
+        """Remove a blob left without a reference, e.g. by a rolled back save."""
+        from .models import StoredFile
+
+        digest = self.content_hash(name)
+        if digest is None:
+            return
+        with transaction.atomic():
+            if not StoredFile.objects.select_for_update().filter(pk=digest).exists():
+                super().delete(name)
+
+
+document_storage = ContentAddressedStorage()
+
+
+def get_document_storage():
+    return document_storage
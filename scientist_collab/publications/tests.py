@@ -1,12 +1,43 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Publication, Favorite
-from datetime import date
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from .models import Publication, Favorite, Keyword, SearchDocument, SearchPosting, DocumentText, DocumentPage, StoredFile, PublicationVector, RelatedPublication, PublicationTrend
+from .importers import iter_bibtex
+from .related import build_vectors, cosine_scores, nearest_neighbours
+from .search import search_publications
+from .storage import hash_name
+from config.reactions import load_viewer_state, toggle_reaction
+from notifications.models import Notification
+from config.trending import WEIGHTS, decay_all, decay_factor, record_event
+from datetime import date, timedelta
+from django.utils import timezone
+from io import StringIO
+from unittest.mock import patch
+import csv
+import hashlib
+import json
 import os
+import shutil
 import tempfile
 
+
+def make_publication(author, content=b"file content", filename="test_document.pdf", **fields):
+    """Create a publication with an uploaded document; fields override the defaults"""
+    fields = {'title': 'Test Publication', 'abstract': 'Abstract', 'publication_date': date.today(), **fields}
+    return Publication.objects.create(
+        author=author,
+        document=SimpleUploadedFile(filename, content, content_type="application/pdf"),
+        **fields
+    )
+
+
 class PublicationsModelTests(TestCase):
     """Tests for the publications app models"""
     
@@ -139,3 +170,1020 @@ class PublicationsViewTests(TestCase):
         
         # Check if the like was registered
         self.assertEqual(self.publication.likes.count(), 1)
+        self.assertEqual(self.publication.like_count, 1)
+    
+    def test_like_then_dislike_updates_counters(self):
+        """Check that toggling reactions keeps the stored counters in sync"""
+        self.client.force_login(self.user)
+        like_url = reverse('publications:like_publication', kwargs={'pk': self.publication.pk})
+        dislike_url = reverse('publications:dislike_publication', kwargs={'pk': self.publication.pk})
+        
+        response = self.client.post(like_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['total_likes'], 1)
+        
+        # Disliking removes the like
+        response = self.client.post(dislike_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        data = response.json()
+        self.assertTrue(data['disliked'])
+        self.assertEqual((data['total_likes'], data['total_dislikes']), (0, 1))
+        
+        # Disliking again removes the dislike
+        response = self.client.post(dislike_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertFalse(response.json()['disliked'])
+        
+        self.publication.refresh_from_db()
+        self.assertEqual((self.publication.like_count, self.publication.dislike_count), (0, 0))
+        self.assertEqual(self.publication.likes.count(), 0)
+        self.assertEqual(self.publication.dislikes.count(), 0)
+    
+    def test_concurrent_like_is_counted_once(self):
+        """Check that a like inserted by a concurrent toggle is neither an error nor counted twice"""
+        self.publication.likes.add(self.user)
+        Publication.objects.filter(pk=self.publication.pk).update(like_count=1)
+        
+        # Both toggles saw no row to delete, the other one inserted first
+        with patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            added = toggle_reaction(self.publication, self.user, 'likes', 'like_count', 'dislikes', 'dislike_count')
+        
+        self.assertIsNone(added)
+        self.publication.refresh_from_db()
+        self.assertEqual(self.publication.like_count, 1)
+        self.assertEqual(self.publication.likes.count(), 1)
+    
+    def test_concurrent_like_does_not_notify(self):
+        """Check that only the toggle which inserted the like notifies the author"""
+        other = User.objects.create_user(username='reader', password='testpassword123')
+        self.publication.likes.add(other)
+        self.client.force_login(other)
+        
+        with patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            response = self.client.post(
+                reverse('publications:like_publication', kwargs={'pk': self.publication.pk}),
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            )
+        
+        self.assertTrue(response.json()['liked'])
+        self.assertFalse(Notification.objects.filter(recipient=self.user).exists())
+    
+    def test_reconcile_reaction_counts_command(self):
+        """Check that the reconcile command repairs drifted counters"""
+        self.publication.likes.add(self.user)
+        Publication.objects.filter(pk=self.publication.pk).update(like_count=7, dislike_count=3)
+        
+        call_command('reconcile_reaction_counts', stdout=StringIO())
+        
+        self.publication.refresh_from_db()
+        self.assertEqual((self.publication.like_count, self.publication.dislike_count), (1, 0))
+
+class PublicationSearchTests(TestCase):
+    """Tests for the publication full-text search index"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        
+        self.laser = make_publication(
+            self.user,
+            title='Laser Effects on Plasma',
+            abstract='We measure how pulsed lasers heat a confined plasma.',
+            keywords='laser, plasma'
+        )
+        self.fusion = make_publication(
+            self.user,
+            title='Magnetic Confinement Fusion',
+            abstract='A review of tokamak designs. Lasers are mentioned briefly.',
+            keywords='fusion, tokamak'
+        )
+        self.graphs = make_publication(
+            self.user,
+            title='Undirected Graphs',
+            abstract='Quantitative properties of undirected graphs.',
+            keywords='graphs'
+        )
+    
+    def test_publications_are_indexed_on_save(self):
+        """Check that saving a publication creates its postings"""
+        self.assertTrue(SearchPosting.objects.filter(publication=self.laser, term='laser').exists())
+        self.assertTrue(SearchDocument.objects.filter(publication=self.laser).exists())
+    
+    def test_title_matches_rank_first(self):
+        """Check that a match in the title outranks a match in the abstract"""
+        results = list(search_publications('laser'))
+        self.assertEqual(results, [self.laser, self.fusion])
+    
+    def test_capped_postings_keep_document_frequency(self):
+        """Check that IDF uses the number of documents with a term, not the postings read"""
+        expected = {publication.pk: publication.search_score for publication in search_publications('laser')}
+        
+        with patch('publications.search.MAX_POSTINGS_PER_TERM', 1):
+            results = list(search_publications('laser'))
+        
+        self.assertEqual(results, [self.laser])
+        self.assertAlmostEqual(results[0].search_score, expected[self.laser.pk])
+    
+    def test_phrase_query(self):
+        """Check that phrase queries require adjacent words"""
+        self.assertEqual(list(search_publications('"undirected graphs"')), [self.graphs])
+        self.assertEqual(list(search_publications('"graphs undirected"')), [])
+    
+    def test_prefix_query(self):
+        """Check that prefix queries expand to indexed terms"""
+        self.assertEqual(list(search_publications('tokam*')), [self.fusion])
+    
+    def test_index_follows_updates_and_deletes(self):
+        """Check that the index is kept up to date by save and delete"""
+        self.graphs.title = 'Directed Acyclic Networks'
+        self.graphs.save()
+        self.assertEqual(list(search_publications('acyclic')), [self.graphs])
+        
+        self.graphs.delete()
+        self.assertEqual(list(search_publications('acyclic')), [])
+        self.assertFalse(SearchPosting.objects.filter(term='acyclic').exists())
+    
+    def test_list_view_search(self):
+        """Check that the publications list uses the ranked search"""
+        response = self.client.get(reverse('publications:list'), {'q': 'plasma'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['publications']), [self.laser])
+    
+    def test_list_view_filters_before_the_result_limit(self):
+        """Check that a tag filter applies to every match, not only the best ranked ones"""
+        with patch('publications.search.MAX_RESULTS', 1):
+            response = self.client.get(reverse('publications:list'), {'q': 'laser', 'tag': 'fusion'})
+        self.assertEqual(list(response.context['publications']), [self.fusion])
+    
+    def test_rebuild_search_index_command(self):
+        """Check that the rebuild command recreates the index"""
+        SearchPosting.objects.all().delete()
+        SearchDocument.objects.all().delete()
+        
+        call_command('rebuild_search_index', stdout=StringIO())
+        
+        self.assertEqual(SearchDocument.objects.count(), 3)
+        self.assertEqual(list(search_publications('fusion')), [self.fusion])
+
+
+class PublicationKeywordTests(TestCase):
+    """Tests for normalized keywords and tag filtering"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        self.fusion = make_publication(self.user, title='Fusion Reactors', keywords='Fusion, Plasma ,  tokamak')
+        self.plasma = make_publication(self.user, title='Plasma Physics', keywords='plasma, lasers')
+    
+    def test_keywords_are_normalized_on_save(self):
+        """Check that the keywords string is split into shared Keyword rows"""
+        self.assertEqual(self.fusion.get_keywords_list(), ['Fusion', 'Plasma', 'tokamak'])
+        self.assertEqual(Keyword.objects.filter(slug='plasma').count(), 1)
+        self.assertEqual(Keyword.objects.get(slug='plasma').publications.count(), 2)
+    
+    def test_keywords_keep_the_author_order(self):
+        """Check that keywords are listed in the order they were entered, from the prefetched tags"""
+        publication = make_publication(self.user, title='Tokamaks', keywords='tokamak, Fusion, active cooling')
+        self.assertEqual(publication.get_keywords_list(), ['tokamak', 'Fusion', 'active cooling'])
+        
+        publication = Publication.objects.prefetch_related('tags').get(pk=publication.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual([tag.slug for tag in publication.get_keywords()], ['tokamak', 'fusion', 'active-cooling'])
+            publication.get_keywords_list()
+    
+    def test_keywords_follow_updates(self):
+        """Check that editing the keywords string relinks the tags"""
+        self.plasma.keywords = 'optics'
+        self.plasma.save()
+        self.assertEqual(self.plasma.get_keywords_list(), ['optics'])
+        self.assertFalse(self.plasma.tags.filter(slug='lasers').exists())
+    
+    def test_tag_filter_and_facets(self):
+        """Check that ?tag= filters exactly and facets count the results"""
+        response = self.client.get(reverse('publications:list'), {'tag': 'tokamak'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['publications']), [self.fusion])
+        self.assertEqual(response.context['tag'].name, 'tokamak')
+        
+        facets = {facet['slug']: facet['count'] for facet in response.context['keyword_facets']}
+        self.assertEqual(facets, {'fusion': 1, 'plasma': 1, 'tokamak': 1})
+    
+    def test_top_keywords_cloud(self):
+        """Check that the unfiltered list shows the most used keywords first"""
+        response = self.client.get(reverse('publications:list'))
+        self.assertEqual(response.context['keyword_facets'][0]['slug'], 'plasma')
+        self.assertEqual(response.context['keyword_facets'][0]['count'], 2)
+
+
+class PublicationPaginationTests(TestCase):
+    """Tests for keyset pagination of the publications list"""
+    
+    def setUp(self):
+        """Setup test data"""
+        # The approximate total is cached between requests
+        cache.clear()
+        
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        # Two publications per day so the id breaks ties in the ordering
+        self.publications = [
+            Publication.objects.create(
+                title=f'Paper {i}',
+                abstract='Abstract',
+                author=self.user,
+                publication_date=date.today() - timedelta(days=i // 2),
+                document=SimpleUploadedFile("test_document.pdf", b"file content", content_type="application/pdf")
+            )
+            for i in range(25)
+        ]
+        self.expected = list(Publication.objects.order_by('-publication_date', '-id'))
+    
+    def test_walk_pages_forward_and_back(self):
+        """Check that next/previous cursors cover every publication exactly once"""
+        url = reverse('publications:list')
+        response = self.client.get(url)
+        page = response.context['page']
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page.approximate_total, 25)
+        
+        seen = list(response.context['publications'])
+        cursors = []
+        while page.has_next:
+            cursors.append(page.next_cursor)
+            response = self.client.get(url, {'cursor': page.next_cursor})
+            page = response.context['page']
+            seen.extend(response.context['publications'])
+        self.assertEqual(seen, self.expected)
+        
+        # Walking back from the last page returns the middle page again
+        response = self.client.get(url, {'cursor': page.previous_cursor})
+        self.assertEqual(list(response.context['publications']), self.expected[10:20])
+        self.assertTrue(response.context['page'].has_next)
+    
+    def test_page_queries_do_not_count(self):
+        """Check that deep pages run no COUNT(*) over the list"""
+        url = reverse('publications:list')
+        first = self.client.get(url).context['page']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'cursor': first.next_cursor})
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+    
+    def test_invalid_cursor(self):
+        """Check that a malformed cursor returns 404"""
+        response = self.client.get(reverse('publications:list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+def make_pdf(pages):
+    """Build a minimal PDF with one line of text per page"""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>']
+    kids = ' '.join(f'{3 + 2 * i} 0 R' for i in range(len(pages)))
+    objects.append(f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>')
+    font_id = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R '
+            f'/Resources << /Font << /F1 {font_id} 0 R >> >> >>'
+        )
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    
+    content = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(content)
+    content += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    content += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    content += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return content
+
+
+@override_settings(DOCUMENT_TEXT_EXTRACTION_ASYNC=False)
+class DocumentTextExtractionTests(TestCase):
+    """Tests for the PDF text extraction pipeline"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+    
+    def test_text_is_extracted_after_commit_and_searchable(self):
+        """Check that uploaded PDFs are extracted page by page and indexed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            publication = make_publication(self.user, make_pdf(['Spectroscopy of muons', 'Neutrino oscillations']))
+        
+        document_text = DocumentText.objects.get(publication=publication)
+        self.assertEqual(document_text.status, DocumentText.DONE)
+        self.assertEqual(document_text.page_count, 2)
+        self.assertEqual(
+            list(DocumentPage.objects.filter(publication=publication).values_list('text', flat=True)),
+            ['Spectroscopy of muons', 'Neutrino oscillations']
+        )
+        self.assertEqual(list(search_publications('neutrino')), [publication])
+    
+    def test_invalid_pdf_is_marked_failed(self):
+        """Check that unreadable documents are recorded as failed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            publication = make_publication(self.user)
+        
+        document_text = DocumentText.objects.get(publication=publication)
+        self.assertEqual(document_text.status, DocumentText.FAILED)
+        self.assertTrue(document_text.error)
+    
+    def test_backfill_command(self):
+        """Check that the backfill command processes documents without extracted text"""
+        publication = make_publication(self.user, make_pdf(['Quark gluon plasma']))
+        DocumentText.objects.all().delete()
+        
+        call_command('extract_document_text', stdout=StringIO())
+        
+        self.assertEqual(DocumentText.objects.get(publication=publication).status, DocumentText.DONE)
+        self.assertEqual(list(search_publications('gluon')), [publication])
+
+
+class PublicationDownloadTests(TestCase):
+    """Tests for the protected document download"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        self.content = bytes(range(256)) * 40
+        self.publication = Publication.objects.create(
+            title='Download Test',
+            abstract='Abstract',
+            author=self.user,
+            publication_date=date.today(),
+            document=SimpleUploadedFile("paper.pdf", self.content, content_type="application/pdf")
+        )
+        self.url = reverse('publications:download', kwargs={'pk': self.publication.pk})
+    
+    def test_download_requires_login(self):
+        """Check that anonymous users are redirected to the login page"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response.url)
+    
+    def test_full_download_is_streamed(self):
+        """Check that the whole document is streamed with validators"""
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+    
+    def test_range_request(self):
+        """Check that byte ranges are served with 206 Partial Content"""
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+    
+    def test_conditional_requests(self):
+        """Check ETag revalidation and If-Range with a stale validator"""
+        self.client.force_login(self.user)
+        etag = self.client.get(self.url)['ETag']
+        
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'private')
+        
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+    
+    @override_settings(DOCUMENT_DOWNLOAD_BACKEND='nginx', DOCUMENT_DOWNLOAD_INTERNAL_URL='/protected-media/')
+    def test_proxy_offload(self):
+        """Check that the transfer is handed to nginx after authorization"""
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.publication.document.name)
+        self.assertEqual(response.content, b'')
+
+
+class DocumentStorageTests(TestCase):
+    """Tests for the content-addressed document storage"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        self.content = b"%PDF-1.4 identical paper"
+        self.digest = hashlib.sha256(self.content).hexdigest()
+    
+    def test_files_are_stored_by_content_hash(self):
+        """Check that documents are stored under a sharded SHA-256 path"""
+        publication = make_publication(self.user, self.content)
+        
+        expected = f'publications/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.pdf'
+        self.assertEqual(publication.document.name, expected)
+        self.assertEqual(publication.document.storage.content_hash(expected), self.digest)
+        with publication.document.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+    
+    def test_identical_uploads_are_deduplicated(self):
+        """Check that identical files are stored once and reference counted"""
+        with self.captureOnCommitCallbacks(execute=True):
+            first = make_publication(self.user, self.content, "first.pdf")
+            second = make_publication(self.user, self.content, "second.pdf")
+        
+        self.assertEqual(first.document.name, second.document.name)
+        self.assertEqual(StoredFile.objects.get(pk=self.digest).ref_count, 2)
+        
+        storage = first.document.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredFile.objects.get(pk=self.digest).ref_count, 1)
+        self.assertTrue(storage.exists(second.document.name))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredFile.objects.filter(pk=self.digest).exists())
+        self.assertFalse(storage.exists(second.document.name))
+    
+    def test_save_rewrites_blob_removed_by_concurrent_delete(self):
+        """Check that saving known content writes the file even if a racing delete unlinked it"""
+        first = make_publication(self.user, self.content, "first.pdf")
+        storage = first.document.storage
+        os.remove(storage.path(first.document.name))
+        
+        second = make_publication(self.user, self.content, "second.pdf")
+        
+        self.assertEqual(StoredFile.objects.get(pk=self.digest).ref_count, 2)
+        with second.document.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+    
+    def test_replaced_document_is_released(self):
+        """Check that replacing a document drops the reference to the old file"""
+        publication = make_publication(self.user, self.content)
+        old_name = publication.document.name
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            publication.document = SimpleUploadedFile("v2.pdf", b"%PDF-1.4 revised", content_type="application/pdf")
+            publication.save()
+        
+        self.assertNotEqual(publication.document.name, old_name)
+        self.assertFalse(publication.document.storage.exists(old_name))
+        self.assertFalse(StoredFile.objects.filter(pk=self.digest).exists())
+    
+    def test_reuploaded_content_keeps_one_reference(self):
+        """Check that uploading the same bytes again doesn't leak a reference"""
+        publication = make_publication(self.user, self.content)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            publication.document = SimpleUploadedFile("again.pdf", self.content, content_type="application/pdf")
+            publication.save()
+        
+        self.assertEqual(StoredFile.objects.get(pk=self.digest).ref_count, 1)
+        self.assertTrue(publication.document.storage.exists(publication.document.name))
+    
+    def test_failed_save_leaves_no_reference(self):
+        """Check that a publication failing to save neither keeps a reference nor an unreferenced file"""
+        storage = Publication._meta.get_field('document').storage
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(IntegrityError):
+                make_publication(None, self.content)
+        self.assertFalse(StoredFile.objects.filter(pk=self.digest).exists())
+        self.assertFalse(storage.exists(hash_name('publications', self.digest, '.pdf')))
+        
+        # A blob other publications reference is kept
+        publication = make_publication(self.user, self.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(IntegrityError):
+                make_publication(None, self.content)
+        self.assertEqual(StoredFile.objects.get(pk=self.digest).ref_count, 1)
+        self.assertTrue(storage.exists(publication.document.name))
+    
+    def test_download_uses_content_hash_etag(self):
+        """Check that downloads use the content hash as a strong ETag"""
+        publication = make_publication(self.user, self.content, title='Shared Paper')
+        self.client.force_login(self.user)
+        
+        response = self.client.get(reverse('publications:download', kwargs={'pk': publication.pk}))
+        
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+        self.assertIn('shared-paper.pdf', response['Content-Disposition'])
+    
+    def test_dedupe_documents_command(self):
+        """Check that legacy documents are moved into content-addressed storage"""
+        publication = make_publication(self.user, self.content)
+        storage = publication.document.storage
+        storage.delete(publication.document.name)
+        legacy_name = FileSystemStorage(location=storage.location).save('publications/legacy.pdf', ContentFile(self.content))
+        Publication.objects.filter(pk=publication.pk).update(document=legacy_name)
+        
+        call_command('dedupe_documents', stdout=StringIO())
+        
+        publication.refresh_from_db()
+        self.assertEqual(storage.content_hash(publication.document.name), self.digest)
+        self.assertFalse(storage.exists(legacy_name))
+
+
+class RelatedPublicationTests(TestCase):
+    """Tests for the related publications recommender"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        self.laser = make_publication(
+            self.user, title='Laser cooling of atoms',
+            abstract='Laser cooling traps cold atoms with optical molasses', keywords='laser, atoms'
+        )
+        self.laser_2 = make_publication(
+            self.user, title='Optical molasses for laser cooling',
+            abstract='Doppler laser cooling of atoms in optical molasses', keywords='laser, optics'
+        )
+        self.protein = make_publication(
+            self.user, title='Protein folding kinetics',
+            abstract='Folding pathways of small proteins measured by fluorescence', keywords='biology'
+        )
+    
+    def related_ids(self, publication):
+        return list(
+            RelatedPublication.objects.filter(publication=publication)
+            .order_by('-score').values_list('related_id', flat=True)
+        )
+    
+    def test_new_publications_are_linked_incrementally(self):
+        """Check that similar publications are linked both ways when created"""
+        self.assertEqual(self.related_ids(self.laser_2), [self.laser.pk])
+        self.assertEqual(self.related_ids(self.laser), [self.laser_2.pk])
+        self.assertEqual(self.related_ids(self.protein), [])
+        self.assertTrue(PublicationVector.objects.filter(publication=self.protein).exists())
+    
+    def test_rebuild_command(self):
+        """Check that the rebuild command recomputes every recommendation"""
+        RelatedPublication.objects.all().delete()
+        PublicationVector.objects.all().delete()
+        
+        call_command('rebuild_related_publications', stdout=StringIO())
+        
+        self.assertEqual(PublicationVector.objects.count(), 3)
+        self.assertEqual(self.related_ids(self.laser), [self.laser_2.pk])
+        self.assertEqual(self.related_ids(self.laser_2), [self.laser.pk])
+        self.assertEqual(self.related_ids(self.protein), [])
+    
+    def test_batched_neighbours_match_pairwise_scores(self):
+        """Check that batched scoring agrees with scoring vectors one by one"""
+        vectors = build_vectors(Publication.objects.order_by('pk'))
+        neighbours = dict(nearest_neighbours(vectors, k=5, min_score=0.0))
+        
+        for index, publication_id in enumerate(vectors.ids):
+            features = vectors.features[vectors.ptr[index]:vectors.ptr[index + 1]]
+            weights = vectors.weights[vectors.ptr[index]:vectors.ptr[index + 1]]
+            scores = cosine_scores(features, weights, vectors)
+            expected = {
+                int(other_id): score for other_id, score in zip(vectors.ids, scores)
+                if other_id != publication_id and score > 0
+            }
+            self.assertEqual({related_id for related_id, _ in neighbours[int(publication_id)]}, set(expected))
+            for related_id, score in neighbours[int(publication_id)]:
+                self.assertAlmostEqual(score, expected[related_id], places=5)
+    
+    def test_detail_view_shows_related_publications(self):
+        """Check that the detail page lists the precomputed recommendations"""
+        response = self.client.get(reverse('publications:detail', kwargs={'pk': self.laser.pk}))
+        
+        self.assertEqual(response.context['related_publications'], [self.laser_2])
+        self.assertContains(response, 'Optical molasses for laser cooling')
+
+
+class ViewerStateTests(TestCase):
+    """Tests for the per-viewer reaction state of list and detail pages"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        self.publications = [make_publication(self.user, title=f'Paper {i}') for i in range(3)]
+        self.publications[0].likes.add(self.user)
+        self.publications[1].dislikes.add(self.user)
+        Favorite.objects.create(user=self.user, publication=self.publications[1])
+        self.client.force_login(self.user)
+    
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+    
+    def test_load_viewer_state(self):
+        """Check that the loader returns the reacted ids in one query per relation"""
+        ids = [publication.pk for publication in self.publications]
+        with self.assertNumQueries(3):
+            state = load_viewer_state(self.user, Publication, ids, favorites=(Favorite, 'publication'))
+        
+        self.assertEqual(state.liked, {ids[0]})
+        self.assertEqual(state.disliked, {ids[1]})
+        self.assertEqual(state.favorited, {ids[1]})
+    
+    def test_anonymous_viewer_costs_no_query(self):
+        """Check that anonymous viewers get an empty state without queries"""
+        with self.assertNumQueries(0):
+            state = load_viewer_state(AnonymousUser(), Publication, [self.publications[0].pk])
+        self.assertEqual(state.liked, set())
+    
+    def test_list_pages_use_constant_queries(self):
+        """Check that per-user state does not add queries per listed publication"""
+        for url in (reverse('publications:list'), reverse('publications:favorites_list'), reverse('home')):
+            few, _ = self.count_queries(url)
+            extra = [make_publication(self.user, title=f'Extra {i}') for i in range(5)]
+            for publication in extra:
+                publication.likes.add(self.user)
+                Favorite.objects.create(user=self.user, publication=publication)
+            many, response = self.count_queries(url)
+            self.assertEqual(few, many, url)
+            Publication.objects.filter(pk__in=[publication.pk for publication in extra]).delete()
+        
+        _, response = self.count_queries(reverse('publications:list'))
+        states = {p.pk: (p.viewer_liked, p.viewer_disliked, p.viewer_favorited) for p in response.context['publications']}
+        self.assertEqual(states[self.publications[0].pk], (True, False, False))
+        self.assertEqual(states[self.publications[1].pk], (False, True, True))
+    
+    def test_detail_view_state(self):
+        """Check the liked, disliked and favorited flags of the detail page"""
+        response = self.client.get(reverse('publications:detail', kwargs={'pk': self.publications[1].pk}))
+        
+        self.assertFalse(response.context['is_liked'])
+        self.assertTrue(response.context['is_disliked'])
+        self.assertTrue(response.context['is_favorited'])
+
+
+BIBTEX_SAMPLE = r"""
+@comment{Exported from a reference manager}
+@article{curie1898,
+  author = {Curie, Marie and Pierre Curie and Becquerel, Henri},
+  title = {On a New Radioactive Substance Contained in {Pitchblende}},
+  abstract = "Radioactivity of pitchblende and the discovery of polonium",
+  keywords = {radioactivity, polonium},
+  year = 1898,
+  month = jul,
+  file = {Full Text:curie1898.pdf:PDF}
+}
+
+@inproceedings{schrodinger1926,
+  author = {Schr{\"o}dinger, Erwin},
+  title = {Quantisierung als Eigenwertproblem},
+  year = {1926}
+}
+
+@article{missing_year,
+  author = {Curie, Marie},
+  title = {Undated}
+}
+"""
+
+
+class PublicationImportTests(TestCase):
+    """Tests for the import_publications command"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.marie = User.objects.create_user(
+            username='mcurie',
+            email='marie@example.com',
+            password='testpassword123',
+            first_name='Marie',
+            last_name='Curie'
+        )
+        self.librarian = User.objects.create_user(
+            username='librarian',
+            email='librarian@example.com',
+            password='testpassword123'
+        )
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+    
+    def write(self, name, content, mode='w'):
+        path = os.path.join(self.directory, name)
+        with open(path, mode) as file:
+            file.write(content)
+        return path
+    
+    def test_bibtex_import(self):
+        """Check that BibTeX entries are imported, mapped to users and indexed"""
+        path = self.write('library.bib', BIBTEX_SAMPLE)
+        self.write('curie1898.pdf', b'%PDF-1.4 polonium', mode='wb')
+        out = StringIO()
+        
+        call_command('import_publications', path, '--pdf-dir', self.directory, '--author', 'librarian', '--batch-size', '1', stdout=out)
+        
+        curie = Publication.objects.get(title='On a New Radioactive Substance Contained in Pitchblende')
+        self.assertEqual(curie.author, self.marie)
+        self.assertEqual(curie.co_authors, 'Pierre Curie, Henri Becquerel')
+        self.assertEqual(curie.publication_date, date(1898, 7, 1))
+        self.assertEqual(sorted(curie.tags.values_list('slug', flat=True)), ['polonium', 'radioactivity'])
+        self.assertTrue(curie.document.name.startswith('publications/'))
+        self.assertEqual(DocumentText.objects.get(publication=curie).status, DocumentText.PENDING)
+        self.assertEqual(list(search_publications('polonium')), [curie])
+        self.assertEqual(PublicationTrend.objects.get(publication=curie).score, WEIGHTS['create'])
+        
+        schrodinger = Publication.objects.get(title='Quantisierung als Eigenwertproblem')
+        self.assertEqual(schrodinger.author, self.librarian)
+        self.assertEqual(schrodinger.co_authors, 'Erwin Schrödinger')
+        self.assertFalse(schrodinger.document)
+        
+        self.assertEqual(Publication.objects.count(), 2)
+        self.assertIn('1 errors', out.getvalue())
+        
+        # Importing again skips the existing records
+        call_command('import_publications', path, '--author', 'librarian', stdout=StringIO())
+        self.assertEqual(Publication.objects.count(), 2)
+    
+    def test_failed_batch_leaves_no_files(self):
+        """Check that the PDFs of a batch that fails to save are removed with it"""
+        path = self.write('library.bib', BIBTEX_SAMPLE)
+        self.write('curie1898.pdf', b'%PDF-1.4 polonium', mode='wb')
+        storage = Publication._meta.get_field('document').storage
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            with patch('publications.search.bulk_index_publications', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    call_command('import_publications', path, '--pdf-dir', self.directory, '--author', 'librarian', stdout=StringIO())
+        
+        digest = hashlib.sha256(b'%PDF-1.4 polonium').hexdigest()
+        self.assertFalse(Publication.objects.exists())
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(storage.exists(hash_name('publications', digest, '.pdf')))
+    
+    def test_jsonl_import_and_dry_run(self):
+        """Check JSONL parsing, unknown authors and the dry-run mode"""
+        path = self.write('library.jsonl', '\n'.join([
+            json.dumps({'title': 'Polonium', 'abstract': 'A', 'authors': ['marie@example.com'], 'keywords': ['chemistry'], 'publication_date': '1898-07-18'}),
+            json.dumps({'title': 'Unknown author', 'authors': 'Nobody Known', 'year': 1900}),
+            'not json',
+        ]))
+        
+        call_command('import_publications', path, '--dry-run', stdout=StringIO())
+        self.assertFalse(Publication.objects.exists())
+        
+        out = StringIO()
+        call_command('import_publications', path, stdout=out)
+        
+        publication = Publication.objects.get()
+        self.assertEqual(publication.title, 'Polonium')
+        self.assertEqual(publication.author, self.marie)
+        self.assertEqual(publication.get_keywords_list(), ['chemistry'])
+        self.assertIn('2 errors', out.getvalue())
+    
+    def test_import_updates_related_publications(self):
+        """Check that imported publications get vectors and appear in the related lists"""
+        existing = Publication.objects.create(
+            title='Polonium chemistry', abstract='Radioactive polonium salts', author=self.marie,
+            publication_date=date(1900, 1, 1), keywords='polonium, radioactivity',
+        )
+        path = self.write('library.bib', BIBTEX_SAMPLE)
+        call_command('import_publications', path, '--author', 'librarian', stdout=StringIO())
+        
+        curie = Publication.objects.get(title='On a New Radioactive Substance Contained in Pitchblende')
+        self.assertTrue(PublicationVector.objects.filter(publication=curie).exists())
+        self.assertTrue(RelatedPublication.objects.filter(publication=existing, related=curie).exists())
+        self.assertTrue(RelatedPublication.objects.filter(publication=curie, related=existing).exists())
+    
+    def test_import_counts_badge_metrics(self):
+        """Check that imported publications count toward their authors' badges"""
+        from accounts.models import Badge, UserBadge
+        
+        badge = Badge.objects.create(name='Author', description='', requirement_type='publications_count', requirement_count=2)
+        path = self.write('library.bib', BIBTEX_SAMPLE)
+        call_command('import_publications', path, '--author', 'librarian', stdout=StringIO())
+        
+        self.marie.metrics.refresh_from_db()
+        self.assertEqual(self.marie.metrics.publications, 1)
+        self.assertEqual(UserBadge.objects.get(user=self.marie, badge=badge).progress, 50)
+
+
+class PublicationExportTests(TestCase):
+    """Tests for the catalog export endpoint and command"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='mcurie',
+            email='marie@example.com',
+            password='testpassword123',
+            first_name='Marie',
+            last_name='Curie'
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='testpassword123'
+        )
+        fields = {'abstract': 'Abstract, with "quotes"', 'co_authors': 'Pierre Curie'}
+        self.old = make_publication(
+            self.user, title='Radioactive {substances}', publication_date=date(1898, 7, 1), keywords='radioactivity', **fields
+        )
+        self.new = make_publication(
+            self.user, title='Polonium & radium', publication_date=date(1903, 6, 1), keywords='chemistry', **fields
+        )
+        make_publication(self.other, title='Unrelated', publication_date=date(1950, 1, 1), keywords='biology', **fields)
+        self.client.force_login(self.other)
+    
+    def get_export(self, **params):
+        response = self.client.get(reverse('publications:export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+    
+    def test_csv_export_with_filters(self):
+        """Check the CSV export filtered by author and date range"""
+        content = self.get_export(format='csv', author='mcurie', to='1900-01-01')
+        rows = list(csv.DictReader(StringIO(content)))
+        
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Radioactive {substances}')
+        self.assertEqual(rows[0]['author'], 'Marie Curie')
+        self.assertEqual(rows[0]['abstract'], 'Abstract, with "quotes"')
+        self.assertTrue(rows[0]['url'].endswith(self.old.get_absolute_url()))
+    
+    def test_csv_export_neutralizes_formulas(self):
+        """Check that CSV cells starting like a spreadsheet formula are quoted"""
+        self.new.title = '=HYPERLINK("http://example.com")'
+        self.new.co_authors = '@Pierre Curie'
+        self.new.save()
+        
+        rows = list(csv.DictReader(StringIO(self.get_export(format='csv', tag='chemistry'))))
+        
+        self.assertEqual(rows[0]['title'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(rows[0]['co_authors'], "'@Pierre Curie")
+        self.assertEqual(rows[0]['like_count'], '0')
+    
+    def test_export_requires_login(self):
+        """Check that anonymous users are sent to the login page"""
+        self.client.logout()
+        response = self.client.get(reverse('publications:export'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response.url)
+    
+    def test_jsonl_export_by_keyword(self):
+        """Check the JSONL export filtered by keyword"""
+        content = self.get_export(format='jsonl', tag='chemistry')
+        records = [json.loads(line) for line in content.splitlines()]
+        
+        self.assertEqual([record['id'] for record in records], [self.new.pk])
+        self.assertEqual(records[0]['publication_date'], '1903-06-01')
+    
+    def test_bibtex_export_round_trips_through_import(self):
+        """Check that exported BibTeX can be parsed back by the importer"""
+        content = self.get_export(format='bibtex', author='mcurie')
+        records = [record for _, record in iter_bibtex(StringIO(content))]
+        
+        self.assertEqual([record['title'] for record in records], ['Radioactive {substances}', 'Polonium & radium'])
+        self.assertEqual(records[0]['authors'], ['Marie Curie', 'Pierre Curie'])
+        self.assertEqual(records[1]['year'], '1903')
+    
+    def test_invalid_parameters(self):
+        """Check that unknown formats and bad dates are rejected"""
+        self.assertEqual(self.client.get(reverse('publications:export'), {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('publications:export'), {'from': 'yesterday'}).status_code, 400)
+    
+    def test_export_command_is_chunked(self):
+        """Check that the command walks the catalog in chunks"""
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('export_publications', '--format', 'jsonl', '--chunk-size', '2', stdout=out)
+        
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        self.assertEqual(len(queries), 2)
+
+
+@override_settings(TRENDING_HALF_LIFE_HOURS=10)
+class TrendingScoreTests(TestCase):
+    """Tests for the time-decayed trending scores of publications"""
+    
+    def setUp(self):
+        """Setup test data"""
+        self.user = User.objects.create_user(
+            username='researcher',
+            email='researcher@example.com',
+            password='testpassword123'
+        )
+        self.publications = [make_publication(self.user, title=f'Paper {i}') for i in range(3)]
+        self.client.force_login(self.user)
+    
+    def score(self, publication):
+        return PublicationTrend.objects.get(publication=publication).score
+    
+    def test_new_publication_starts_trending(self):
+        """Check that creating a publication creates its trend row"""
+        self.assertAlmostEqual(self.score(self.publications[0]), WEIGHTS['create'])
+    
+    def test_events_decay_before_adding(self):
+        """Check that the stored score is decayed to the event time before adding"""
+        trend = PublicationTrend.objects.get(publication=self.publications[0])
+        later = trend.decayed_at + timedelta(hours=10)
+        record_event(PublicationTrend, trend.pk, 1.0, now=later)
+        
+        trend.refresh_from_db()
+        self.assertAlmostEqual(trend.score, WEIGHTS['create'] / 2 + 1.0)
+        self.assertEqual(trend.decayed_at, later)
+        self.assertAlmostEqual(decay_factor(later - timedelta(hours=20), later), 0.25)
+    
+    def test_reactions_update_score(self):
+        """Check that likes and favorites add to the score and undoing them takes it back"""
+        publication = self.publications[0]
+        base = self.score(publication)
+        
+        self.client.post(reverse('publications:like_publication', kwargs={'pk': publication.pk}))
+        self.assertAlmostEqual(self.score(publication), base + WEIGHTS['like'], places=3)
+        
+        # A dislike removes the like
+        self.client.post(reverse('publications:dislike_publication', kwargs={'pk': publication.pk}))
+        self.assertAlmostEqual(self.score(publication), base, places=3)
+        
+        self.client.post(reverse('publications:favorite_publication', kwargs={'pk': publication.pk}))
+        self.assertAlmostEqual(self.score(publication), base + WEIGHTS['favorite'], places=3)
+        self.client.post(reverse('publications:unfavorite_publication', kwargs={'pk': publication.pk}))
+        self.assertAlmostEqual(self.score(publication), base, places=3)
+    
+    def test_decay_command(self):
+        """Check that the batch decay scales every row and drops faded ones"""
+        now = timezone.now()
+        PublicationTrend.objects.filter(publication=self.publications[0]).update(
+            score=8.0, decayed_at=now - timedelta(hours=10)
+        )
+        PublicationTrend.objects.filter(publication=self.publications[1]).update(
+            score=0.015, decayed_at=now - timedelta(hours=10)
+        )
+        
+        decayed, deleted = decay_all(PublicationTrend, batch_size=2, now=now)
+        
+        self.assertEqual((decayed, deleted), (2, 1))
+        self.assertAlmostEqual(self.score(self.publications[0]), 4.0)
+        self.assertFalse(PublicationTrend.objects.filter(publication=self.publications[1]).exists())
+        self.assertEqual(PublicationTrend.objects.filter(decayed_at=now).count(), 2)
+    
+    def test_rebuild_command(self):
+        """Check that --rebuild recomputes scores from stored reactions"""
+        Publication.objects.filter(pk=self.publications[2].pk).update(like_count=3)
+        PublicationTrend.objects.all().delete()
+        
+        call_command('decay_trending_scores', '--rebuild', stdout=StringIO())
+        
+        self.assertEqual(PublicationTrend.objects.count(), 3)
+        self.assertAlmostEqual(self.score(self.publications[2]), WEIGHTS['create'] + 3 * WEIGHTS['like'], places=3)
+    
+    def test_trending_sort(self):
+        """Check that ?sort=trending walks the publications by score, ties broken by id"""
+        cache.clear()
+        self.publications += [make_publication(self.user, title=f'Paper {i}') for i in range(3, 12)]
+        scored = [(i // 2, publication.pk) for i, publication in enumerate(self.publications)]
+        for score, pk in scored:
+            PublicationTrend.objects.filter(publication_id=pk).update(score=score)
+        expected = [pk for _, pk in sorted(scored, reverse=True)]
+        
+        url = reverse('publications:list')
+        response = self.client.get(url, {'sort': 'trending'})
+        seen = [p.pk for p in response.context['publications']]
+        cursor = response.context['page'].next_cursor
+        self.assertIsNotNone(cursor)
+        response = self.client.get(url, {'sort': 'trending', 'cursor': cursor})
+        seen += [p.pk for p in response.context['publications']]
+        
+        self.assertEqual(seen, expected)
+        self.assertIsNone(response.context['page'].next_cursor)
@@ -16,4 +16,5 @@ urlpatterns = [
     path('<int:pk>/favorite/', views.favorite_publication, name='favorite_publication'),
     path('<int:pk>/unfavorite/', views.unfavorite_publication, name='unfavorite_publication'),
     path('favorites/', views.favorite_publications_list, name='favorites_list'),
+    path('export/', views.export_publications, name='export'),
 ] 
\ No newline at end of file
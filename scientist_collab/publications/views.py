@@ -1,43 +1,89 @@
+import os
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-from django.http import JsonResponse
-from .models import Publication, Favorite
+from django.utils.text import slugify
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from .models import Publication, PublicationTrend, Favorite, Keyword
 from .forms import PublicationForm
+from .keywords import get_top_keywords, keyword_facets
+from .related import get_related_publications
+from .exporters import EXPORT_FORMATS, ExportError, export_publications as export_catalog, filter_publications
+from .search import search_publications, SearchResults
+from config.pagination import KeysetPaginationMixin, KeysetPaginator
+from config.downloads import serve_file
 
 # Import notification utilities
 from notifications.utils import create_notification
 from notifications.models import Notification
+from config.reactions import toggle_reaction, load_viewer_state, annotate_viewer_state
+from config.trending import record_reaction
 
 # Create your views here.
 
-class PublicationListView(ListView):
+class PublicationListView(KeysetPaginationMixin, ListView):
     model = Publication
     template_name = 'publications/publication_list.html'
     context_object_name = 'publications'
-    paginate_by = 10
+    keyset_ordering = ('-publication_date', '-id')
+    keyset_page_size = 10
+    keyset_with_total = True
+    # ?sort=trending, walks the pub_trend_score_idx index of PublicationTrend
+    trending_ordering = ('-score', '-publication_id')
     
     def get_queryset(self):
-        queryset = super().get_queryset()
-        # Implement search functionality
-        query = self.request.GET.get('q')
+        queryset = super().get_queryset().select_related('author').prefetch_related('tags')
+        # Exact tag filtering through the keyword index
+        tag = self.request.GET.get('tag')
+        if tag:
+            queryset = queryset.filter(tags__slug=tag)
+        # Ranked full-text search over the inverted index
+        query = self.request.GET.get('q', '').strip()
         if query:
-            queryset = queryset.filter(
-                title__icontains=query
-            ) | queryset.filter(
-                abstract__icontains=query
-            ) | queryset.filter(
-                keywords__icontains=query
-            )
+            return search_publications(query, queryset)
         return queryset
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
+        
+        # Keyset pagination: no OFFSET and no COUNT(*) per page
+        sort = self.request.GET.get('sort', '')
+        if sort == 'trending' and not isinstance(self.object_list, SearchResults):
+            page = self.paginate_trending(self.object_list)
+        else:
+            page = self.paginate_keyset(self.object_list)
+        context['sort'] = sort
+        context['page'] = page
+        context['publications'] = page.object_list
+        context['is_paginated'] = page.has_other_pages
+        annotate_viewer_state(self.request.user, page.object_list, favorites=(Favorite, 'publication'))
+        
+        tag = self.request.GET.get('tag')
+        context['tag'] = Keyword.objects.filter(slug=tag).first() if tag else None
+        
+        # Facet counts over the current results, or the cached keyword cloud
+        if isinstance(self.object_list, SearchResults):
+            context['keyword_facets'] = keyword_facets([pk for pk, _ in self.object_list.ranked])
+        elif tag:
+            context['keyword_facets'] = keyword_facets(self.object_list)
+        else:
+            context['keyword_facets'] = get_top_keywords()
         return context
+    
+    def paginate_trending(self, queryset):
+        """Paginate the publications of queryset by trending score."""
+        trends = PublicationTrend.objects.select_related('publication__author').prefetch_related('publication__tags')
+        if queryset.query.where:
+            trends = trends.filter(publication__in=queryset.values('pk'))
+        paginator = KeysetPaginator(self.trending_ordering, self.keyset_page_size, self.keyset_with_total)
+        page = paginator.paginate(trends, self.request.GET.get(self.keyset_cursor_param))
+        page.object_list = [trend.publication for trend in page.object_list]
+        return page
 
 class MyPublicationListView(LoginRequiredMixin, ListView):
     model = Publication
@@ -49,22 +95,23 @@ class MyPublicationListView(LoginRequiredMixin, ListView):
 
 class PublicationDetailView(DetailView):
     model = Publication
+    queryset = Publication.objects.select_related('author')
     template_name = 'publications/publication_detail.html'
     context_object_name = 'publication'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        publication = self.get_object()
+        publication = self.object
         
-        # Check if user liked or disliked this publication
-        if self.request.user.is_authenticated:
-            context['is_liked'] = publication.likes.filter(id=self.request.user.id).exists()
-            context['is_disliked'] = publication.dislikes.filter(id=self.request.user.id).exists()
-            context['is_favorited'] = Favorite.objects.filter(
-                user=self.request.user, 
-                publication=publication
-            ).exists()
+        # Check if user liked, disliked or favorited this publication
+        state = load_viewer_state(
+            self.request.user, Publication, [publication.pk], favorites=(Favorite, 'publication')
+        )
+        context['is_liked'] = publication.pk in state.liked
+        context['is_disliked'] = publication.pk in state.disliked
+        context['is_favorited'] = publication.pk in state.favorited
         
+        context['related_publications'] = get_related_publications(publication)
         return context
 
 class PublicationCreateView(LoginRequiredMixin, CreateView):
@@ -109,28 +156,34 @@ class PublicationDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView)
 
 @login_required
 def download_publication(request, pk):
-    publication = get_object_or_404(Publication, pk=pk)
-    response = redirect(publication.document.url)
-    return response
+    publication = get_object_or_404(Publication.objects.only('pk', 'title', 'document'), pk=pk)
+    if not publication.document:
+        raise Http404("This publication has no document.")
+    # Stored names are content hashes, name the download after the publication
+    extension = os.path.splitext(publication.document.name)[1]
+    filename = (slugify(publication.title) or 'publication') + extension
+    try:
+        return serve_file(request, publication.document, filename=filename)
+    except FileNotFoundError:
+        raise Http404("Document not found.")
 
 @login_required
 def like_publication(request, pk):
-    publication = get_object_or_404(Publication, pk=pk)
+    publication = get_object_or_404(Publication.objects.select_related('author'), pk=pk)
     
-    # Remove dislike if exists when liking
-    if publication.dislikes.filter(id=request.user.id).exists():
-        publication.dislikes.remove(request.user)
+    like_count = publication.like_count
     
-    # Check if the user already liked this publication
-    if publication.likes.filter(id=request.user.id).exists():
-        # Unlike
-        publication.likes.remove(request.user)
-        liked = False
-    else:
-        # Like
-        publication.likes.add(request.user)
-        liked = True
-        
+    # Toggle the like (removing any dislike) and update the stored counters
+    liked = toggle_reaction(
+        publication, request.user, 'likes', 'like_count',
+        opposite='dislikes', opposite_counter='dislike_count'
+    )
+    
+    # Likes gained or lost count towards the trending score
+    record_reaction(PublicationTrend, publication.pk, publication.like_count - like_count)
+    
+    # Only a real insert notifies: None means a concurrent toggle already added it
+    if liked:
         # Create a notification for the publication author
         create_notification(
             recipient=publication.author, 
@@ -143,9 +196,9 @@ def like_publication(request, pk):
     if request.method in ['POST', 'GET'] and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'status': 'success',
-            'liked': liked,
-            'total_likes': publication.total_likes(),
-            'total_dislikes': publication.total_dislikes()
+            'liked': liked is not False,
+            'total_likes': publication.like_count,
+            'total_dislikes': publication.dislike_count
         })
     
     # Redirect to publication detail page
@@ -153,22 +206,21 @@ def like_publication(request, pk):
 
 @login_required
 def dislike_publication(request, pk):
-    publication = get_object_or_404(Publication, pk=pk)
+    publication = get_object_or_404(Publication.objects.select_related('author'), pk=pk)
     
-    # Remove like if exists when disliking
-    if publication.likes.filter(id=request.user.id).exists():
-        publication.likes.remove(request.user)
+    like_count = publication.like_count
     
-    # Check if the user already disliked this publication
-    if publication.dislikes.filter(id=request.user.id).exists():
-        # Undislike
-        publication.dislikes.remove(request.user)
-        disliked = False
-    else:
-        # Dislike
-        publication.dislikes.add(request.user)
-        disliked = True
-        
+    # Toggle the dislike (removing any like) and update the stored counters
+    disliked = toggle_reaction(
+        publication, request.user, 'dislikes', 'dislike_count',
+        opposite='likes', opposite_counter='like_count'
+    )
+    
+    # Likes gained or lost count towards the trending score
+    record_reaction(PublicationTrend, publication.pk, publication.like_count - like_count)
+    
+    # Only a real insert notifies: None means a concurrent toggle already added it
+    if disliked:
         # Create a notification for the publication author
         create_notification(
             recipient=publication.author, 
@@ -181,9 +233,9 @@ def dislike_publication(request, pk):
     if request.method in ['POST', 'GET'] and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'status': 'success',
-            'disliked': disliked,
-            'total_likes': publication.total_likes(),
-            'total_dislikes': publication.total_dislikes()
+            'disliked': disliked is not False,
+            'total_likes': publication.like_count,
+            'total_dislikes': publication.dislike_count
         })
     
     # Redirect to publication detail page
@@ -246,8 +298,9 @@ def unfavorite_publication(request, pk):
 
 @login_required
 def favorite_publications_list(request):
-    favorites = Favorite.objects.filter(user=request.user).select_related('publication')
+    favorites = Favorite.objects.filter(user=request.user).select_related('publication__author')
     publications = [favorite.publication for favorite in favorites]
+    annotate_viewer_state(request.user, publications)
     
     context = {
         'publications': publications,
@@ -255,3 +308,28 @@ def favorite_publications_list(request):
     }
     
     return render(request, 'publications/favorites_list.html', context)
+
+@login_required
+def export_publications(request):
+    """Stream the catalog as CSV, JSONL or BibTeX, optionally filtered."""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unknown export format.")
+    try:
+        publications = filter_publications(
+            Publication.objects.all(),
+            author=request.GET.get('author'),
+            keyword=request.GET.get('tag'),
+            date_from=request.GET.get('from'),
+            date_to=request.GET.get('to'),
+        )
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+    
+    content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        export_catalog(publications, export_format, base_url=request.build_absolute_uri('/')[:-1]),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="publications.{extension}"'
+    return response
@@ -8,8 +8,8 @@
 document.addEventListener('DOMContentLoaded', function() {
     console.log('[DEBUG] Simplified post parser loaded');
     
-    // Process all posts
-    setTimeout(processPosts, 800);
+    // Process all posts (the visualizer scripts are loaded before this event)
+    processPosts();
     
     // Process content when dynamic content is loaded
     document.addEventListener('content-loaded', processPosts);
@@ -31,6 +31,13 @@ function processPosts() {
             return;
         }
         
+        // Posts rendered on the server (see discussions.shortcodes) already contain their containers
+        if (post.querySelector('.visualizer-container')) {
+            post.setAttribute('data-viz-processed', 'true');
+            initializeVisualizers(post);
+            return;
+        }
+        
         console.log(`Processing post ${index}`);
         const content = post.innerHTML;
         
@@ -622,7 +629,7 @@ function initializeMolecularChainVisualizer(container, id, config) {
                 updateStatusIndicator(container, 'Ready', true);
             } else {
                 // Load the molecular chain visualizer script - use the existing file that we transformed
-                loadScript('/static/js/visualizers/dna/dna_visualizer.js?v=' + Date.now(), () => {
+                loadScript('/static/js/visualizers/dna/dna_visualizer.js', () => {
                     if (typeof window.initMolecularEnergyChainVisualizer === 'function') {
                         window.initMolecularEnergyChainVisualizer(id, config);
                         updateStatusIndicator(container, 'Ready', true);
@@ -644,7 +651,7 @@ function initializeMolecularChainVisualizer(container, id, config) {
                 updateStatusIndicator(container, 'Ready', true);
             } else {
                 // Load the visualizer script
-                loadScript('/static/js/visualizers/dna/dna_visualizer.js?v=' + Date.now(), () => {
+                loadScript('/static/js/visualizers/dna/dna_visualizer.js', () => {
                     if (typeof window.initMolecularEnergyChainVisualizer === 'function') {
                         window.initMolecularEnergyChainVisualizer(id, {
                             ...config,